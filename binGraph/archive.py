@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+
+"""
+Archive input (--archives)
+-------------------------------------------
+Zip, tar (plain, gzip, bzip2 or xz compressed) and gzip files are graphed member by member, without extracting
+anything to disk. A member is named by the archive's path and the member's path joined with "!/", nested archives
+add another "!/" for each level:
+
+/samples/batch.zip!/dropper.exe
+/samples/batch.zip!/stage2.tar.gz!/payload.dll
+
+Members are read into memory when their graphs are generated, so each is limited in size. The members of a batch
+are read in a single pass over each archive (see read_members) and handed to the graph modules as they are read. Archives nested deeper
+than the depth limit are graphed as they are, rather than opened.
+"""
+
+from __future__ import absolute_import
+import os
+import io
+import gzip
+import zlib
+import functools
+import tarfile
+import zipfile
+
+import logging
+
+log = logging.getLogger("binGraph.archive")
+
+__separator__ = "!/"  # Joins an archive's path and the path of a member
+__archive_limit__ = 256 * 1024 * 1024  # Default largest member read into memory, in bytes
+__archive_depth__ = 2  # Default number of archive levels opened: an archive, and the archives in it
+__head_size__ = 512  # Bytes read from the start of a member to recognise an archive
+
+# # Errors from reading broken, truncated or encrypted archives
+__read_errors__ = (zipfile.BadZipFile, tarfile.TarError, zlib.error, EOFError, OSError, RuntimeError, NotImplementedError)
+
+
+class ArchiveError(Exception):
+    pass
+
+
+# # The archive type from the first bytes of a file: "zip", "tar" (possibly compressed, or a lone gzip) or None
+def archive_kind(head):
+
+    if head.startswith((b"PK\x03\x04", b"PK\x05\x06")):
+        return "zip"
+
+    if head[257:262] == b"ustar" or head.startswith((b"\x1f\x8b", b"BZh", b"\xfd7zXZ\x00")):
+        return "tar"
+
+    return None
+
+
+class archive(object):
+    """The members of a zip, tar or gzip file, read from a seekable file object"""
+
+    def __init__(self, fileobj, name, kind):
+        super(archive, self).__init__()
+        self.name = name
+        self.kind = kind
+        self.__fileobj = fileobj
+
+        if kind == "zip":
+            self.__archive = zipfile.ZipFile(fileobj)
+            return
+
+        try:
+            self.__archive = tarfile.open(fileobj=fileobj, mode="r:*")
+        except tarfile.ReadError:
+            # # A compressed file that is not a tar, only gzip is a container of its own
+            fileobj.seek(0)
+            if not fileobj.read(2) == b"\x1f\x8b":
+                raise ArchiveError('Not a tar or gzip file: "{}"'.format(name))
+
+            self.kind = "gzip"
+            self.__archive = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+
+        if self.__archive is not None:
+            self.__archive.close()
+
+    # # (name, size) of every file in the archive. The size of the content of a gzip file is not known until read
+    def members(self):
+
+        if self.kind == "zip":
+            for info in self.__archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size
+
+        elif self.kind == "tar":
+            for member in self.__archive.getmembers():
+                if member.isfile():
+                    yield member.name, member.size
+
+        else:
+            yield gzip_member_name(self.name), None
+
+    # # (name, opener) of every file in the archive, in the order they are stored. Calling opener gives a file object
+    # # of the member's content. Members are reached by reading the archive once from the start to the end, so a
+    # # compressed tar is decompressed only once however many of its members are read
+    def contents(self):
+
+        if self.kind == "zip":
+            for info in self.__archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, functools.partial(self.__archive.open, info)
+
+        elif self.kind == "tar":
+            for member in self.__archive:
+                if member.isfile():
+                    yield member.name, functools.partial(self.__archive.extractfile, member)
+
+        else:
+            yield gzip_member_name(self.name), functools.partial(self.open, None)
+
+    # # A file object of the content of a member
+    def open(self, name):
+
+        if self.kind == "zip":
+            return self.__archive.open(name)
+        elif self.kind == "tar":
+            return self.__archive.extractfile(name)
+
+        self.__fileobj.seek(0)
+        return gzip.GzipFile(fileobj=self.__fileobj, mode="rb")
+
+
+# # The name of the file in a gzip file: the gzip file's name less .gz
+def gzip_member_name(name):
+
+    base = os.path.basename(name)
+    root, ext = os.path.splitext(base)
+
+    return root if ext.lower() in (".gz", ".gzip") and root else base
+
+
+# # A file object's archive type, from its first bytes
+def sniff(fileobj):
+
+    fileobj.seek(0)
+    head = fileobj.read(__head_size__)
+    fileobj.seek(0)
+
+    return archive_kind(head)
+
+
+# # Read all of a file object, unless it is larger than limit bytes
+def read_limited(fh, limit, name):
+
+    data = fh.read(limit + 1)
+    if len(data) > limit:
+        raise ArchiveError('Larger than the {} byte limit: "{}"'.format(limit, name))
+
+    return data
+
+
+# # The path of the file on disk and the member names inside it, of a member path
+def split_member(member_path):
+
+    parts = member_path.split(__separator__)
+    return parts[0], parts[1:]
+
+
+# # The member paths of an archive on disk, nested archives are replaced by their members. None if the file is not
+# # an archive (or can not be read as one)
+def find_members(abs_fpath, limit=__archive_limit__, depth=__archive_depth__):
+
+    with open(abs_fpath, "rb") as fh:
+        return list_members(fh, abs_fpath, abs_fpath, limit, depth)
+
+
+def list_members(fileobj, name, member_path, limit, depth):
+
+    kind = sniff(fileobj)
+    if kind is None or not depth > 0:
+        return None
+
+    try:
+        container = archive(fileobj, name, kind)
+    except (ArchiveError,) + __read_errors__ as e:
+        log.warning('Not opened as an archive, "{}": {}'.format(member_path, e))
+        return None
+
+    found = []
+    with container:
+        for member_name, size in container.members():
+            path = member_path + __separator__ + member_name
+
+            if __separator__ in member_name:
+                log.warning('Skipping member, "{}" in its name: "{}"'.format(__separator__, path))
+                continue
+
+            if size == 0:
+                log.debug('Skipping empty member: "{}"'.format(path))
+                continue
+
+            if size is not None and size > limit:
+                log.warning('Skipping member larger than the {} byte limit: "{}"'.format(limit, path))
+                continue
+
+            # # Nested archives are read into memory and replaced by their members
+            if depth > 1:
+                try:
+                    with container.open(member_name) as fh:
+                        nested = archive_kind(fh.read(__head_size__))
+                    if nested:
+                        with container.open(member_name) as fh:
+                            data = read_limited(fh, limit, path)
+                        members = list_members(io.BytesIO(data), member_name, path, limit, depth - 1)
+                        if members is not None:
+                            found += members
+                            continue
+
+                except (ArchiveError,) + __read_errors__ as e:
+                    log.warning('Skipping unreadable member, "{}": {}'.format(path, e))
+                    continue
+
+            found.append(path)
+
+    log.debug('Found {} members in "{}"'.format(len(found), member_path))
+    return found
+
+
+# # The content of an archive member, read through every archive it is nested in
+def read_member(member_path, limit=__archive_limit__):
+
+    abs_fpath, names = split_member(member_path)
+
+    data = None
+    with open(abs_fpath, "rb") as fileobj:
+        name = abs_fpath
+        for member_name in names:
+            kind = sniff(fileobj)
+            if kind is None:
+                raise ArchiveError('Not an archive: "{}"'.format(name))
+
+            with archive(fileobj, name, kind) as container, container.open(member_name) as fh:
+                data = read_limited(fh, limit, member_name)
+
+            fileobj, name = io.BytesIO(data), member_name
+
+    return data
+
+
+# # The content of the wanted member paths of an archive on disk, read in a single pass over it and each archive
+# # nested in it. Yields (member_path, data) in the order the members are stored. Members that can not be read (too
+# # large, broken, or after the archive turns out to be truncated) are not yielded
+def read_members(abs_fpath, wanted, limit=__archive_limit__):
+
+    wanted = set(wanted)
+
+    # # The nested archives holding wanted members, which have to be read to reach them
+    nested = set()
+    for member_path in wanted:
+        parts = member_path.split(__separator__)
+        for level in range(2, len(parts)):
+            nested.add(__separator__.join(parts[:level]))
+
+    with open(abs_fpath, "rb") as fileobj:
+        for found in walk_members(fileobj, abs_fpath, abs_fpath, wanted, nested, limit):
+            yield found
+
+
+def walk_members(fileobj, name, member_path, wanted, nested, limit):
+
+    kind = sniff(fileobj)
+    if kind is None:
+        return
+
+    try:
+        container = archive(fileobj, name, kind)
+    except (ArchiveError,) + __read_errors__ as e:
+        log.warning('Not opened as an archive, "{}": {}'.format(member_path, e))
+        return
+
+    with container:
+        contents = container.contents()
+        while True:
+            try:
+                member_name, opener = next(contents)
+            except StopIteration:
+                break
+            except __read_errors__ as e:
+                log.warning('Stopped reading archive, "{}": {}'.format(member_path, e))
+                break
+
+            path = member_path + __separator__ + member_name
+            if not (path in wanted or path in nested):
+                continue
+
+            try:
+                with opener() as fh:
+                    data = read_limited(fh, limit, path)
+            except (ArchiveError,) + __read_errors__ as e:
+                log.warning('Skipping unreadable member, "{}": {}'.format(path, e))
+                continue
+
+            if path in wanted:
+                yield path, data
+            else:
+                for found in walk_members(io.BytesIO(data), member_name, path, wanted, nested, limit):
+                    yield found
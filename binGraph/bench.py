@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks
+-------------------------------------------
+Run as `binGraph bench' or `python -m binGraph.bench'. Results are printed (or saved with --out) as json so runs can
+be compared.
+
+startup:        Time taken by fresh interpreters to import binGraph, show the command line help, and import each graph
+                module (the cost paid on first use of a graph type)
+stages:         Time taken by each stage (read, parse, entropy, ibytes, hist, render, save) of each graph type, over a
+                synthetic corpus (--kinds, --sizes). The corpus is generated from fixed seeds, so it is the same on
+                every run and machine, and kept in --corpus-dir to be reused by later runs
+
+Corpus kinds:
+zeros:          All 0x00
+random:         Uniformly random bytes (compressed or encrypted data)
+text:           ASCII words, spaces and newlines
+packed:         A PE with a small code section and a large random one, like a packed executable
+pe:             A PE with many sections of code, text, zeros and random data
+"""
+
+from __future__ import absolute_import
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import zlib
+import struct
+import tempfile
+import subprocess
+import numpy as np
+
+import logging
+
+log = logging.getLogger("binGraph.bench")
+
+__repeat__ = 5  # Times each benchmark is run
+__kinds__ = ["zeros", "random", "text", "packed", "pe"]  # Kinds of sample in the corpus
+__sizes__ = ["4K", "1M", "16M"]  # Sizes of sample in the corpus
+__pe_sections__ = 32  # Number of sections in "pe" samples (fewer if the sample is too small)
+__block__ = 1 << 24  # Corpus samples are written this many bytes at a time
+
+
+# # Time a command run in a fresh interpreter
+def time_command(cmd, repeat=__repeat__):
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] + sys.path)
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env, check=True)
+        times.append(time.perf_counter() - start)
+
+    return {"min": min(times), "median": statistics.median(times), "runs": repeat}
+
+
+def bench_startup(repeat=__repeat__, **kwargs):
+
+    from binGraph.binGraph import graphs
+
+    commands = {
+        "import": [sys.executable, "-c", "import binGraph.binGraph"],
+        "help": [sys.executable, "-m", "binGraph", "--help"],
+    }
+    for name in graphs:
+        commands["import_graph_{}".format(name)] = [sys.executable, "-c", "import binGraph.graphs.{}.graph".format(name)]
+
+    results = {}
+    for name, cmd in commands.items():
+        results[name] = time_command(cmd, repeat=repeat)
+        log.info("{}: {:.3f}s".format(name, results[name]["median"]))
+
+    return results
+
+
+# ### Synthetic corpus
+
+# # "16M" -> 16777216
+def parse_size(size):
+
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    size = str(size).upper().rstrip("B")
+    if size[-1:] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+# # Blocks of n bytes of filler of the given kind
+def fill(kind, n, rand):
+
+    while n > 0:
+        block = min(n, __block__)
+        n -= block
+
+        if kind == "zeros":
+            yield bytes(block)
+
+        elif kind == "random":
+            yield rand.bytes(block)
+
+        elif kind == "text":
+            alphabet = np.frombuffer(b"etaoinshrdlucmfwypvbgkqjxz  \n   ETAOIN,.", dtype=np.uint8)
+            yield alphabet[rand.randint(0, len(alphabet), block)].tobytes()
+
+        elif kind == "code":
+            # # Small values (opcodes, registers, short offsets) are much more common than large ones in machine code
+            yield np.minimum(rand.exponential(24, block), 255).astype(np.uint8).tobytes()
+
+        else:
+            raise ValueError("Unknown filler: {}".format(kind))
+
+
+# # A minimal valid PE32+ image of about size bytes: headers, then sections of the given (name, kind, weight), with
+# # the raw size of each section in proportion to its weight
+def write_pe(outfile, size, sections, rand):
+
+    file_align, section_align = 0x200, 0x1000
+    align = lambda value, to: -(-value // to) * to
+
+    # # Drop sections until there is room for them all
+    headers_size = lambda sections: align(0x80 + 4 + 20 + 240 + 40 * len(sections), file_align)
+    while len(sections) > 1 and headers_size(sections) + file_align * len(sections) > size:
+        sections = sections[: len(sections) // 2]
+
+    headers = headers_size(sections)
+    body = max(size - headers, file_align * len(sections))
+
+    weights = np.array([weight for _, _, weight in sections], dtype=np.float64)
+    raw_sizes = [max(file_align, int(raw) // file_align * file_align) for raw in body * weights / weights.sum()]
+
+    table = b""
+    offset, rva = headers, section_align
+    for (name, kind, _), raw_size in zip(sections, raw_sizes):
+        characteristics = 0x60000020 if kind == "code" else 0xC0000040
+        table += struct.pack(
+            "<8sIIIIIIHHI", name.encode()[:8], raw_size, rva, raw_size, offset, 0, 0, 0, 0, characteristics
+        )
+        offset += raw_size
+        rva += align(raw_size, section_align)
+
+    optional = struct.pack(
+        "<HBBIIIIIQIIHHHHHHIIIIHHQQQQII",
+        0x20B,  # PE32+
+        14, 0,  # Linker version
+        sum(raw for (_, kind, _), raw in zip(sections, raw_sizes) if kind == "code"),
+        0, 0,  # Size of (un)initialised data
+        section_align,  # Entry point, the start of the first section
+        section_align,  # Base of code
+        0x140000000,  # Image base
+        section_align,
+        file_align,
+        6, 0, 0, 0, 6, 0,  # OS, image and subsystem versions
+        0,
+        rva,  # Size of image
+        headers,
+        0,  # Checksum
+        3,  # Console subsystem
+        0x8160,  # DLL characteristics
+        0x100000, 0x1000, 0x100000, 0x1000,  # Stack and heap
+        0,
+        16,  # Number of data directories, all empty
+    ) + bytes(16 * 8)
+
+    coff = struct.pack("<HHIIIHH", 0x8664, len(sections), 0, 0, 0, len(optional), 0x22)
+    dos = b"MZ" + bytes(0x3A) + struct.pack("<I", 0x80) + bytes(0x40)
+
+    header = dos + b"PE\0\0" + coff + optional + table
+    outfile.write(header + bytes(headers - len(header)))
+
+    for (_, kind, _), raw_size in zip(sections, raw_sizes):
+        for block in fill(kind, raw_size, rand):
+            outfile.write(block)
+
+
+# # Write a sample of the given kind and size. Every sample has its own seed, so samples do not depend on each other
+def write_sample(abs_fpath, kind, size):
+
+    rand = np.random.RandomState(zlib.crc32("{}-{}".format(kind, size).encode()))
+
+    with open(abs_fpath, "wb") as outfile:
+        if kind in ("zeros", "random", "text"):
+            for block in fill(kind, size, rand):
+                outfile.write(block)
+
+        elif kind == "packed":
+            write_pe(outfile, size, [("UPX0", "code", 1), ("UPX1", "random", 14), (".rsrc", "text", 1)], rand)
+
+        elif kind == "pe":
+            fillers = ["code", "text", "zeros", "random"]
+            sections = [(".sect{:d}".format(i), fillers[i % len(fillers)], 1 + i % 3) for i in range(__pe_sections__)]
+            write_pe(outfile, size, sections, rand)
+
+        else:
+            raise ValueError("Unknown sample kind: {}".format(kind))
+
+
+# # The corpus samples, written to corpus_dir if they are not there already
+def get_corpus(corpus_dir, kinds=__kinds__, sizes=__sizes__):
+
+    samples = []
+    for kind in kinds:
+        for size in sizes:
+            abs_fpath = os.path.join(corpus_dir, "{}-{}.bin".format(kind, size))
+            if not os.path.isfile(abs_fpath):
+                log.info("Generating sample: {}".format(abs_fpath))
+                write_sample(abs_fpath, kind, parse_size(size))
+            samples.append((kind, size, abs_fpath))
+
+    return samples
+
+
+# ### Stages
+
+# # Run fn repeat times, each time after setup(). Returns the timing and the last result
+def time_stage(fn, setup=None, repeat=__repeat__):
+
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+
+    return {"min": min(times), "median": statistics.median(times), "runs": repeat}, result
+
+
+# # Map a file and read every page of it
+def read_file(abs_fpath):
+
+    from binGraph.context import bin_context
+
+    bin_ctx = bin_context(abs_fpath)
+    int(bin_ctx.data[::4096].sum())
+
+    return bin_ctx
+
+
+# # Time the stages of every graph type on one sample. Each stage works from a fresh read of the file, so nothing
+# # is shared with (or cached from) an earlier stage
+def bench_sample(abs_fpath, graphtypes, args_dict, save_dir, repeat=__repeat__):
+
+    from binGraph import binGraph as bg
+    from binGraph.graphs.ent.graph import shannon_ent_chunks
+
+    chunks = args_dict["chunks"]
+    fresh = lambda: (read_file(abs_fpath),)
+
+    results = {}
+    results["read"], _ = time_stage(read_file, setup=lambda: (abs_fpath,), repeat=repeat)
+    results["parse"], _ = time_stage(lambda bin_ctx: bin_ctx.get_bin_proxy(), setup=fresh, repeat=repeat)
+    results["entropy"], _ = time_stage(
+        lambda bin_ctx: shannon_ent_chunks(*bin_ctx.chunk_histograms(chunks)), setup=fresh, repeat=repeat
+    )
+
+    hists, sizes = read_file(abs_fpath).chunk_histograms(chunks)
+    results["ibytes"], _ = time_stage(lambda: (hists @ args_dict["ibytes_matrix"]) / sizes[:, None] * 100, repeat=repeat)
+    results["hist"], _ = time_stage(lambda bin_ctx: bin_ctx.histogram(), setup=fresh, repeat=repeat)
+
+    # # Drawing and saving each graph type, from its profile
+    for module_name in graphtypes:
+        module = bg.graphs[module_name]
+        graph_args = dict(args_dict, abs_fpath=abs_fpath, fname=os.path.basename(abs_fpath))
+        graph_args["cleaned_fname"] = bg.clean_fname(graph_args["fname"])
+
+        results["analyse_" + module_name], profile = time_stage(
+            lambda bin_ctx: module.analyse(bin_ctx=bin_ctx, **graph_args), setup=fresh, repeat=repeat
+        )
+        results["render_" + module_name], (image, _) = time_stage(
+            lambda: bg.render_graph(module, profile, graph_args), repeat=repeat
+        )
+
+        abs_save_fpath = os.path.join(save_dir, "{}.{}".format(module_name, graph_args["format"]))
+
+        def save():
+            with open(abs_save_fpath, "wb") as outfile:
+                outfile.write(image)
+
+        results["save_" + module_name], _ = time_stage(save, repeat=repeat)
+
+    return results
+
+
+# # The graph types without a raster() to draw them with --renderer raster
+def no_raster(graphtypes):
+
+    from binGraph.binGraph import graphs
+
+    return [name for name in graphtypes if not hasattr(graphs[name], "raster")]
+
+
+def bench_stages(repeat=__repeat__, kinds=__kinds__, sizes=__sizes__, corpus_dir=None, graphtypes=None, renderer="matplotlib", **kwargs):
+
+    from binGraph import binGraph as bg
+
+    graphtypes = graphtypes or list(bg.graphs)
+
+    # # As on the command line, every graph type benchmarked must have a raster path
+    missing = no_raster(graphtypes) if renderer == "raster" else []
+    if missing:
+        raise ValueError("Graphs that can not be drawn with --renderer raster: {}".format(", ".join(missing)))
+
+    # # The default options of every graph type, as the command line would give them. The shared entropy and ibytes
+    # # stages use the ent options, whichever graph types are benchmarked
+    args = bg.build_parser().parse_args(["--file", os.devnull, "--renderer", renderer, "-", "all"])
+    args.files = []
+    for module_name in ["ent"] + [name for name in graphtypes if not name == "ent"]:
+        bg.graphs[module_name].args_validation(args)
+    args_dict = args.__dict__
+
+    corpus_dir = corpus_dir or os.path.join(tempfile.gettempdir(), "binGraph-corpus")
+    if not os.path.isdir(corpus_dir):
+        os.makedirs(corpus_dir)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as save_dir:
+        for kind, size, abs_fpath in get_corpus(corpus_dir, kinds, sizes):
+            name = "{}-{}".format(kind, size)
+            results[name] = bench_sample(abs_fpath, graphtypes, args_dict, save_dir, repeat=repeat)
+            log.info(
+                "{}: {}".format(name, ", ".join("{} {:.4f}s".format(stage, t["median"]) for stage, t in results[name].items()))
+            )
+
+    return results
+
+
+__benchmarks__ = {"startup": bench_startup, "stages": bench_stages}
+
+
+def main(argv=None):
+
+    from binGraph.binGraph import graphs, __version__
+
+    parser = argparse.ArgumentParser(prog="binGraph bench", description="Benchmark binGraph")
+    parser.add_argument(
+        "benchmarks", nargs="*", metavar="benchmark", help="Benchmarks to run, defaults to all: {}".format(", ".join(__benchmarks__))
+    )
+    parser.add_argument("--repeat", type=int, default=__repeat__, metavar=__repeat__, help="Times each benchmark is run")
+    parser.add_argument("--out", type=str, default=None, metavar="bench.json", help="Save the results to this file")
+    parser.add_argument(
+        "--kinds", type=str, nargs="+", default=__kinds__, choices=__kinds__, metavar="kind", help="Kinds of sample: {}".format(", ".join(__kinds__))
+    )
+    parser.add_argument(
+        "--sizes", type=str, nargs="+", default=__sizes__, metavar="16M", help="Sizes of sample, in bytes or with a K, M or G suffix"
+    )
+    parser.add_argument(
+        "--corpus-dir",
+        type=str,
+        dest="corpus_dir",
+        default=None,
+        metavar="/tmp/binGraph-corpus/",
+        help="Where the corpus is generated, and reused from by later runs",
+    )
+    parser.add_argument(
+        "--graphs", type=str, dest="graphtypes", nargs="+", default=None, choices=list(graphs), metavar="graph", help="Graph types to benchmark, defaults to all"
+    )
+    parser.add_argument(
+        "--renderer", type=str, default="matplotlib", choices=["matplotlib", "raster"], help="Renderer to time the render stage with"
+    )
+    args = parser.parse_args(argv)
+
+    for name in args.benchmarks:
+        if not name in __benchmarks__:
+            parser.error("unknown benchmark: {}".format(name))
+
+    for size in args.sizes:
+        try:
+            parse_size(size)
+        except ValueError:
+            parser.error("invalid size: {}".format(size))
+
+    if args.renderer == "raster":
+        missing = no_raster(args.graphtypes or list(graphs))
+        if missing:
+            parser.error("can not be drawn with --renderer raster: {}".format(", ".join(missing)))
+
+    logging.basicConfig(stream=sys.stderr, format="%(name)s | %(levelname)s | %(message)s")
+
+    import matplotlib
+
+    results = {
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "matplotlib": matplotlib.__version__,
+        "binGraph": __version__["digit"],
+    }
+    for name in args.benchmarks or __benchmarks__:
+        results[name] = __benchmarks__[name](
+            repeat=args.repeat,
+            kinds=args.kinds,
+            sizes=args.sizes,
+            corpus_dir=args.corpus_dir,
+            graphtypes=args.graphtypes,
+            renderer=args.renderer,
+        )
+
+    if args.out:
+        with open(args.out, "w") as outfile:
+            json.dump(results, outfile, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,10 +11,17 @@ import io
 import base64
 import json
 import datetime
+import time
+import importlib
+import contextlib
+import collections
+import concurrent.futures
+
+from binGraph.timing import stage
 
 __version__ = {}
 __version__["codename"] = "Iron Airedale"  # http://www.codenamegenerator.com/?prefix=metal&dictionary=dogs
-__version__["digit"] = 3.3
+__version__["digit"] = 3.4
 __version__["run_date"] = datetime.datetime.now().isoformat()
 
 
@@ -25,6 +32,18 @@ __figdpi__ = 100  # DPI of figure
 __json__ = False  # Show the plot interactively
 __showplt__ = False  # Show the plot interactively
 __blob__ = False  # Treat all files as binary blobs. Disable intelligently parsing of file format specific features.
+__jobs__ = 1  # Number of processes to generate graphs with
+__cache_size__ = 1024  # Default maximum size of the --cache-dir in MiB
+__renderer__ = "matplotlib"  # Draw graphs with matplotlib, or "raster" for thumbnails drawn without it
+__archive_limit__ = 256  # Default largest archive member graphed with --archives, in MiB
+__archive_depth__ = 2  # Archive levels opened with --archives, e.g. in its help: an archive, and the archives in it
+__member_separator__ = "!/"  # Joins an archive's path and a member's path, as binGraph.archive names members
+__retries__ = 0  # Times a failed graph is tried again
+__retry_backoff__ = 1.0  # Seconds before the first retry of a failed graph, doubled for each retry after
+__data_format__ = "npz"  # Format of the --data-only numbers, or "jsonl"
+
+# # The global options that change a saved graph, whatever its type (see graph_params)
+__output_args__ = ["save_dir", "prefix", "json", "graphtitle", "format", "figsize", "dpi", "blob", "renderer", "data_only", "data_format"]
 
 # ## Logging
 # # Lower the matplotlib logger
@@ -52,8 +71,8 @@ def File2Strings(filename):
 
 
 # # Gather files to process - give it a list of paths (files or directories)
-# # and it will return all files in a list
-def find_files(search_paths, recurse):
+# # and it will return all files in a list. With archive_depth, archives are replaced by their members
+def find_files(search_paths, recurse, archive_depth=0, archive_limit=__archive_limit__):
 
     __files__ = []
     for f in search_paths:
@@ -68,12 +87,17 @@ def find_files(search_paths, recurse):
 
                     if os.path.isfile(abs_fpath) and not os.path.islink(abs_fpath) and not os.stat(abs_fpath).st_size == 0:
                         log.info('File found: "{}"'.format(abs_fpath))
-                        __files__.append(abs_fpath)
+                        __files__ += expand_archive(abs_fpath, archive_depth, archive_limit)
 
         elif os.path.isfile(f) and not os.path.islink(f) and not os.stat(f).st_size == 0:
             abs_fpath = os.path.abspath(f)
             log.debug('Found file: "{}"'.format(abs_fpath))
-            __files__.append(abs_fpath)
+            __files__ += expand_archive(abs_fpath, archive_depth, archive_limit)
+
+        elif is_member(f):
+            # # A single archive member, e.g. "samples.zip!/malware.exe"
+            log.debug('Found archive member: "{}"'.format(f))
+            __files__.append(os.path.abspath(f))
 
         else:
             log.critical('Not a file, skipping: "{}"'.format(f))
@@ -82,6 +106,29 @@ def find_files(search_paths, recurse):
     return __files__
 
 
+# # Is the path a member of an archive on disk (e.g. "samples.zip!/malware.exe"), rather than a file? Told from the
+# # path alone, so the archive modules are only imported to read archives
+def is_member(path):
+
+    on_disk = path.split(__member_separator__)[0]
+    return not on_disk == path and os.path.isfile(on_disk) and not os.path.exists(path)
+
+
+# # The members of an archive in place of the archive, if looking into archives
+def expand_archive(abs_fpath, archive_depth, archive_limit):
+
+    if archive_depth > 0:
+        # # Imported here as it pulls in tarfile, zipfile, gzip etc.
+        from binGraph.archive import find_members
+
+        members = find_members(abs_fpath, limit=archive_limit * 1024 * 1024, depth=archive_depth)
+        if members is not None:
+            log.info('Archive found: "{}", {} members'.format(abs_fpath, len(members)))
+            return members
+
+    return [abs_fpath]
+
+
 # # Cleanup given filename
 def clean_fname(fn):
 
@@ -116,34 +163,68 @@ def gen_names(ffrmt, abs_fpath, abs_save_path, save_prefix=None, graphtype=None,
     return abs_save_fpath, os.path.basename(abs_fpath), cleaned_fname
 
 
-# # Dynamically import graphtypes
-def get_graph_modules():
+# # A graph type. The graph package (binGraph/graphs/<name>/__init__.py) declares the graph's arguments without
+# # importing anything heavy. The graph module (graph.py), and with it matplotlib, numpy etc., is only imported when
+# # something other than args_setup is first used, e.g. args_validation or generate
+class graph_plugin(object):
+    """Lazily imported graph module"""
 
-    graphs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "graphs")
-    graph_individuals = [x[0] for x in os.walk(graphs_dir)][1:]
+    def __init__(self, name, package):
+        super(graph_plugin, self).__init__()
+        self.name = name
+        self.package = package
+        self.__module = None
+        self.__option_names = None
 
-    modules = {}
+    def args_setup(self, arg_parser):
 
-    for graph in graph_individuals:
+        return self.package.args_setup(arg_parser)
 
-        for importer, package_name, _ in pkgutil.iter_modules([graph]):
+    # # The names (argparse dests) of the graph's own options
+    @property
+    def option_names(self):
 
-            if sys.version_info[0] < 3:
-                full_package_name = "{}".format(os.path.basename(graph))
-            else:
-                full_package_name = "{}.graph".format(os.path.basename(graph), package_name)
+        if self.__option_names is None:
+            parser = argparse.ArgumentParser(add_help=False)
+            self.package.args_setup(parser)
+            self.__option_names = [action.dest for action in parser._actions]
 
-            if not (full_package_name in sys.modules):
+        return self.__option_names
 
-                if sys.version_info[0] < 3:
-                    module = importer.find_module("graph", graph)
-                else:
-                    module = importer.find_module(full_package_name)
+    @property
+    def module(self):
+
+        if self.__module is None:
+            log.debug("Importing graph: {}".format(self.name))
+            self.__module = importlib.import_module("{}.graph".format(self.package.__name__))
+
+        return self.__module
+
+    def __getattr__(self, name):
+
+        # # Only called for attributes not found on the plugin itself
+        if name.startswith("_graph_plugin__"):
+            raise AttributeError(name)
+
+        return getattr(self.module, name)
+
+
+# # Find the graph types - every package under binGraph/graphs/ that declares args_setup
+def get_graph_modules():
+
+    graphs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "graphs")
+
+    modules = {}
+
+    for _, package_name, is_package in pkgutil.iter_modules([graphs_dir]):
+
+        if not is_package:
+            continue
 
-                if module:
-                    module = module.load_module(full_package_name)
+        package = importlib.import_module("{}.graphs.{}".format(__package__ or "binGraph", package_name))
 
-                modules[os.path.basename(graph)] = module
+        if hasattr(package, "args_setup"):
+            modules[package_name] = graph_plugin(package_name, package)
 
     return modules
 
@@ -195,72 +276,572 @@ def generate_graphs(args_dict):
     # # Detect if all graphs are being requested
     __graphtypes__ = []
     if args_dict["graphtype"] == "all":
-        __graphtypes__ = graphs
+        __graphtypes__ = list(graphs.keys())
     else:
-        __graphtypes__ = {args_dict["graphtype"]: graphs[args_dict["graphtype"]]}
+        __graphtypes__ = [args_dict["graphtype"]]
+
+    log.debug("Generating graphs: {}".format(", ".join(__graphtypes__)))
+
+    # # Work out how many processes to spread the files over
+    jobs = args_dict.get("jobs", __jobs__) or os.cpu_count() or 1
+    if jobs > 1 and args_dict["showplt"]:
+        log.warning("Graphs can not be shown interactively from multiple processes, using one process")
+        jobs = 1
+
+    # # Jobs already done in an earlier run, from its manifest
+    manifest = None
+    if args_dict.get("manifest"):
+        from binGraph.manifest import job_manifest
 
-    log.debug("Generating graphs: {}".format(", ".join(list(__graphtypes__.keys()))))
+        manifest = job_manifest(args_dict["manifest"])
 
-    # # Iterate over all given files
+    # # Iterate over all given files. Failed graphs being resumed carry on from the attempts already made, so --retries
+    # # caps the attempts over every run rather than each
+    work = []
+    skipped = 0
+    exhausted = 0
+    retries = args_dict.get("retries", __retries__)
     for index, abs_fpath in enumerate(args_dict["files"]):
-        log.debug('Processing: "{}"'.format(abs_fpath))
+        findex = index if len(args_dict["files"]) > 1 else None
+
+        graphtypes = __graphtypes__
+        attempts = {}
+        if manifest and args_dict.get("resume"):
+            graphtypes = []
+            for name in __graphtypes__:
+                key = job_key(abs_fpath, name, args_dict)
+                if manifest.done(key):
+                    skipped += 1
+                elif manifest.attempts(key) > retries:
+                    exhausted += 1
+                else:
+                    graphtypes.append(name)
+                    attempts[name] = manifest.attempts(key)
+
+        if graphtypes:
+            work.append((findex, abs_fpath, graphtypes, attempts))
+
+    if skipped:
+        log.info("Resuming: skipping {} graphs already done".format(skipped))
+    if exhausted:
+        log.warning("Resuming: skipping {} failed graphs already tried {} times (see --retries)".format(exhausted, retries + 1))
+
+    jobs = max(min(jobs, len(work)), 1)
+
+    failures = []
+    timings = []
+    if jobs > 1:
+        log.debug("Generating with {} processes".format(jobs))
+
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=init_worker, initargs=(args_dict.get("verbose", False),)
+        ) as executor:
+
+            def collect(future, abs_fpath, graphtypes, attempts):
+                try:
+                    file_failures, file_timings = future.result()
+                    failures.extend(file_failures)
+                    timings.extend(file_timings)
+                except Exception as e:
+                    # # The worker itself died, e.g. killed for using too much memory
+                    log.error('Failed to generate graphs for "{}": {}'.format(abs_fpath, e))
+                    failures.extend((abs_fpath, graphtype, str(e)) for graphtype in graphtypes)
+                    for graphtype in graphtypes:
+                        record_result(abs_fpath, graphtype, args_dict, error=str(e), attempts=attempts.get(graphtype, 0) + 1)
+
+            # # Archive members are handed over with their content, so only a few files are queued at a time to
+            # # bound the memory they take
+            pending = collections.deque()
+            for findex, abs_fpath, graphtypes, attempts, data in work_items(work, args_dict):
+                if len(pending) >= jobs * 2:
+                    collect(*pending.popleft())
+                pending.append(
+                    (executor.submit(generate_file, findex, abs_fpath, graphtypes, args_dict, data, attempts), abs_fpath, graphtypes, attempts)
+                )
+
+            while pending:
+                collect(*pending.popleft())
+    else:
+        for findex, abs_fpath, graphtypes, attempts, data in work_items(work, args_dict):
+            file_failures, file_timings = generate_file(findex, abs_fpath, graphtypes, args_dict, data, attempts)
+            failures += file_failures
+            timings += file_timings
+
+    if failures:
+        log.warning("Failed to generate {} of {} graphs".format(len(failures), sum(len(graphtypes) for _, _, graphtypes, _ in work)))
+
+    if args_dict.get("timing"):
+        from binGraph.timing import write_report
+
+        write_report(args_dict["timing"], timings, version=__version__, graphtypes=__graphtypes__, jobs=jobs)
+
+    return failures
+
+
+# # The work of a batch as (findex, abs_fpath, graphtypes, attempts, data). The members of an archive (a run of work from the
+# # same archive on disk) are read in a single pass over it and come with their content, in the order they are
+# # stored. Members that could not be read that way come without, and are read (or fail) on their own
+def work_items(work, args_dict):
+
+    limit = args_dict.get("archive_limit", __archive_limit__) * 1024 * 1024
+
+    index = 0
+    while index < len(work):
+        findex, abs_fpath, graphtypes, attempts = work[index]
+        if not is_member(abs_fpath):
+            yield findex, abs_fpath, graphtypes, attempts, None
+            index += 1
+            continue
+
+        from binGraph.archive import split_member, read_members
+
+        # # The run of members of the same archive
+        on_disk, _ = split_member(abs_fpath)
+        members = collections.OrderedDict()
+        while index < len(work) and is_member(work[index][1]) and split_member(work[index][1])[0] == on_disk:
+            members[work[index][1]] = work[index]
+            index += 1
+
+        for member_path, data in read_members(on_disk, members.keys(), limit=limit):
+            findex, abs_fpath, graphtypes, attempts = members.pop(member_path)
+            yield findex, abs_fpath, graphtypes, attempts, data
+
+        for findex, abs_fpath, graphtypes, attempts in members.values():
+            yield findex, abs_fpath, graphtypes, attempts, None
+
+
+# # Each worker process gets its own non-interactive matplotlib state
+def init_worker(verbose=False):
+
+    import matplotlib
+
+    matplotlib.use("Agg")
+
+    logging.basicConfig(stream=sys.stderr, format="%(name)s | %(levelname)s | %(message)s")
+    if verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+        logging.getLogger("matplotlib").setLevel(logging.WARNING)
+
+
+# # Generate the requested graph types for a single file. Failures are logged and returned as
+# # (abs_fpath, graphtype, error) rather than raised, so one bad file does not stop a batch. Also returned are the
+# # stage timings of the file with --timing, and with --profile a cProfile dump of it is saved
+def generate_file(findex, abs_fpath, graphtypes, args_dict, data=None, attempts=None):
 
-        for module_name, module in __graphtypes__.items():
-            abs_save_fpath, fname, cleaned_fname = gen_names(
-                args_dict["format"],
-                abs_fpath,
-                args_dict["save_dir"],
-                save_prefix=args_dict["prefix"],
-                graphtype=module_name,
-                findex=(index if len(args_dict["files"]) > 1 else None),
-            )
-            args_dict["abs_fpath"] = abs_fpath  # Define the current file we are acting on
-            args_dict["fname"] = fname
-            args_dict["cleaned_fname"] = cleaned_fname
+    from binGraph.timing import stage_timer, timed, log_record
 
-            # # Generate and output the graph
-            plt, save_kwargs, json_data = module.generate(**args_dict)
-            fig = plt.gcf()
-            fig.set_size_inches(*args_dict["figsize"], forward=True)
+    timer = stage_timer(hooks=[log_record], file=abs_fpath) if args_dict.get("timing") else None
+    profiler = None
+    if args_dict.get("profile_dir"):
+        import cProfile
+
+        profiler = cProfile.Profile()
+
+    with timed(timer) if timer else contextlib.nullcontext():
+        if profiler:
+            profiler.enable()
+        try:
+            failures = generate_file_graphs(findex, abs_fpath, graphtypes, args_dict, data=data, attempts=attempts)
+        finally:
+            if profiler:
+                profiler.disable()
+                abs_stats_fpath, _, _ = gen_names(
+                    "pstats", abs_fpath, args_dict["profile_dir"], save_prefix=args_dict["prefix"], graphtype="profile", findex=findex
+                )
+                profiler.dump_stats(abs_stats_fpath)
+                log.info('Profile saved to: "{}"'.format(abs_stats_fpath))
+
+    return failures, timer.records if timer else []
+
+
+# # attempts holds the number of times each graph type has already been tried, in earlier runs (--resume)
+def generate_file_graphs(findex, abs_fpath, graphtypes, args_dict, data=None, attempts=None):
+    log.debug('Processing: "{}"'.format(abs_fpath))
+
+    # # Imported here as it pulls in numpy
+    from binGraph.cache import profile_cache
+
+    args_dict = dict(args_dict)
+    attempts = attempts or {}
+    failures = []
+
+    # # Graphs already up to date with the file's path, size and modification time are not drawn again, nor is the
+    # # file read for them
+    incremental = args_dict.get("incremental", False)
+    if incremental:
+        graphtypes = stale_graphs(findex, abs_fpath, graphtypes, args_dict)
+        if not graphtypes:
+            return failures
+
+    # # Read and analyse the file once, every graph type works from this
+    try:
+        with stage("open"):
+            bin_ctx = open_context(abs_fpath, args_dict, data=data)
+    except Exception as e:
+        log.error('Failed to read "{}": {}'.format(abs_fpath, e))
+        for graphtype in graphtypes:
+            record_result(abs_fpath, graphtype, args_dict, error=str(e), attempts=attempts.get(graphtype, 0) + 1)
+        return [(abs_fpath, graphtype, str(e)) for graphtype in graphtypes]
+
+    # # The file has changed on disk, but maybe not its content
+    if incremental:
+        graphtypes = stale_graphs(findex, abs_fpath, graphtypes, args_dict, bin_ctx=bin_ctx)
+
+    # # Cache of profiles from earlier runs, if enabled
+    cache = None
+    if args_dict.get("cache_dir"):
+        cache = profile_cache(args_dict["cache_dir"], max_size=args_dict.get("cache_size", __cache_size__) * 1024 * 1024)
+
+    retries = args_dict.get("retries", __retries__)
+
+    for module_name in graphtypes:
+
+        if incremental:
+            clear_output_stamp(module_name, findex, abs_fpath, args_dict)
+
+        # # Failed graphs are tried again (--retries), waiting longer before each retry
+        first = attempts.get(module_name, 0)
+        for attempt in range(first, max(retries + 1, first + 1)):
+            if attempt > first:
+                delay = __retry_backoff__ * 2 ** (attempt - 1)
+                log.info('Retrying {} graph for "{}" in {}s'.format(module_name, abs_fpath, delay))
+                time.sleep(delay)
+
+            try:
+                output = generate_graph(module_name, graphs[module_name], findex, abs_fpath, bin_ctx, args_dict, cache=cache)
+                error = None
+                break
+            except Exception as e:
+                log.error('Failed to generate {} graph for "{}": {}'.format(module_name, abs_fpath, e))
+                log.debug("Traceback:", exc_info=True)
+                output, error = None, str(e)
+
+        if error:
+            failures.append((abs_fpath, module_name, error))
+        elif incremental and output:
+            stamp_output(output, module_name, abs_fpath, bin_ctx, args_dict)
+
+        record_result(abs_fpath, module_name, args_dict, output=output, error=error, attempts=attempt + 1, bin_ctx=bin_ctx)
+
+    return failures
+
+
+# # The options that change the output of a graph type: the global output options and the graph's own
+def graph_params(module_name, args_dict):
+
+    names = __output_args__ + graphs[module_name].option_names
+    return {name: args_dict.get(name) for name in sorted(names)}
+
+
+# # The path a graph of a file is saved to, None if it is not saved to a file of its own (shown interactively, or
+# # added to the shared --data-only jsonl file)
+def output_path(module_name, findex, abs_fpath, args_dict):
+
+    data_only = args_dict.get("data_only")
+    if (data_only and args_dict.get("data_format") == "jsonl") or (args_dict["showplt"] and not data_only and args_dict.get("renderer") != "raster"):
+        return None
+
+    abs_save_fpath, _, _ = gen_names(
+        "npz" if data_only else args_dict["format"],
+        abs_fpath,
+        args_dict["save_dir"],
+        save_prefix=args_dict["prefix"],
+        graphtype=module_name,
+        findex=findex,
+    )
+
+    if args_dict["json"] and not data_only:
+        abs_save_fpath = os.path.splitext(abs_save_fpath)[0] + ".json"
+
+    return abs_save_fpath
+
+
+# # The graph types of a file whose outputs are not up to date (--incremental). Without a bin_ctx only the stamps'
+# # file path, size and modification time are compared, with one the fingerprints of the file's content. Stamps
+# # whose fingerprint still matches are brought up to date
+def stale_graphs(findex, abs_fpath, graphtypes, args_dict, bin_ctx=None):
+
+    from binGraph.incremental import read_stamp
+
+    stale = []
+    for module_name in graphtypes:
+        output = output_path(module_name, findex, abs_fpath, args_dict)
+        stamp = read_stamp(output) if output else None
+
+        if stamp is None:
+            stale.append(module_name)
+        elif bin_ctx is None:
+            if not (stamp.get("key") == job_key(abs_fpath, module_name, args_dict) and stamp_current(stamp)):
+                stale.append(module_name)
+        elif stamp.get("fingerprint") == graph_fingerprint(module_name, bin_ctx, args_dict):
+            stamp_output(output, module_name, abs_fpath, bin_ctx, args_dict)
+        else:
+            stale.append(module_name)
+
+    if len(stale) < len(graphtypes):
+        log.info('Up to date: skipping {} graphs of "{}"'.format(len(graphtypes) - len(stale), abs_fpath))
+
+    return stale
+
+
+# # The --incremental fingerprint of a graph of a file: its content, the graph type, options and binGraph version
+def graph_fingerprint(module_name, bin_ctx, args_dict):
+
+    from binGraph.incremental import fingerprint
+
+    return fingerprint(bin_ctx.sha256(), module_name, graph_params(module_name, args_dict), __version__["digit"])
+
+
+# # The output format version stamps are written with (--incremental)
+def fingerprint_version():
+
+    from binGraph import incremental
+
+    return incremental.__fingerprint_version__
+
+
+# # Whether a stamp was written by this binGraph and output format version. Checked along with the file's key, as
+# # the fingerprint is only worked out again once the key has changed
+def stamp_current(stamp):
+
+    return stamp.get("version") == __version__["digit"] and stamp.get("fingerprint_version") == fingerprint_version()
+
+
+# # Stamp a saved graph with its fingerprint (--incremental)
+def stamp_output(output, module_name, abs_fpath, bin_ctx, args_dict):
+
+    from binGraph.incremental import write_stamp
+
+    try:
+        write_stamp(
+            output,
+            fingerprint=graph_fingerprint(module_name, bin_ctx, args_dict),
+            key=job_key(abs_fpath, module_name, args_dict),
+            sha256=bin_ctx.sha256(),
+            graphtype=module_name,
+            params=graph_params(module_name, args_dict),
+            version=__version__["digit"],
+            fingerprint_version=fingerprint_version(),
+        )
+    except Exception as e:
+        log.error('Failed to stamp {} graph "{}": {}'.format(module_name, output, e))
 
-            plt.tight_layout()
 
-            if args_dict["showplt"]:
-                log.info("Opening graph interactively")
-                plt.show()
+# # Remove the stamp of a graph about to be drawn again (--incremental)
+def clear_output_stamp(module_name, findex, abs_fpath, args_dict):
 
-            elif args_dict["json"]:
-                log.info("Saving as json file")
+    from binGraph.incremental import clear_stamp
 
-                output = {}
-                output["info"] = json_data
+    output = output_path(module_name, findex, abs_fpath, args_dict)
+    if output:
+        clear_stamp(output)
 
-                buf = io.BytesIO()
-                plt.savefig(buf, format=args_dict["format"], dpi=args_dict["dpi"], **save_kwargs)
-                output["graph"] = base64.b64encode(buf.getvalue()).decode()
-                buf.close()
 
-                output["cmdline"] = " ".join(args_dict)
-                output["version"] = __version__
+# # The manifest key of a graph of a file
+def job_key(abs_fpath, module_name, args_dict):
 
-                abs_save_fpath = os.path.splitext(abs_save_fpath)[0] + ".json"
-                with open(abs_save_fpath, "w") as outfile:
-                    json.dump(output, outfile)
+    from binGraph.manifest import job_key as manifest_key
 
-                log.info('Graph saved to: "{}"'.format(abs_save_fpath))
+    return manifest_key(abs_fpath, module_name, graph_params(module_name, args_dict))
 
-            else:
-                plt.savefig(abs_save_fpath, format=args_dict["format"], dpi=args_dict["dpi"], **save_kwargs)
-                log.info('Graph saved to: "{}"'.format(abs_save_fpath))
 
-            plt.clf()
-            plt.cla()
-            plt.close()
+# # Add the result of a graph to the --manifest, if keeping one
+def record_result(abs_fpath, module_name, args_dict, output=None, error=None, attempts=1, bin_ctx=None):
 
-def main():
+    if not args_dict.get("manifest"):
+        return
+
+    from binGraph.manifest import record_job
+
+    try:
+        record_job(
+            args_dict["manifest"],
+            job_key(abs_fpath, module_name, args_dict),
+            "failed" if error else "done",
+            file=abs_fpath,
+            sha256=bin_ctx.sha256() if bin_ctx else None,
+            graphtype=module_name,
+            params=graph_params(module_name, args_dict),
+            output=output,
+            attempts=attempts,
+            error=error,
+        )
+    except Exception as e:
+        log.error('Failed to add {} graph for "{}" to the manifest: {}'.format(module_name, abs_fpath, e))
+
+
+# # The shared analysis context of a file, or of an archive member read into memory (data, if already read)
+def open_context(abs_fpath, args_dict, data=None):
+
+    # # Imported here as it pulls in numpy, pefile etc.
+    from binGraph.context import bin_context
+
+    if data is not None:
+        return bin_context(abs_fpath, chunks=args_dict.get("chunks"), data=data)
+
+    if is_member(abs_fpath):
+        from binGraph.archive import read_member
+
+        data = read_member(abs_fpath, limit=args_dict.get("archive_limit", __archive_limit__) * 1024 * 1024)
+        return bin_context(abs_fpath, chunks=args_dict.get("chunks"), data=data)
+
+    return bin_context(abs_fpath, chunks=args_dict.get("chunks"), stream=args_dict.get("stream", False))
+
+
+# # Generate and output a single graph. Returns the path it was saved to
+def generate_graph(module_name, module, findex, abs_fpath, bin_ctx, args_dict, cache=None):
+
+    abs_save_fpath, fname, cleaned_fname = gen_names(
+        args_dict["format"],
+        abs_fpath,
+        args_dict["save_dir"],
+        save_prefix=args_dict["prefix"],
+        graphtype=module_name,
+        findex=findex,
+    )
+    args_dict["abs_fpath"] = abs_fpath  # Define the current file we are acting on
+    args_dict["fname"] = fname
+    args_dict["cleaned_fname"] = cleaned_fname
+
+    # # Work out the numbers behind the graph, or fetch them from the cache
+    profile = get_profile(module_name, module, bin_ctx, args_dict, cache=cache)
+
+    # # Only the numbers were asked for, don't draw anything
+    if args_dict.get("data_only"):
+        with stage("save", graphtype=module_name):
+            return save_data(module_name, profile, findex, abs_fpath, bin_ctx, args_dict)
+
+    if args_dict["showplt"] and args_dict.get("renderer") != "raster":
+        from binGraph.render import finish_figure, show_figure
+
+        fig, save_kwargs, json_data = module.generate(profile=profile, **args_dict)
+        finish_figure(fig, args_dict["figsize"])
+
+        log.info("Opening graph interactively")
+        show_figure(fig)
+        return
+
+    # # Generate and output the graph
+    with stage("render", graphtype=module_name):
+        image, json_data = render_graph(module, profile, args_dict)
+
+    with stage("save", graphtype=module_name):
+        return save_image(image, json_data, abs_save_fpath, args_dict)
+
+
+# # The numbers behind a graph, from the cache if it has them
+def get_profile(module_name, module, bin_ctx, args_dict, cache=None):
+
+    profile = None
+    if cache:
+        with stage("cache", graphtype=module_name):
+            key = cache.key(bin_ctx.sha256(), module_name, module.profile_args(**args_dict))
+            profile = cache.get(key)
+
+    if profile is None:
+        with stage("analyse", graphtype=module_name):
+            profile = module.analyse(bin_ctx=bin_ctx, **args_dict)
+        if cache:
+            with stage("cache", graphtype=module_name):
+                cache.put(key, profile)
+
+    return profile
+
+
+# # Draw a graph from its profile, as the bytes of an image in args_dict["format"] and additional json data
+def render_graph(module, profile, args_dict):
+
+    # # Thumbnails drawn straight to PNG bytes, without matplotlib
+    if args_dict.get("renderer") == "raster":
+        with stage("raster"):
+            return module.raster(profile=profile, **args_dict)
+
+    from binGraph.render import finish_figure
+
+    with stage("draw"):
+        fig, save_kwargs, json_data = module.generate(profile=profile, **args_dict)
+        finish_figure(fig, args_dict["figsize"])
+
+    buf = io.BytesIO()
+    with stage("savefig"):
+        fig.savefig(buf, format=args_dict["format"], dpi=args_dict["dpi"], **save_kwargs)
+
+    return buf.getvalue(), json_data
+
+
+# # Save an already encoded graph image, as is or base64 encoded in a json file
+def save_image(image, json_data, abs_save_fpath, args_dict):
+
+    if args_dict["json"]:
+        log.info("Saving as json file")
+
+        abs_save_fpath = os.path.splitext(abs_save_fpath)[0] + ".json"
+        with open(abs_save_fpath, "w") as outfile:
+            json.dump(json_output(image, json_data, args_dict), outfile)
+
+    else:
+        with open(abs_save_fpath, "wb") as outfile:
+            outfile.write(image)
+
+    log.info('Graph saved to: "{}"'.format(abs_save_fpath))
+
+    return abs_save_fpath
+
+
+# # The --json output of a graph: the image base64 encoded, with its additional information
+def json_output(image, json_data, args_dict):
+
+    output = {}
+    output["info"] = json_data
+    output["graph"] = base64.b64encode(image).decode()
+    output["cmdline"] = " ".join(args_dict)
+    output["version"] = __version__
+
+    return output
+
+
+# # Save the numbers behind a graph, rather than the graph. As .npz per file and graph type, or as a line in a
+# # shared JSON Lines file
+def save_data(module_name, profile, findex, abs_fpath, bin_ctx, args_dict):
+
+    from binGraph.cache import save_profile, to_json
+
+    if args_dict.get("data_format") == "jsonl":
+
+        record = {
+            "file": abs_fpath,
+            "sha256": bin_ctx.sha256(),
+            "graphtype": module_name,
+            "data": profile,
+            "version": __version__["digit"],
+        }
+
+        # # One write per record, appending, so lines from parallel workers do not interleave
+        abs_save_fpath = os.path.join(
+            args_dict["save_dir"], "{}binGraph-data.jsonl".format(args_dict["prefix"] + "-" if args_dict["prefix"] else "")
+        )
+        with open(abs_save_fpath, "a") as outfile:
+            outfile.write(json.dumps(record, default=to_json) + "\n")
+
+    else:
+        abs_save_fpath = output_path(module_name, findex, abs_fpath, args_dict)
+        with open(abs_save_fpath, "wb") as outfile:
+            save_profile(outfile, profile)
+
+    log.info('Data saved to: "{}"'.format(abs_save_fpath))
+
+    return abs_save_fpath
+
+
+class ArgValidationEx(Exception):
+    pass
+
+
+# # The command line options, global ones first then those of each graph type
+def build_parser(parser_class=argparse.ArgumentParser):
 
     # # Import the defaults
-    parser = argparse.ArgumentParser()
+    parser = parser_class()
     parser.add_argument(
         "-f",
         "--file",
@@ -306,6 +887,108 @@ def main():
         default=__blob__,
         help="Do not intelligently parse certain file types. Treat all files as a binary blob. E.g. don't add PE entry point or section splitter to the graph",
     )
+    parser.add_argument(
+        "--renderer",
+        type=str,
+        default=__renderer__,
+        choices=["matplotlib", "raster"],
+        help='Draw graphs with matplotlib, or as "raster" thumbnails (png only): data lines, bars and markers drawn without matplotlib, no axes or legends',
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=__jobs__,
+        metavar=__jobs__,
+        help="Number of processes to generate graphs with, 0 uses one per CPU. Failed files are reported and skipped",
+    )
+    parser.add_argument(
+        "--data-only",
+        action="store_true",
+        dest="data_only",
+        help="Save the numbers behind the graphs (entropy, ibyte percentages, byte counts, section offsets etc.) instead of drawing them, see --data-format",
+    )
+    parser.add_argument(
+        "--data-format",
+        type=str,
+        dest="data_format",
+        default=__data_format__,
+        choices=["npz", "jsonl"],
+        help="Format of the --data-only numbers: a .npz file per graph (default), or lines of a binGraph-data.jsonl file",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        dest="cache_dir",
+        default=None,
+        metavar="~/.cache/binGraph/",
+        help="Cache the numbers behind each graph here, keyed by the file's SHA-256 and the graph options. Files seen before skip straight to drawing",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        dest="cache_size",
+        default=__cache_size__,
+        metavar=__cache_size__,
+        help="Maximum size of the --cache-dir in MiB, least recently used entries are removed first",
+    )
+    parser.add_argument(
+        "--timing",
+        type=str,
+        default=None,
+        metavar="timing.json",
+        help="Save a json report of the wall time, CPU time and peak memory of each stage (reading, parsing, analysis, drawing, saving) of every file and graph type. Memory tracing slows the run down",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        dest="profile_dir",
+        default=None,
+        metavar="/data/profiles/",
+        help="Save a cProfile dump (.pstats, see the pstats module) of generating the graphs of each file to this directory",
+    )
+    parser.add_argument(
+        "--archives",
+        type=int,
+        dest="archive_depth",
+        default=0,
+        metavar=__archive_depth__,
+        help='Graph the members of zip, tar (and .tar.gz etc.) and gzip files rather than the archive itself, read in memory without extracting to disk. The value is the number of nested archive levels to open, e.g. {} for an archive and the archives in it. Members are named "archive.zip!/member.exe"'.format(__archive_depth__),
+    )
+    parser.add_argument(
+        "--archive-limit",
+        type=int,
+        dest="archive_limit",
+        default=__archive_limit__,
+        metavar=__archive_limit__,
+        help="Largest archive member to graph in MiB, larger members are skipped",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        metavar="manifest.jsonl",
+        help="Journal every graph generated or failed (file, SHA-256, graph type, options, output path and status) to this JSON Lines file, see --resume",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the graphs the --manifest records as done (if their output is still there) with the same file and options, and try the failed ones again. Attempts made by earlier runs count towards --retries",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=__retries__,
+        metavar=__retries__,
+        help="Times to try a failed graph again (over all the runs of a --manifest), waiting {}s before the first retry and twice as long before each retry after".format(
+            __retry_backoff__
+        ),
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help='Only draw the graphs whose file content, options or binGraph version have changed since they were last saved, make style. Each output is stamped with a fingerprint of these in a ".fingerprint" file next to it',
+    )
     parser.add_argument("-v", "--verbose", action="store_true", help="Print debug information to stderr")
 
     subparsers = parser.add_subparsers(
@@ -321,10 +1004,19 @@ def main():
         module_parser = subparsers.add_parser(name)
         module.args_setup(module_parser)
 
-    args = parser.parse_args()
+    return parser
+
+
+# # Check and complete parsed arguments: expand the file list and let each graph type validate its options
+def validate_args(args):
 
     ## # Verify global arguments
 
+    if args.archive_depth < 0:
+        raise ArgValidationEx("--archives must be 0 or more: {}".format(args.archive_depth))
+    if not args.archive_limit > 0:
+        raise ArgValidationEx("--archive-limit must be more than 0: {}".format(args.archive_limit))
+
     # # Get a list of files from the arguments
     __files__ = []
     for file in args.files:
@@ -334,15 +1026,19 @@ def main():
                 raise Exception("Error reading {}".format(file))
             __files__ += list(files)
         else:
-            __files__ += find_files([file], args.recurse)
+            __files__ += find_files([file], args.recurse, archive_depth=args.archive_depth, archive_limit=args.archive_limit)
 
     args.files = __files__
 
     # # Is the save_dir actually a dirctory?
     args.save_dir = os.path.abspath(args.save_dir)
     if not os.path.isdir(args.save_dir):
-        log.critical("--out is not a directory: {}".format(args.save_dir))
-        exit(1)
+        raise ArgValidationEx("--out is not a directory: {}".format(args.save_dir))
+
+    if args.profile_dir:
+        args.profile_dir = os.path.abspath(args.profile_dir)
+        if not os.path.isdir(args.profile_dir):
+            raise ArgValidationEx("--profile is not a directory: {}".format(args.profile_dir))
 
     # # Detect if all graphs are being requested
     __graphtypes__ = []
@@ -354,7 +1050,56 @@ def main():
     for name, module in __graphtypes__.items():
         module.args_validation(args)
 
-    generate_graphs(args.__dict__)
+    # # Can the graphs be drawn by the raster renderer?
+    if args.renderer == "raster":
+        if args.showplt or args.format != "png":
+            raise ArgValidationEx("--renderer raster only saves png files (no --showplt, --format png)")
+        for name, module in __graphtypes__.items():
+            if not hasattr(module, "raster"):
+                raise ArgValidationEx("The {} graph can not be drawn with --renderer raster".format(name))
+
+    # # Is the number of jobs sane?
+    if args.jobs < 0:
+        raise ArgValidationEx("--jobs must be 0 or more: {}".format(args.jobs))
+
+    if args.retries < 0:
+        raise ArgValidationEx("--retries must be 0 or more: {}".format(args.retries))
+
+    if args.manifest:
+        args.manifest = os.path.abspath(args.manifest)
+    elif args.resume:
+        raise ArgValidationEx("--resume needs a --manifest to resume from")
+
+    return args
+
+
+def main(argv=None):
+
+    argv = sys.argv[1:] if argv is None else argv
+
+    # # Long running server mode: binGraph serve --help
+    if argv and argv[0] == "serve":
+        from binGraph.server import serve_main
+
+        return serve_main(argv[1:])
+
+    # # Benchmarks over a synthetic corpus: binGraph bench --help
+    if argv and argv[0] == "bench":
+        from binGraph.bench import main as bench_main
+
+        return bench_main(argv[1:])
+
+    args = build_parser().parse_args(argv)
+
+    try:
+        validate_args(args)
+    except ArgValidationEx as e:
+        log.critical(e)
+        exit(1)
+
+    failures = generate_graphs(args.__dict__)
+
+    return 1 if failures else 0
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+"""
+Shared file input for the graph modules
+-------------------------------------------
+Files are memory mapped and handed to the graph modules as zero-copy numpy uint8 views. Nothing is copied into
+Python objects, and pages are read in (and can be dropped again) by the OS as they are used, so memory use stays
+roughly constant whatever the file size.
+"""
+
+from __future__ import absolute_import
+import os
+import mmap
+import numpy as np
+
+import logging
+
+log = logging.getLogger("binGraph.binfile")
+
+
+# # Map a file read only and return a numpy uint8 view of it
+def map_file(abs_fpath):
+
+    with open(abs_fpath, "rb") as fh:
+
+        # # Zero length files can not be mapped
+        if os.fstat(fh.fileno()).st_size == 0:
+            log.debug('Empty file: "{}"'.format(abs_fpath))
+            return np.zeros(0, dtype=np.uint8)
+
+        buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # # The files are read start to finish, let the OS read ahead
+    if hasattr(buf, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+        buf.madvise(mmap.MADV_SEQUENTIAL)
+
+    log.debug('Mapped: "{}", length: {}'.format(abs_fpath, len(buf)))
+
+    # # The mapping stays open for as long as the view (or anything derived from it) is alive
+    return np.frombuffer(buf, dtype=np.uint8)
+
+
+# # The bytes-like object (mmap, bytes) behind a view from map_file, for libraries that need one rather than an array
+def raw_buffer(view):
+
+    base = view.base
+    if isinstance(base, memoryview):
+        base = base.obj
+
+    # # Not backed by a whole bytes-like object, fall back to a copy
+    if not isinstance(base, (mmap.mmap, bytes, bytearray)) or not len(base) == view.size:
+        return view.tobytes()
+
+    return base
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+"""
+On-disk cache of analysed profiles
+-------------------------------------------
+A profile is the dict of numbers a graph module's analyse() returns (entropy samples, ibyte percentages, byte
+counts, section and entrypoint markers etc.). They are stored as .npz files named by a key made from the file's
+SHA-256, the graph type and the arguments that change the numbers (see each module's profile_args), so a file that
+has been seen before goes straight to drawing the graph.
+
+The cache is limited in size, least recently used profiles are removed first.
+"""
+
+from __future__ import absolute_import
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+import logging
+
+log = logging.getLogger("binGraph.cache")
+
+__cache_version__ = 2  # Bump when the content of profiles changes, so old entries are not used
+__cache_size__ = 1024  # Default maximum size of the cache in MiB
+__cache_ext__ = ".npz"
+
+
+class profile_cache(object):
+    """Size limited, least recently used, cache of profiles"""
+
+    def __init__(self, cache_dir, max_size=__cache_size__ * 1024 * 1024):
+        super(profile_cache, self).__init__()
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    # # Key for a file's profile, from its hash, the graph type and the arguments that change the profile
+    def key(self, sha256, graphtype, params):
+
+        key = json.dumps([__cache_version__, sha256, graphtype, params], sort_keys=True, default=str)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+
+        return os.path.join(self.cache_dir, key + __cache_ext__)
+
+    def get(self, key):
+
+        path = self.path(key)
+
+        try:
+            profile = load_profile(path)
+        except (IOError, OSError, ValueError, KeyError) as e:
+            if os.path.exists(path):
+                log.warning('Ignoring unreadable cache entry "{}": {}'.format(path, e))
+            return None
+
+        # # Mark as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        log.debug("Cache hit: {}".format(key))
+        return profile
+
+    def put(self, key, profile):
+
+        # # Write to a temporary file first, so other processes never read a partly written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                save_profile(fh, profile)
+            os.replace(tmp_path, self.path(key))
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+        log.debug("Cached: {}".format(key))
+        self.evict()
+
+    # # Remove the least recently used entries until the cache fits in max_size
+    def evict(self):
+
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(__cache_ext__) and entry.is_file():
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+
+        if total <= self.max_size:
+            return
+
+        for mtime, size, path in sorted(entries):
+            try:
+                os.remove(path)
+                total -= size
+                log.debug('Evicted: "{}"'.format(path))
+            except OSError:
+                # # Another process got there first
+                pass
+
+            if total <= self.max_size:
+                break
+
+
+# # Save a profile as npz - numpy arrays are stored as they are, everything else as json
+def save_profile(fh, profile):
+
+    arrays = {}
+    meta = {}
+    for name, value in profile.items():
+        if isinstance(value, np.ndarray):
+            arrays[name] = value
+        else:
+            meta[name] = value
+
+    arrays["__meta__"] = np.array(json.dumps(meta, default=to_json))
+    np.savez_compressed(fh, **arrays)
+
+
+def load_profile(path):
+
+    with np.load(path, allow_pickle=False) as npz:
+        profile = json.loads(str(npz["__meta__"]))
+        for name in npz.files:
+            if not name == "__meta__":
+                profile[name] = npz[name]
+
+    return profile
+
+
+# # json.dump default for numpy scalars and arrays
+def to_json(value):
+
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+
+    raise TypeError("Object of type {} is not JSON serializable".format(type(value).__name__))
@@ -0,0 +1,585 @@
+#!/usr/bin/env python
+
+"""
+Per file analysis shared between the graph modules
+-------------------------------------------
+A bin_context is built once per file and handed to every graph module that is generated for that file. It holds
+the mapped file, and works out (then keeps) the things more than one graph needs:
+
+data:                   numpy uint8 view of the file (mapped on first use when streaming)
+chunk_histograms:       (chunks x 256) byte counts, one row per chunk, and the length of each chunk
+histogram:              256 byte counts over all the file
+range_histogram:        256 byte counts of part of the file, summed from the chunk histograms where it can be
+get_bin_proxy:          The parsed file format (PE) metadata
+sha256:                 Hash of the file's content
+
+So the file is read once, and the bytes counted once, however many graph types are requested. When streaming, the
+hash and the first block (for the PE headers) are taken as the blocks go by, so a pipe is read only once and a large
+file is never mapped.
+"""
+
+from __future__ import division
+from __future__ import absolute_import
+import os
+import sys
+import stat
+import hashlib
+import numpy as np
+
+try:
+    import pefile
+except ImportError as e1:
+    try:
+        import lief
+    except ImportError as e2:
+        pass
+
+from binGraph.binfile import map_file, raw_buffer
+from binGraph.timing import stage
+
+import logging
+
+log = logging.getLogger("binGraph.context")
+
+__pass_bytes__ = 1 << 22  # Bytes of input counted per bincount pass - bounds the temporary memory used
+__stream_blocksize__ = __pass_bytes__  # Bytes read per block when streaming
+__pyramid_blocks__ = 8192  # Default number of blocks in the finest level of a histogram pyramid
+__pyramid_detail__ = 8  # Least number of pyramid blocks summed into each chunk, bounds how far chunk edges are moved
+
+
+class bin_context(object):
+    """Shared analysis of a single file"""
+
+    def __init__(self, abs_fpath, fname=None, chunks=None, stream=False, data=None):
+        super(bin_context, self).__init__()
+        self.abs_fpath = abs_fpath
+        self.fname = fname if fname else os.path.basename(abs_fpath)
+
+        # # The chunk count the graphs are expected to ask for. If known the whole file histogram is taken from the
+        # # per chunk histograms, rather than counting the bytes a second time
+        self.chunks = chunks
+
+        # # Count chunks by reading the file as a stream of blocks, rather than mapping it
+        self.stream = stream
+
+        self.__data = None
+        self.__size = None
+        self.__chunk_histograms = {}
+        self.__chunksizes = {}
+        self.__histogram = None
+        self.__bin_proxy = None
+        self.__sha256 = None
+        self.__head = None
+        self.__pyramids = {}
+
+        # # Streamed devices and pipes can only be read once, from the start to the end
+        self.seekable = True
+
+        # # Content already in memory (bytes-like), e.g. an archive member: abs_fpath only names it
+        if data is not None:
+            self.stream = False
+            self.__data = np.frombuffer(data, dtype=np.uint8)
+            self.__size = self.__data.size
+
+        elif not self.stream:
+            with stage("map"):
+                self.__data = map_file(abs_fpath)
+            self.__size = self.__data.size
+
+        else:
+            self.seekable = stat.S_ISREG(os.stat(abs_fpath).st_mode)
+
+    # # The file's bytes, mapped on first use when streaming
+    @property
+    def data(self):
+
+        if self.__data is None:
+            if not self.seekable:
+                raise IOError('Can not map "{}", it can only be read as a stream'.format(self.fname))
+            with stage("map"):
+                self.__data = map_file(self.abs_fpath)
+
+        return self.__data
+
+    # # The file size - when streaming this is only known once the file has been read
+    @property
+    def size(self):
+
+        if self.__size is None:
+            self.histogram()
+
+        return self.__size
+
+    # # Chunk size for the given number of chunks - rounded, and not rounded (for plotting offsets)
+    def chunksize(self, chunks):
+
+        if not chunks in self.__chunksizes:
+            if self.stream:
+                self.chunk_histograms(chunks)
+            else:
+                self.__chunksizes[chunks] = get_chunksize(self.size, chunks)
+
+        return self.__chunksizes[chunks]
+
+    def chunk_histograms(self, chunks):
+
+        if not chunks in self.__chunk_histograms:
+
+            if self.stream:
+                if not self.seekable and self.__chunk_histograms:
+                    raise IOError('Can not read "{}" again for {} chunks, it can only be read as a stream'.format(self.fname, chunks))
+
+                log.debug('Streaming "{}" into {} chunks'.format(self.fname, chunks))
+
+                # # Hash every block, and keep the first for parsing the headers, as they are read
+                digest = hashlib.sha256()
+                head = []
+
+                def observe(block):
+                    digest.update(block)
+                    if not head:
+                        head.append(bytes(block))
+
+                with stage("count"), open(self.abs_fpath, "rb") as fh:
+                    hists, sizes, chunksize, nr_chunksize = stream_chunk_histograms(fh, chunks, size=stream_size(fh), observe=observe)
+
+                self.__size = int(sizes.sum())
+                self.__sha256 = self.__sha256 or digest.hexdigest()
+                if self.__head is None:
+                    self.__head = head[0] if head else b""
+                self.__chunksizes[chunks] = (chunksize, nr_chunksize)
+
+            else:
+                chunksize, _ = self.chunksize(chunks)
+                log.debug('Counting bytes of "{}" with chunksize {}'.format(self.fname, chunksize))
+                with stage("count"):
+                    hists, sizes = chunk_histograms(self.data, chunksize)
+
+            self.__chunk_histograms[chunks] = (hists, sizes)
+
+        return self.__chunk_histograms[chunks]
+
+    def histogram(self):
+
+        if self.__histogram is None:
+
+            # # Every set of chunk histograms sums to the whole file histogram, use one if it has been (or will be) counted
+            if not self.__chunk_histograms and (self.chunks or self.stream):
+                self.chunk_histograms(self.chunks if self.chunks else 1)
+
+            if self.__chunk_histograms:
+                hists, _ = next(iter(self.__chunk_histograms.values()))
+                self.__histogram = hists.sum(axis=0)
+            else:
+                log.debug('Counting bytes of "{}"'.format(self.fname))
+                with stage("count"):
+                    self.__histogram = byte_counts(self.data)
+
+        return self.__histogram
+
+    # # Byte counts of the file from start up to end. Whole chunks already counted by chunk_histograms (the largest
+    # # that fit) are summed, only the bytes at the edges of the range are counted again
+    def range_histogram(self, start, end):
+
+        end = min(end, self.size)
+        start = min(start, end)
+
+        best = None
+        for hists, sizes in self.__chunk_histograms.values():
+            chunksize = int(sizes[0]) if len(sizes) else 0
+            if not chunksize:
+                continue
+
+            # # The whole chunks inside the range, the short last chunk is whole if the range reaches the end
+            first = -(-start // chunksize)
+            last = len(sizes) if end == self.size else end // chunksize
+            if last > first and (best is None or chunksize > best[0]):
+                best = (chunksize, first, last, hists)
+
+        if best is None:
+            return self.count_range(start, end)
+
+        chunksize, first, last, hists = best
+        return hists[first:last].sum(axis=0) + self.count_range(start, first * chunksize) + self.count_range(last * chunksize, end)
+
+    # # Byte counts of the file from start up to end. When streaming the range is read from the file a block at a time,
+    # # rather than mapping it
+    def count_range(self, start, end):
+
+        if not self.stream:
+            return byte_counts(self.data[start:end])
+
+        counts = np.zeros(256, dtype=np.int64)
+        if not end > start:
+            return counts
+
+        if not self.seekable:
+            raise IOError('Can not seek in "{}", it can only be read as a stream'.format(self.fname))
+
+        with open(self.abs_fpath, "rb") as fh:
+            fh.seek(start)
+            while start < end:
+                block = fh.read(min(__stream_blocksize__, end - start))
+                if not block:
+                    break
+                counts += byte_counts(np.frombuffer(block, dtype=np.uint8))
+                start += len(block)
+
+        return counts
+
+    # # The first block of the file - enough for the headers of a PE file
+    def head(self):
+
+        if self.__head is None:
+            if self.stream:
+                self.chunk_histograms(self.chunks if self.chunks else 1)
+            else:
+                self.__head = raw_buffer(self.data)[:__stream_blocksize__]
+
+        return self.__head
+
+    # # SHA-256 hex digest of the file's content
+    def sha256(self):
+
+        if self.__sha256 is None:
+
+            # # Streams are hashed as they are counted, so they are not read a second time
+            if self.stream:
+                self.chunk_histograms(self.chunks if self.chunks else 1)
+                return self.__sha256
+
+            with stage("hash"):
+                digest = hashlib.sha256()
+                for start in range(0, self.size, __pass_bytes__):
+                    digest.update(self.data[start : start + __pass_bytes__])
+
+                self.__sha256 = digest.hexdigest()
+
+        return self.__sha256
+
+    # # Histogram pyramid of the file with the given number of blocks in its finest level
+    def pyramid(self, blocks=__pyramid_blocks__):
+
+        if not blocks in self.__pyramids:
+            hists, sizes = self.chunk_histograms(blocks)
+            self.__pyramids[blocks] = hist_pyramid(hists, sizes)
+
+        return self.__pyramids[blocks]
+
+    def get_bin_proxy(self):
+
+        if self.__bin_proxy is None:
+            with stage("parse"):
+                # # Only the headers are parsed, when streaming they are taken from the first block
+                data = self.head() if self.stream else raw_buffer(self.data)
+                self.__bin_proxy = bin_proxy(self.abs_fpath, data=data)
+
+        return self.__bin_proxy
+
+
+class hist_pyramid(object):
+    """Byte histograms of a file at halving resolutions. Level 0 is the histogram of each block of the file, every
+    level above sums adjacent pairs of the level below. Histograms of any number of chunks over any range of the
+    file are summed from the coarsest level that still has enough detail, without reading the file again"""
+
+    def __init__(self, hists, sizes):
+        super(hist_pyramid, self).__init__()
+
+        # # Every block is the same size, bar the last
+        self.blocksize = int(sizes[0]) if len(sizes) else 1
+        self.size = int(sizes.sum())
+
+        self.levels = [(hists, sizes)]
+        while len(hists) > 1:
+            hists, sizes = pair_sum(hists), pair_sum(sizes)
+            self.levels.append((hists, sizes))
+
+    # # Histograms and sizes of chunks chunks between the start and end offsets, and the offset of each chunk.
+    # # Chunk edges fall on block edges, so chunks are only about the same size, and there are fewer of them if the
+    # # range has fewer blocks than chunks
+    def histograms(self, chunks, start=0, end=None):
+
+        end = self.size if end is None else min(end, self.size)
+        first, last = start // self.blocksize, -(-end // self.blocksize)
+        if not chunks > 0 or not last > first:
+            return np.zeros((0, 256), dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        # # The coarsest level with at least __pyramid_detail__ of its blocks in each chunk
+        level = 0
+        while level + 1 < len(self.levels) and (last - first) / chunks >= (2 ** (level + 1)) * __pyramid_detail__:
+            level += 1
+        hists, sizes = self.levels[level]
+
+        # # Chunk edges in blocks of the level, the last edge is the end of the range
+        edges = np.unique(np.round(np.linspace(first, last, chunks + 1) / 2**level).astype(np.int64))
+        stop = min(edges[-1], len(hists))
+        edges = edges[:-1]
+
+        offsets = edges * (2**level) * self.blocksize
+        return np.add.reduceat(hists[:stop], edges), np.add.reduceat(sizes[:stop], edges), offsets
+
+
+# # Sum adjacent pairs of rows, an odd last row is kept as it is
+def pair_sum(rows):
+
+    pairs = rows[: len(rows) // 2 * 2].reshape((-1, 2) + rows.shape[1:]).sum(axis=1)
+    if len(rows) % 2:
+        pairs = np.concatenate((pairs, rows[-1:]))
+
+    return pairs
+
+
+# # Abstracts the bin properties away from specific library calls enabling lief and pefile usage
+class bin_proxy(object):
+    """Abstract for different binary parsers types in use"""
+
+    def __init__(self, abs_fpath, lib=None, data=None):
+        super(bin_proxy, self).__init__()
+        self.abs_fpath = abs_fpath
+
+        # # The file's already loaded content (bytes-like), if available. Saves the parser reading the file again
+        self.data = data
+
+        if lib:
+            self.lib = lib
+        else:
+
+            if "pefile" in sys.modules:
+                self.lib = "pefile"
+            elif "lief" in sys.modules:
+                self.lib = "lief"
+            else:
+                # # We dont have a parser
+                return None, None
+
+        self.bin, self.type = None, None
+        self.__parse_bin()
+
+    class __ParseError(Exception):
+
+        pass
+
+    def __parse_bin(self):
+
+        if self.lib == "lief":
+            try:
+                # # Content without a file on disk (archive members) is parsed from memory
+                if self.data is not None and not os.path.isfile(self.abs_fpath):
+                    self.bin = lief.parse(raw=list(bytes(self.data)), name=os.path.basename(self.abs_fpath))
+                else:
+                    self.bin = lief.parse(filepath=self.abs_fpath)
+                if type(self.bin) == lief.PE.Binary:
+                    self.type = "PE"
+                    log.debug("Parsed with lief as: {}".format(self.type))
+                else:
+                    log.debug("File is a currently unsupported format: {}".format(self.type))
+
+            except lief.bad_file as e:
+                log.warning("Failed to parse with lief: {}".format(e))
+
+        elif self.lib == "pefile":
+            try:
+                # # Only the headers and section table are needed, fast_load skips parsing the data directories
+                # # (imports, resources, relocations, debug etc.) which can be slow on large or malformed samples
+                if self.data is not None:
+                    self.bin = pefile.PE(data=self.data, fast_load=True)
+                else:
+                    self.bin = pefile.PE(self.abs_fpath, fast_load=True)
+                self.type = "PE"
+
+                log.debug("Parsed with pefile as: {}".format(self.type))
+
+            except pefile.PEFormatError as e:
+                log.warning("Failed to parse with pefile: {}".format(e))
+
+    def get_virtual_ep(self):
+
+        if self.lib == "lief":
+            return self.bin.optional_header.addressof_entrypoint
+        elif self.lib == "pefile":
+            return self.bin.OPTIONAL_HEADER.AddressOfEntryPoint
+
+    def get_physical_from_rva(self, rva):
+
+        if self.lib == "lief":
+            return self.bin.rva_to_offset(rva)
+        elif self.lib == "pefile":
+            return self.bin.get_physical_by_rva(rva)
+
+    def sections(self):
+
+        index = 0
+        sections = []
+
+        for lib_section in self.bin.sections:
+
+            section = section_proxy(self.lib, lib_section)
+
+            yield index, section
+            index += 1
+
+
+# # Part of bin_proxy - abstracts section calls
+class section_proxy(object):
+    """Abstract for different binary parsers types in use"""
+
+    def __init__(self, lib, lib_section):
+        super(section_proxy, self).__init__()
+        self.lib = lib
+        self.lib_section = lib_section
+
+        if self.lib == "lief":
+            self.name = lib_section.name
+            self.offset = lib_section.offset
+            self.size = lib_section.size
+            self.virtual_size = lib_section.virtual_size
+        elif self.lib == "pefile":
+            self.name = str(lib_section.Name.rstrip(b"\x00").decode("utf-8"))
+            self.offset = self.lib_section.PointerToRawData
+            self.size = self.lib_section.SizeOfRawData
+            self.virtual_size = self.lib_section.Misc_VirtualSize
+
+
+# # Chunk size for splitting size bytes into the given number of chunks - rounded, and not rounded (for plotting offsets)
+def get_chunksize(size, chunks):
+
+    if chunks > size:
+        return 1, 1
+    else:
+        return -(-size // chunks), size / chunks
+
+
+# # Size of an open file, if it can be known before reading it (it can't for pipes, character devices etc.)
+def stream_size(fh):
+
+    st = os.fstat(fh.fileno())
+    if stat.S_ISREG(st.st_mode) and st.st_size > 0:
+        return st.st_size
+
+    return None
+
+
+# # Count the bytes of each chunk of a file read as a stream of blocks. Memory use is O(chunks x 256) whatever the
+# # size of the file. If the size is not known up front the chunksize starts at one byte, and is doubled (merging
+# # neighbouring chunks) whenever there are more than twice as many chunks as requested. The file then ends up split
+# # into between chunks / 2 and chunks chunks.
+# # Returns the histograms, chunk lengths, chunksize and not rounded chunksize (see get_chunksize). observe, if given,
+# # is called with each block as it is read
+def stream_chunk_histograms(fh, chunks, size=None, blocksize=__stream_blocksize__, observe=None):
+
+    if size:
+        chunksize, nr_chunksize = get_chunksize(size, chunks)
+        hists = np.zeros((-(-size // chunksize), 256), dtype=np.int64)
+    else:
+        chunksize = 1
+        hists = np.zeros((chunks * 2, 256), dtype=np.int64)
+
+    buf = bytearray(blocksize)
+    pos = 0
+
+    while True:
+        read = fh.readinto(buf)
+        if not read:
+            break
+
+        block = np.frombuffer(buf, dtype=np.uint8, count=read)
+        if observe:
+            observe(memoryview(buf)[:read])
+        last_row = (pos + read - 1) // chunksize
+
+        if last_row >= hists.shape[0]:
+            if size:
+                # # The file has grown since it was opened
+                hists = np.concatenate((hists, np.zeros((last_row + 1 - hists.shape[0], 256), dtype=np.int64)))
+            else:
+                while last_row >= hists.shape[0]:
+                    hists = merge_chunk_histograms(hists, pad_to=chunks * 2)
+                    chunksize *= 2
+                    last_row = (pos + read - 1) // chunksize
+
+        # # Add this block's counts to the rows of the chunks it covers
+        first_row = pos // chunksize
+        rows = np.arange(pos, pos + read, dtype=np.intp) // chunksize - first_row
+        hists[first_row : last_row + 1] += np.bincount(rows * 256 + block, minlength=(last_row + 1 - first_row) * 256).reshape(
+            -1, 256
+        )
+
+        pos += read
+
+    hists = hists[: -(-pos // chunksize)]
+
+    if not size:
+        while hists.shape[0] > chunks:
+            hists = merge_chunk_histograms(hists)
+            chunksize *= 2
+        nr_chunksize = chunksize
+
+    sizes = np.full(hists.shape[0], chunksize, dtype=np.int64)
+    if sizes.size:
+        sizes[-1] = pos - (sizes.size - 1) * chunksize
+
+    log.debug("Streamed {} bytes into {} chunks of {} bytes".format(pos, hists.shape[0], chunksize))
+
+    return hists, sizes, chunksize, nr_chunksize
+
+
+# # Sum each pair of neighbouring chunk histograms, halving the number of rows (optionally padding back up to pad_to)
+def merge_chunk_histograms(hists, pad_to=None):
+
+    if hists.shape[0] % 2:
+        hists = np.concatenate((hists, np.zeros((1, 256), dtype=hists.dtype)))
+
+    merged = hists.reshape(-1, 2, 256).sum(axis=1)
+
+    if pad_to and merged.shape[0] < pad_to:
+        merged = np.concatenate((merged, np.zeros((pad_to - merged.shape[0], 256), dtype=hists.dtype)))
+
+    return merged
+
+
+# # Count the bytes of each chunksize chunk of data (the final chunk may be short) with batched bincount passes.
+# # Returns a (chunks x 256) matrix of byte counts and the length of each chunk
+def chunk_histograms(data, chunksize):
+
+    fs = data.size
+    rows = -(-fs // chunksize)
+    full_rows = fs // chunksize
+
+    hists = np.zeros((rows, 256), dtype=np.int64)
+
+    # # View the complete chunks as a (chunks x chunksize) matrix. Offsetting each row by row * 256 lets a single
+    # # bincount produce every row's histogram. The offset array costs 8 bytes per input byte, so work in bounded passes
+    matrix = data[: full_rows * chunksize].reshape(full_rows, chunksize)
+    step = __pass_bytes__ // chunksize
+    if step:
+        for start in range(0, full_rows, step):
+            block = matrix[start : start + step]
+            offsets = np.arange(block.shape[0], dtype=np.intp)[:, None] * 256
+            hists[start : start + block.shape[0]] = np.bincount(
+                (block + offsets).ravel(), minlength=block.shape[0] * 256
+            ).reshape(-1, 256)
+    else:
+        # # Chunks bigger than a pass are counted a slice at a time
+        for row in range(full_rows):
+            hists[row] = byte_counts(matrix[row])
+
+    # # The ragged tail
+    if rows > full_rows:
+        hists[full_rows] = byte_counts(data[full_rows * chunksize :])
+
+    sizes = np.full(rows, chunksize, dtype=np.int64)
+    if rows:
+        sizes[-1] = fs - (rows - 1) * chunksize
+
+    return hists, sizes
+
+
+# # Count the occurrence of each byte value in data. bincount works on an intp copy of its input, so count in
+# # bounded slices rather than all at once
+def byte_counts(data):
+
+    counts = np.zeros(256, dtype=np.int64)
+    for start in range(0, data.size, __pass_bytes__):
+        counts += np.bincount(data[start : start + __pass_bytes__], minlength=256)
+
+    return counts
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+
+"""
+Byte pair (digram) heatmap - graph arguments
+-------------------------------------------
+Declares the graph's defaults and arguments without importing its dependencies (matplotlib, numpy etc.), so the
+command line can be set up quickly. The graph itself is in graph.py, imported when it is first used.
+"""
+
+from __future__ import absolute_import
+
+
+# # Graph defaults
+__cmap__ = "inferno"  # Colour map of the heatmap
+__parallel__ = 1  # Processes counting slices of the file, 0 uses one per CPU
+
+# Set args in args parse
+def args_setup(arg_parser):
+
+    arg_parser.add_argument(
+        "--cmap", type=str, default=__cmap__, metavar=__cmap__, help="matplotlib colour map of the heatmap"
+    )
+    arg_parser.add_argument(
+        "--parallel",
+        type=int,
+        default=__parallel__,
+        metavar=__parallel__,
+        help="Count the byte pairs of large files in slices over this many processes, 0 uses one per CPU. Slices are at least 32MiB",
+    )
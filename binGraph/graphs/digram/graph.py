@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+
+"""
+Byte pair (digram) heatmap over all file
+-------------------------------------------
+abs_fpath str:          Absolute file path - File to load and analyse
+fname str:              Filename
+
+cmap str:               matplotlib colour map of the heatmap
+parallel int:           Count the byte pairs of large files in slices over this many processes, 0 uses one per CPU
+
+Counts every pair of neighbouring bytes, drawn as a 256x256 heatmap of log occurrence: first byte down, second
+byte across. Code, text and compressed data that share a byte histogram look very different as pairs.
+"""
+from __future__ import division
+
+# # matplotlib is only imported to draw with it, or for colour maps other than the default
+from __future__ import absolute_import
+import os
+import sys
+import itertools
+import multiprocessing
+import concurrent.futures
+import numpy as np
+
+from binGraph.binfile import map_file
+from binGraph.context import bin_context, __pass_bytes__
+from binGraph.timing import stage
+
+import logging
+
+log = logging.getLogger("graph.digram")
+
+# # Graph defaults and arguments are declared by the graph package, so they can be set up without importing this module
+from binGraph.graphs.digram import __cmap__, __parallel__, args_setup
+
+__parallel_slice__ = 32 * 1024 * 1024  # Least number of bytes counted by each process with --parallel
+
+# # The default colour map (inferno) as a few stops, so the raster renderer can draw it without matplotlib
+__ramp__ = ["#000004", "#57106e", "#bc3754", "#f98e09", "#fcffa4"]
+
+
+# Validate graph specific arguments
+class ArgValidationEx(Exception):
+    pass
+
+
+def args_validation(args):
+
+    raster = getattr(args, "renderer", None) == "raster"
+    if not raster:
+        import matplotlib
+
+        matplotlib.use("Agg")
+
+        # # Test to see what matplotlib backend is setup
+        backend = matplotlib.get_backend()
+        if not backend == "TkAgg":
+            log.warning(
+                '{} matplotlib backend in use. This graph generation was tested with "TkAgg", bugs may lie ahead...'.format(backend)
+            )
+
+    # # Test to see if we should use defaults
+    if args.graphtype == "all":
+        args.cmap = __cmap__
+        args.parallel = __parallel__
+
+    # # Thumbnails draw the default colour map from its stops (__ramp__), only other colour maps need matplotlib
+    if not (raster and args.cmap == __cmap__):
+        import matplotlib
+
+        if not args.cmap in matplotlib.colormaps:
+            raise ArgValidationEx("Unknown --cmap: {}".format(args.cmap))
+
+    if args.parallel < 0:
+        raise ArgValidationEx("--parallel must be 0 or more: {}".format(args.parallel))
+
+
+# # The arguments that change the numbers analyse() produces - cached profiles are keyed on these. The pair counts
+# # are the same whatever the options
+def profile_args(**kwargs):
+
+    return {}
+
+
+# # Work out the numbers behind the graph: the count of every byte pair
+def analyse(abs_fpath, fname, parallel=__parallel__, bin_ctx=None, **kwargs):
+
+    # # Use the shared analysis of the file if we have been given one
+    if bin_ctx is None:
+        bin_ctx = bin_context(abs_fpath, fname)
+
+    jobs = parallel or os.cpu_count() or 1
+
+    with stage("count"):
+        # # Processes map the file themselves, so only files on disk can be counted in parallel
+        if jobs > 1 and os.path.isfile(bin_ctx.abs_fpath):
+            counts = parallel_digram_counts(bin_ctx.abs_fpath, bin_ctx.size, jobs)
+        else:
+            counts = digram_counts(bin_ctx.data)
+
+    log.debug('Counted {} byte pairs of "{}"'.format(int(counts.sum()), fname))
+
+    return {"digrams": counts}
+
+
+# # Count every pair of neighbouring bytes in data as a (256 x 256) matrix, first byte by second byte. Each pair is
+# # one 16 bit number, so a single bincount per pass counts them all
+def digram_counts(data):
+
+    counts = np.zeros(256 * 256, dtype=np.int64)
+
+    # # Passes overlap by a byte, so the pair across each edge is counted once
+    for start in range(0, max(data.size - 1, 0), __pass_bytes__):
+        part = data[start : start + __pass_bytes__ + 1]
+        counts += np.bincount((part[:-1].astype(np.uint16) << 8) | part[1:], minlength=256 * 256)
+
+    return counts.reshape(256, 256)
+
+
+# # Count the pairs of a file in slices, one process per slice, and add up the slices' counts. Inside a worker
+# # process (--jobs, binGraph serve) the CPUs are already busy with other files, so the file is counted in place
+def parallel_digram_counts(abs_fpath, size, jobs):
+
+    jobs = min(jobs, size // __parallel_slice__)
+    if jobs < 2 or not multiprocessing.current_process().name == "MainProcess":
+        return digram_counts(map_file(abs_fpath))
+
+    # # Each slice counts the pairs starting inside it
+    edges = np.linspace(0, size - 1, jobs + 1).astype(np.int64)
+    log.debug("Counting byte pairs with {} processes".format(jobs))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        parts = executor.map(slice_digram_counts, itertools.repeat(abs_fpath), edges[:-1].tolist(), edges[1:].tolist())
+        return sum(parts)
+
+
+# # The pairs starting from start up to end of a file, in a worker process
+def slice_digram_counts(abs_fpath, start, end):
+
+    return digram_counts(map_file(abs_fpath)[start : end + 1])
+
+
+# # Build the parts of the figure that are the same for every file: heatmap, colour bar, formatters and labels
+def build_template(cmap, interactive=False):
+
+    import matplotlib.ticker as ticker
+    from mpl_toolkits.axes_grid1 import make_axes_locatable
+    from binGraph.render import new_figure, figure_template
+
+    fig, ax = new_figure(interactive=interactive)
+    template = figure_template(fig)
+    template.ax = ax
+
+    template.image = ax.imshow(np.zeros((256, 256)), cmap=cmap, interpolation="nearest", aspect="equal")
+    colourbar = fig.colorbar(template.image, cax=make_axes_locatable(ax).append_axes("right", size="4%", pad=0.15))
+    colourbar.set_label("Occurrence (log10)")
+
+    for axis in (ax.xaxis, ax.yaxis):
+        axis.set_major_formatter(ticker.FuncFormatter(lambda x, pos: ("0x{:02X}".format(int(x)))))
+        axis.set_major_locator(ticker.MultipleLocator(0x20))
+
+    ax.set_xlabel("Second byte")
+    ax.set_ylabel("First byte")
+
+    return template
+
+
+def generate(abs_fpath, fname, cmap=__cmap__, profile=None, **kwargs):
+
+    # # Use the given (e.g. cached) numbers if we have them
+    if profile is None:
+        profile = analyse(abs_fpath, fname, **kwargs)
+
+    from binGraph.render import get_template
+
+    values = log_counts(profile)
+
+    # # Get the figure, reusing the one built for an earlier file if the options match
+    build = lambda interactive=False: build_template(cmap, interactive)
+    if kwargs.get("showplt", False):
+        template = build(interactive=True)
+    else:
+        template = get_template(("digram", cmap), build)
+
+    template.image.set_data(values)
+    template.image.set_clim(0, max(values.max(), 1))
+
+    template.ax.set_title("Byte pair heatmap: {}\n".format(fname))
+
+    return template.fig, {}, json_info(profile)
+
+
+# # Draw the graph without matplotlib (--renderer raster): the heatmap only
+def raster(abs_fpath, fname, cmap=__cmap__, profile=None, figsize=(12, 4), dpi=100, **kwargs):
+
+    from binGraph.raster import new_canvas
+
+    # # Use the given (e.g. cached) numbers if we have them
+    if profile is None:
+        profile = analyse(abs_fpath, fname, **kwargs)
+
+    values = log_counts(profile)
+    levels = np.round(values / max(values.max(), 1) * 255).astype(np.intp)
+
+    canvas = new_canvas(figsize, dpi)
+    canvas.image(colour_table(cmap)[levels])
+
+    return canvas.png(), json_info(profile)
+
+
+# # log10 of each pair's count, 0 for pairs that do not occur
+def log_counts(profile):
+
+    return np.log10(profile["digrams"] + 1.0)
+
+
+# # 256 RGBA (0-255) colours of a colour map. The default is drawn from its stops, others are looked up in matplotlib
+def colour_table(cmap):
+
+    if not cmap == __cmap__:
+        import matplotlib
+
+        return np.round(matplotlib.colormaps[cmap](np.linspace(0, 1, 256)) * 255).astype(np.uint8)
+
+    from binGraph.raster import to_rgba
+
+    stops = np.array([to_rgba(colour) for colour in __ramp__], dtype=np.float64)
+    positions = np.linspace(0, 1, len(stops))
+    levels = np.linspace(0, 1, 256)
+
+    return np.round(np.stack([np.interp(levels, positions, stops[:, i]) for i in range(4)], axis=1)).astype(np.uint8)
+
+
+def json_info(profile):
+
+    counts = profile["digrams"]
+
+    return {"pairs": int(counts.sum()), "distinct_pairs": int(np.count_nonzero(counts))}
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    logging.basicConfig(stream=sys.stderr, format="%(levelname)s | %(message)s", level=logging.DEBUG)
+    logging.getLogger("matplotlib").setLevel(logging.CRITICAL)
+    log = logging.getLogger("digram")
+
+    # ## Global graphing default values
+    __figformat__ = "png"  # Output format of saved figure
+    __figsize__ = (12, 4)  # Size of figure in inches
+    __figdpi__ = 100  # DPI of figure
+    __showplt__ = False  # Show the plot interactively
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-f",
+        "--file",
+        type=str,
+        required=True,
+        metavar="malware.exe",
+        help="Give me a graph of this file. See - if this is the only argument specified.",
+    )
+    parser.add_argument(
+        "--showplt", action="store_true", default=__showplt__, help="Show plot interactively (disables saving to file)"
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        default=__figformat__,
+        choices=["png", "pdf", "ps", "eps", "svg"],
+        required=False,
+        metavar="png",
+        help="Graph output format",
+    )
+    parser.add_argument("--figsize", type=int, nargs=2, default=__figsize__, metavar="#", help="Figure width and height in inches")
+    parser.add_argument("--dpi", type=int, default=__figdpi__, metavar=__figdpi__, help="Figure dpi")
+
+    args_setup(parser)
+
+    args = parser.parse_args()
+
+    args.graphtype = __name__
+
+    args_validation(args)
+
+    args_dict = args.__dict__
+    args_dict["abs_fpath"] = args.file
+    args_dict["fname"] = os.path.basename(args.file)
+    args_dict["abs_save_fpath"] = "{}.{}".format(os.path.basename(args_dict["abs_fpath"]), args.format)
+
+    from binGraph.render import finish_figure, show_figure
+
+    fig, save_kwargs, json_data = generate(**args_dict)
+
+    finish_figure(fig, args.figsize)
+
+    if args.showplt:
+        log.debug("Opening graph interactively")
+        show_figure(fig)
+    else:
+        fig.savefig(args_dict["abs_save_fpath"], format=args.format, dpi=args.dpi, **save_kwargs)
+        log.info('Graph saved to: "{}"'.format(args_dict["abs_save_fpath"]))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""
+Entropy and byte occurrence analysis over all file - graph arguments
+-------------------------------------------
+Declares the graph's defaults and arguments without importing its dependencies (matplotlib, numpy etc.), so the
+command line can be set up quickly. The graph itself is in graph.py, imported when it is first used.
+"""
+
+from __future__ import absolute_import
+import json
+
+
+# # Graph defaults
+__chunks__ = 750
+__ibytes__ = '[ {"name":"0\'s", "colour": "#15ff04", "bytes": [0]}, {"name":"Exploit", "bytes": [44,144], "colour":"#ff2b01"}, {"name":"Printable ASCII", "colour":"b", "bytes": [32,33,34,35,36,37,38,39,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,60,61,62,63,64,65,66,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,86,87,88,89,90,91,92,93,94,95,96,97,98,99,100,101,102,103,104,105,106,107,108,109,110,111,112,113,114,115,116,117,118,119,120,121,122,123,124,125,126]} ]'
+__ibytes_dict__ = json.loads(__ibytes__)
+__entcolour__ = "#ff00ff"
+__stream__ = False
+__pyramid__ = None
+__pyramid_blocks__ = 8192
+__zoom__ = None
+__window__ = None
+__stride__ = None
+
+# # Set args in args parse - the given parser is a sub parser
+def args_setup(arg_parser):
+    arg_parser.add_argument(
+        "-c",
+        "--chunks",
+        type=int,
+        default=__chunks__,
+        metavar="750",
+        help="Defines how many chunks the binary is split into (and therefore the amount of bytes submitted for shannon sampling per time). Higher number gives more detail",
+    )
+    arg_parser.add_argument(
+        "--ibytes",
+        type=str,
+        nargs="?",
+        metavar=' { "name":"0s", "bytes":[0] }, { "name":"Exploit", "bytes":[44, 144], "colour":"r" } ',
+        default=__ibytes__,
+        help="""
+                    Bytes occurances to add to the graph - used to add extra visability into the type of bytes included in the binary. To disable this option, set the flag without an argument.
+                    The "name" value is the name of the bytes for the legend, the "bytes" value is the bytes to count the percentage of per section, the "colour" value maybe a matplotlib colour
+                    ( r,g,b etc.), a hex with or without an alpha value, or not defined (a seeded colour is chosen). The easiest way to construct these values is to create a dictionary and convert it using \'print(json.loads(dict))\'""",
+    )
+    arg_parser.add_argument("--entcolour", type=str, metavar="#cf3da2ff", default=__entcolour__, help="Colour of the Entropy line")
+    arg_parser.add_argument(
+        "--stream",
+        action="store_true",
+        default=__stream__,
+        help="Read the file as a stream of blocks rather than mapping it. Memory use depends on --chunks, not the file size. Use for files larger than memory, or devices and pipes whose size is not known (these are split into between --chunks/2 and --chunks chunks, and graphed as --blob)",
+    )
+    arg_parser.add_argument(
+        "--pyramid",
+        type=int,
+        nargs="?",
+        const=__pyramid_blocks__,
+        default=__pyramid__,
+        metavar=__pyramid_blocks__,
+        help="Count the file in this many blocks (default {}) and sum the chunks from a pyramid of block histograms. Chunk edges fall on block edges. The pyramid is saved with --data-only, so entropy at any resolution or --zoom can be worked out from it later".format(__pyramid_blocks__),
+    )
+    arg_parser.add_argument(
+        "--zoom",
+        type=lambda x: int(x, 0),
+        nargs=2,
+        default=__zoom__,
+        metavar=("0x400", "0x2000"),
+        help="Only graph the file between these offsets, split into --chunks chunks. Uses the --pyramid",
+    )
+    arg_parser.add_argument(
+        "--window",
+        type=lambda x: int(x, 0),
+        default=__window__,
+        metavar="0x1000",
+        help="Sliding window entropy: graph the entropy of a window of this many bytes, moved along the file by --stride bytes at a time. Replaces --chunks",
+    )
+    arg_parser.add_argument(
+        "--stride",
+        type=lambda x: int(x, 0),
+        default=__stride__,
+        metavar="0x400",
+        help="Bytes the --window moves by, defaults to a quarter of the window",
+    )
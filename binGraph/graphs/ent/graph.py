@@ -14,35 +14,20 @@ ibytes list of dicts:   Dicts are interesting bytes wanting to be displayed on t
                         bytes = The bytes to represent
                         colour = The colour of the line
 entcolour str           Colour of the entropy graph
+stream bool:            Read the file as a stream of blocks, memory use is bound by the number of chunks rather than the file size
 """
 from __future__ import division
 
-# # Import graph specific libs
+# # Import graph specific libs. matplotlib is only imported to draw with it, not for --renderer raster
 from __future__ import absolute_import
-import matplotlib
-
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-from matplotlib.ticker import MaxNLocator
-
 import hashlib
 import numpy as np
 import statistics
-from collections import Counter
 import os
 import json
 import sys
 import re
-
-try:
-    import pefile
-except ImportError as e1:
-    try:
-        import lief
-    except ImportError as e2:
-        pass
-
+import functools
 
 # # Python 2/3 fix
 import json
@@ -52,39 +37,19 @@ try:
 except ImportError:
     JSONDecodeError = ValueError
 
+from binGraph.context import bin_context, bin_proxy, section_proxy, hist_pyramid, chunk_histograms, byte_counts
+from binGraph.timing import stage
+
 import logging
 
 log = logging.getLogger("graph.ent")
 
-# # Graph defaults
-__chunks__ = 750
-__ibytes__ = '[ {"name":"0\'s", "colour": "#15ff04", "bytes": [0]}, {"name":"Exploit", "bytes": [44,144], "colour":"#ff2b01"}, {"name":"Printable ASCII", "colour":"b", "bytes": [32,33,34,35,36,37,38,39,40,41,42,43,44,45,46,47,48,49,50,51,52,53,54,55,56,57,58,59,60,61,62,63,64,65,66,67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,85,86,87,88,89,90,91,92,93,94,95,96,97,98,99,100,101,102,103,104,105,106,107,108,109,110,111,112,113,114,115,116,117,118,119,120,121,122,123,124,125,126]} ]'
-__ibytes_dict__ = json.loads(__ibytes__)
-__entcolour__ = "#ff00ff"
-
-# # Set args in args parse - the given parser is a sub parser
-def args_setup(arg_parser):
-    arg_parser.add_argument(
-        "-c",
-        "--chunks",
-        type=int,
-        default=__chunks__,
-        metavar="750",
-        help="Defines how many chunks the binary is split into (and therefore the amount of bytes submitted for shannon sampling per time). Higher number gives more detail",
-    )
-    arg_parser.add_argument(
-        "--ibytes",
-        type=str,
-        nargs="?",
-        metavar=' { "name":"0s", "bytes":[0] }, { "name":"Exploit", "bytes":[44, 144], "colour":"r" } ',
-        default=__ibytes__,
-        help="""
-                    Bytes occurances to add to the graph - used to add extra visability into the type of bytes included in the binary. To disable this option, set the flag without an argument.
-                    The "name" value is the name of the bytes for the legend, the "bytes" value is the bytes to count the percentage of per section, the "colour" value maybe a matplotlib colour
-                    ( r,g,b etc.), a hex with or without an alpha value, or not defined (a seeded colour is chosen). The easiest way to construct these values is to create a dictionary and convert it using \'print(json.loads(dict))\'""",
-    )
-    arg_parser.add_argument("--entcolour", type=str, metavar="#cf3da2ff", default=__entcolour__, help="Colour of the Entropy line")
+# # Graph defaults and arguments are declared by the graph package, so they can be set up without importing this module
+from binGraph.graphs.ent import __chunks__, __ibytes__, __ibytes_dict__, __entcolour__, __stream__, __pyramid__, __zoom__, args_setup
+from binGraph.graphs.ent import __pyramid_blocks__, __window__, __stride__
 
+__window_batch__ = 2048  # Window positions worked out per batch of the sliding window entropy
+__xlogx_table__ = 1 << 20  # Largest window to keep a table of c * log(c) for, larger windows compute it
 
 # # Validate graph specific arguments - Set the defaults here
 class ArgValidationEx(Exception):
@@ -93,18 +58,50 @@ class ArgValidationEx(Exception):
 
 def args_validation(args):
 
-    # # Test to see what matplotlib backend is setup
-    backend = matplotlib.get_backend()
-    if not backend == "TkAgg":
-        log.warning(
-            '{} matplotlib backend in use. This graph generation was tested with "TkAgg", bugs may lie ahead...'.format(backend)
-        )
+    # # Thumbnails are drawn without matplotlib, so colours are checked without it too
+    if getattr(args, "renderer", None) == "raster":
+        from binGraph.raster import to_rgba_floats as to_rgba
+    else:
+        import matplotlib
+
+        matplotlib.use("Agg")
+        from matplotlib.colors import to_rgba
+
+        # # Test to see what matplotlib backend is setup
+        backend = matplotlib.get_backend()
+        if not backend == "TkAgg":
+            log.warning(
+                '{} matplotlib backend in use. This graph generation was tested with "TkAgg", bugs may lie ahead...'.format(backend)
+            )
 
     # # Test to see if we should use defaults
     if args.graphtype == "all":
         args.chunks = __chunks__
         args.ibytes = __ibytes__
         args.entcolour = __entcolour__
+        args.stream = __stream__
+        args.pyramid = __pyramid__
+        args.zoom = __zoom__
+        args.window = __window__
+        args.stride = __stride__
+
+    if args.window is not None:
+        if not args.window > 0:
+            raise ArgValidationEx("Error validating --window - the window must be at least one byte: {}".format(args.window))
+        if args.stream or args.pyramid or args.zoom:
+            raise ArgValidationEx("Error validating --window - can not be used with --stream, --pyramid or --zoom")
+        args.stride = args.stride or max(args.window // 4, 1)
+        if not args.stride > 0:
+            raise ArgValidationEx("Error validating --stride - the stride must be at least one byte: {}".format(args.stride))
+
+    # # Zooming works from the pyramid
+    if args.zoom:
+        if not 0 <= args.zoom[0] < args.zoom[1]:
+            raise ArgValidationEx("Error validating --zoom - the start must be before the end: {}".format(args.zoom))
+        args.pyramid = args.pyramid or __pyramid_blocks__
+
+    if args.pyramid is not None and not args.pyramid > 0:
+        raise ArgValidationEx("Error validating --pyramid - there must be at least one block: {}".format(args.pyramid))
 
     # # Test ibytes is jalid json
     try:
@@ -138,15 +135,17 @@ def args_validation(args):
                 for b in ib["bytes"]:
                     if not type(b) == int:
                         raise ArgValidationEx('Error validating --ibytes is not an int: "{}"'.format(b))
+                    elif not 0 <= b <= 255:
+                        raise ArgValidationEx('Error validating --ibytes is not a byte (0-255): "{}"'.format(b))
                     else:
                         ibyte["bytes"].append(b)
 
                 # # Get/set the colour if it exists
                 if not "colour" in list(ib.keys()):
                     log.warning("No colour defined for --ibytes byte range: {} {}".format(ib["name"], ib["bytes"]))
-                    ibyte["colour"] = matplotlib.colors.to_rgba(hash_colour(ib["name"]))
+                    ibyte["colour"] = hash_colour(ib["name"])
                 else:
-                    ibyte["colour"] = matplotlib.colors.to_rgba(ib["colour"])
+                    ibyte["colour"] = to_rgba(ib["colour"])
 
             else:
                 raise ArgValidationEx("Error validating --ibytes: {}".format(ib))
@@ -155,65 +154,185 @@ def args_validation(args):
 
         args.ibytes = ibytes_list
 
+    # # Compile the ibytes into a lookup matrix, so all of their percentages come from one multiply
+    args.ibytes_matrix = compile_ibytes(args.ibytes) if args.ibytes else None
+
+
+# # The arguments that change the numbers analyse() produces - cached profiles are keyed on these
+def profile_args(
+    chunks=__chunks__,
+    ibytes=__ibytes_dict__,
+    stream=__stream__,
+    blob=False,
+    pyramid=__pyramid__,
+    zoom=__zoom__,
+    window=__window__,
+    stride=__stride__,
+    **kwargs
+):
+
+    return {
+        "chunks": chunks,
+        "ibytes": [[ib["name"], ib["bytes"]] for ib in ibytes] if ibytes else [],
+        "stream": stream,
+        "blob": blob,
+        "pyramid": pyramid,
+        "zoom": list(zoom) if zoom else None,
+        "window": [window, stride] if window else None,
+    }
 
-# # Generate the graph
-def generate(abs_fpath, fname, blob, chunks=__chunks__, ibytes=__ibytes_dict__, **kwargs):
 
-    with open(abs_fpath, "rb") as fh:
-        log.debug('Opening: "{}"'.format(fname))
+# # Work out the numbers behind the graph: entropy and ibyte percentages per chunk, and file format markers
+def analyse(
+    abs_fpath,
+    fname,
+    blob,
+    chunks=__chunks__,
+    ibytes=__ibytes_dict__,
+    ibytes_matrix=None,
+    stream=__stream__,
+    pyramid=__pyramid__,
+    zoom=__zoom__,
+    window=__window__,
+    stride=__stride__,
+    bin_ctx=None,
+    **kwargs
+):
+
+    # # Use the shared analysis of the file if we have been given one
+    if bin_ctx is None:
+        bin_ctx = bin_context(abs_fpath, fname, stream=stream)
+
+    log.debug("Using ibytes: {}".format(ibytes))
+
+    if ibytes and ibytes_matrix is None:
+        ibytes_matrix = compile_ibytes(ibytes)
+
+    start = 0
+    if window:
+        # # The entropy and ibyte percentages of a window are kept up to date as it slides along the file
+        with stage("entropy"):
+            shannon_samples, percentages = sliding_ent(bin_ctx.data, window, stride, ibytes_matrix)
+        chunksize, nr_chunksize = stride, float(stride)
 
-        # # Calculate the overall chunksize
-        fs = os.fstat(fh.fileno()).st_size
-        if chunks > fs:
-            chunksize = 1
-            nr_chunksize = 1
+    else:
+        # # The bytes of every chunk are counted in one pass, every chunk's entropy is derived from the counts
+        if pyramid:
+            pyr = bin_ctx.pyramid(pyramid)
+            hists, sizes, offsets = pyr.histograms(chunks, *zoom_range(zoom, bin_ctx.size, fname))
+
+            # # Pyramid chunks are only about the same size
+            start = int(offsets[0]) if len(offsets) else 0
+            nr_chunksize = float(sizes.sum() / len(sizes)) if len(sizes) else 1
+            chunksize = int(round(nr_chunksize))
         else:
-            chunksize = -(-fs // chunks)
-            nr_chunksize = fs / chunks
+            hists, sizes = bin_ctx.chunk_histograms(chunks)
 
-        log.debug("Filesize: {}, Chunksize (rounded): {}, Chunksize: {}, Chunks: {}".format(fs, chunksize, nr_chunksize, chunks))
-        log.debug("Using ibytes: {}".format(ibytes))
-        log.debug("Producing shannon ent with chunksize {}".format(chunksize))
+            # # The overall chunksize (only known after counting when streaming)
+            chunksize, nr_chunksize = bin_ctx.chunksize(chunks)
 
-        for index, _ in enumerate(ibytes):
-            ibytes[index]["percentages"] = []
+        with stage("entropy"):
+            shannon_samples = shannon_ent_chunks(hists, sizes)
+
+        # # Calculate percentages of given bytes, if provided
+        if ibytes:
+            # # (chunks x 256) . (256 x ibytes) gives the occurrences of every ibyte group in every chunk
+            with stage("ibytes"):
+                percentages = ((hists @ ibytes_matrix) / sizes[:, None]) * 100
+        else:
+            percentages = np.zeros((len(sizes), 0))
 
-        shannon_samples = []
-        for chunk in get_chunk(fh, chunksize=chunksize):
+    fs = bin_ctx.size
+    log.debug(
+        "Filesize: {}, Chunksize (rounded): {}, Chunksize: {}, Chunks: {}".format(fs, chunksize, nr_chunksize, len(shannon_samples))
+    )
 
-            # # Calculate ent
-            ent = shannon_ent(chunk)
-            shannon_samples.append(ent)
+    profile = {
+        "entropy": shannon_samples,
+        "ibytes": percentages,
+        "size": int(fs),
+        "chunksize": int(chunksize),
+        "nr_chunksize": float(nr_chunksize),
+        "format": None,
+        "entrypoint": None,
+        "sections": [],
+    }
 
-            # # Calculate percentages of given bytes, if provided
-            if ibytes:
-                cbytes = Counter(chunk)
+    # # Bytes in each window, the window at x starts at x * stride
+    if window:
+        profile["window"] = min(window, int(fs))
 
-                for index, _ in enumerate(ibytes):
-                    occurrence = 0
-                    for b in ibytes[index]["bytes"]:
-                        occurrence += cbytes[b]
+    # # Offsets of the first chunk and the end of the last, and the finest level of the pyramid (see profile_pyramid)
+    if pyramid:
+        profile["start"] = start
+        profile["end"] = int(offsets[-1] + sizes[-1]) if len(offsets) else start
+        profile["pyramid"], profile["pyramid_sizes"] = pyr.levels[0]
 
-                    ibytes[index]["percentages"].append((float(occurrence) / float(len(chunk))) * 100)
+    # # Filetype specific additions. Streamed devices and pipes can not be read again for the sections' byte counts
+    if blob:
+        log.warning("Parsing file as blob (as requested)")
+    elif not bin_ctx.seekable:
+        log.warning('Parsing "{}" as blob, it can only be read as a stream'.format(fname))
+    else:
 
-    log.debug('Closed: "{}"'.format(fname))
+        bp = bin_ctx.get_bin_proxy()
 
-    # # Create the figure
-    fig, host = plt.subplots()
-    parsedbin = ""
-    log.debug("Plotting shannon samples")
-    host.plot(np.array(shannon_samples), label="Entropy", c=kwargs["entcolour"], zorder=1001, linewidth=1.2)
+        if None in (bp.bin, bp.type):
+            log.warning("Failed to parse binary format, parsing like --blob")
+
+        elif bp.type == "PE":
+
+            profile["format"] = bp.type
+
+            # # Entrypoint (EP) pointer
+            profile["entrypoint"] = bp.get_physical_from_rva(bp.get_virtual_ep())
+            log.debug("{}: {}".format("Entrypoint", hex(bp.get_virtual_ep())))
+
+            for index, section in bp.sections():
+                profile["sections"].append(
+                    {"name": section.name, "offset": section.offset, "size": section.size, "virtual_size": section.virtual_size}
+                )
+
+            with stage("sections"):
+                profile["section_stats"] = section_stats(bin_ctx, profile["sections"], ibytes, ibytes_matrix)
+
+        else:
+            log.debug("File is a currently unsupported format - (supported by lief, not yet supported by binGraph)")
+
+    return profile
+
+
+# # Build the parts of the figure that are the same for every file: axes, formatters, lines and legends
+def build_template(ibytes, entcolour, interactive=False):
+
+    import matplotlib.ticker as ticker
+    from matplotlib.ticker import MaxNLocator
+    from binGraph.render import new_figure, figure_template
+
+    fig, host = new_figure(interactive=interactive)
+    template = figure_template(fig)
+    template.host = host
+
+    # # The chunksize and first offset of the file being drawn, used to label the offsets
+    template.chunksize = 1
+    template.start = 0
 
-    host.set_ylabel("Entropy\n".format(chunksize))
+    template.entropy = host.plot([], [], label="Entropy", c=entcolour, zorder=1001, linewidth=1.2)[0]
+
+    host.set_ylabel("Entropy\n")
     host.set_xlabel("File offset")
-    host.xaxis.set_major_formatter(ticker.FuncFormatter(lambda x, pos: ("0x{:02X}".format(int(x * chunksize)))))
+    host.xaxis.set_major_formatter(
+        ticker.FuncFormatter(lambda x, pos: ("0x{:02X}".format(int(x * template.chunksize) + template.start)))
+    )
     host.xaxis.set_major_locator(MaxNLocator(10))
-    plt.xticks(rotation=-10, ha="left")
+    for label in host.get_xticklabels():
+        label.set(rotation=-10, ha="left")
 
     # # Draw the graphs in order
     zorder = 1000
 
     # # Plot individual byte percentages
+    template.ibytes = []
     if ibytes:
 
         axBytePc = host.twinx()
@@ -222,247 +341,264 @@ def generate(abs_fpath, fname, blob, chunks=__chunks__, ibytes=__ibytes_dict__,
 
         for index, _ in enumerate(ibytes):
             c = ibytes[index]["colour"]
-            axBytePc.plot(
-                np.array(ibytes[index]["percentages"]), label=ibytes[index]["name"], c=c, zorder=zorder, linewidth=1.2, alpha=0.75
+            template.ibytes.append(
+                axBytePc.plot([], [], label=ibytes[index]["name"], c=c, zorder=zorder, linewidth=1.2, alpha=0.75)[0]
             )
             zorder -= 1
 
         axBytePc.set_ybound(lower=-0.3, upper=101)
 
-    # # Amount of space required between the title and graph elements (such as the section name)
-    # # Append a \n if you need more space!
-    title_gap = "\n"
+    # # Markers are drawn below the lines
+    template.zorder = zorder
 
-    # # Filetype specific additions
-    if blob:
-        log.warning("Parsing file as blob (as requested)")
+    host.set_ybound(lower=0, upper=1.05)
+
+    # # Add legends (adjust for different options given)
+    template.legends = []
+    if ibytes:
+        template.legends.append(host.legend(loc="upper left", bbox_to_anchor=(1.1, 1), frameon=False))
+        template.legends.append(axBytePc.legend(loc="upper left", bbox_to_anchor=(1.1, 0.85), frameon=False))
     else:
+        template.legends.append(host.legend(loc="upper left", bbox_to_anchor=(1.01, 1), frameon=False))
 
-        bp = bin_proxy(abs_fpath)
+    return template
 
-        if None in (bp.bin, bp.type):
-            log.warning("Failed to parse binary format, parsing like --blob")
 
-        else:
+# # Generate the graph
+def generate(abs_fpath, fname, blob, ibytes=__ibytes_dict__, entcolour=__entcolour__, profile=None, **kwargs):
 
-            if bp.type == "PE":
+    # # Use the given (e.g. cached) numbers if we have them
+    if profile is None:
+        profile = analyse(abs_fpath, fname, blob, ibytes=ibytes, **kwargs)
 
-                log.debug("Adding PE customisations")
+    shannon_samples = profile["entropy"]
+    chunksize = profile["chunksize"]
+    nr_chunksize = profile["nr_chunksize"]
 
-                # # Entrypoint (EP) pointer and vline
-                phy_ep_pointer = bp.get_physical_from_rva(bp.get_virtual_ep())
-                if phy_ep_pointer:
-                    phy_ep_pointer = phy_ep_pointer / nr_chunksize
-                    log.debug("{}: {}".format("Entrypoint", hex(bp.get_virtual_ep())))
+    from binGraph.render import get_template
 
-                    host.axvline(x=phy_ep_pointer, linestyle=":", c="#0000ff", zorder=zorder - 1)
-                    host.text(x=phy_ep_pointer, y=1.07, s="EntryPoint", color="b", rotation=45, va="bottom", ha="left")
+    # # Get the figure, reusing the one built for an earlier file if the options match
+    if kwargs.get("showplt", False):
+        template = build_template(ibytes, entcolour, interactive=True)
+    else:
+        key = ("ent", entcolour, tuple((ib["name"], str(ib["colour"])) for ib in ibytes) if ibytes else ())
+        template = get_template(key, lambda: build_template(ibytes, entcolour))
 
-                end_of_last_section = 0
-                longest_section_name = 0
+    host = template.host
+    template.chunksize = chunksize
+    template.start = start = profile.get("start", 0)
 
-                # # Section vlines
-                for index, section in bp.sections():
-                    zorder -= 1
+    # # Only draw markers within the graph when zoomed in
+    zoomed = start > 0 or profile.get("end", profile["size"]) < profile["size"]
+    in_view = lambda x: not zoomed or 0 <= x <= len(shannon_samples)
 
-                    section_name = safe_section_name(section.name, index)
-                    section_offset = section.offset / nr_chunksize
-                    section_size = section.size / nr_chunksize
+    log.debug("Plotting shannon samples")
+    x = np.arange(len(shannon_samples)) + window_centre(profile)
+    template.entropy.set_data(x, shannon_samples)
 
-                    log.debug("{}: {}".format(section_name, hex(section.offset)))
+    # # Plot individual byte percentages
+    for index, line in enumerate(template.ibytes):
+        line.set_data(x, profile["ibytes"][:, index])
 
-                    host.axvline(x=section_offset, linestyle="--", zorder=zorder)
-                    host.text(x=section_offset, y=1.07, s=section_name, rotation=45, va="bottom", ha="left")
+    zorder = template.zorder
 
-                    # # Get end of last section
-                    if (section_offset + section_size) > end_of_last_section:
-                        end_of_last_section = section_offset + section_size
+    # # Amount of space required between the title and graph elements (such as the section name)
+    # # Append a \n if you need more space!
+    title_gap = "\n"
 
-                    # # Get longest section name
-                    longest_section_name = len(section_name) if len(section_name) > longest_section_name else longest_section_name
+    # # Filetype specific additions
+    if profile["format"] == "PE":
 
-                # # End of final section vline
-                host.axvline(x=end_of_last_section, linestyle="--", zorder=zorder)
-                host.text(x=end_of_last_section, y=1.07, s="Overlay", color="b", rotation=45, va="bottom", ha="left")
+        log.debug("Adding PE customisations")
 
-                # # Eval the space required to show the section names
-                if longest_section_name <= 9:
-                    title_gap = "\n\n"
-                elif longest_section_name <= 15:
-                    title_gap = "\n\n\n"
+        # # Entrypoint (EP) pointer and vline
+        phy_ep_pointer = profile["entrypoint"]
+        if phy_ep_pointer:
+            phy_ep_pointer = (phy_ep_pointer - start) / nr_chunksize
 
-            elif bp.type == "ELF":
+            if in_view(phy_ep_pointer):
+                template.add_marker(host.axvline(x=phy_ep_pointer, linestyle=":", c="#0000ff", zorder=zorder - 1))
+                template.add_marker(
+                    host.text(x=phy_ep_pointer, y=1.07, s="EntryPoint", color="b", rotation=45, va="bottom", ha="left")
+                )
 
-                log.debug("Adding ELF customisations")
+        end_of_last_section = 0
+        longest_section_name = 0
 
-                # # Entrypoint (EP) pointer and vline
-                phy_ep_pointer = parsedbin.virtual_address_to_offset(parsedbin.header.entrypoint) / nr_chunksize
-                log.debug("{}: {}".format("Entrypoint", hex(parsedbin.header.entrypoint)))
+        # # Section vlines
+        for index, section in enumerate(profile["sections"]):
+            zorder -= 1
 
-                host.axvline(x=phy_ep_pointer, linestyle=":", c="r", zorder=zorder - 1)
-                host.text(x=phy_ep_pointer, y=1.07, s="Entry", rotation=45, va="bottom", ha="left")
+            section_name = safe_section_name(section["name"], index)
+            section_offset = (section["offset"] - start) / nr_chunksize
+            section_size = section["size"] / nr_chunksize
 
-                longest_section_name = 0
-                # # Section vlines
-                for index, section in enumerate(parsedbin.sections):
-                    zorder -= 1
+            log.debug("{}: {}".format(section_name, hex(section["offset"])))
 
-                    section_name = safe_section_name(section.name, index)
-                    section_offset = section.offset / nr_chunksize
+            if in_view(section_offset):
+                template.add_marker(host.axvline(x=section_offset, linestyle="--", zorder=zorder))
+                template.add_marker(host.text(x=section_offset, y=1.07, s=section_name, rotation=45, va="bottom", ha="left"))
 
-                    log.debug("{}: {}".format(section_name, hex(section.offset)))
+            # # Get end of last section
+            if (section_offset + section_size) > end_of_last_section:
+                end_of_last_section = section_offset + section_size
 
-                    host.axvline(x=section_offset, linestyle="--", zorder=zorder)
-                    host.text(x=section_offset, y=1.07, s=section_name, rotation=45, va="bottom", ha="left")
+            # # Get longest section name
+            longest_section_name = len(section_name) if len(section_name) > longest_section_name else longest_section_name
 
-                    # # Get longest section name
-                    longest_section_name = len(section_name) if len(section_name) > longest_section_name else longest_section_name
+        # # End of final section vline
+        if in_view(end_of_last_section):
+            template.add_marker(host.axvline(x=end_of_last_section, linestyle="--", zorder=zorder))
+            template.add_marker(
+                host.text(x=end_of_last_section, y=1.07, s="Overlay", color="b", rotation=45, va="bottom", ha="left")
+            )
 
-                # # Eval the space required to show the section names
-                if longest_section_name <= 5:
-                    title_gap = "\n" * 2
-                elif longest_section_name <= 9:
-                    title_gap = "\n" * 3
-                elif longest_section_name <= 15:
-                    title_gap = "\n" * 4
+        # # Eval the space required to show the section names
+        if longest_section_name <= 9:
+            title_gap = "\n\n"
+        elif longest_section_name <= 15:
+            title_gap = "\n\n\n"
 
-            else:
-                log.debug("File is a currently unsupported format - (supported by lief, not yet supported by binGraph)")
+    # # Plot the entropy graph. Sliding windows do not reach the end of the file, it is shown all the same
+    upper = len(shannon_samples)
+    if profile.get("window"):
+        upper = profile["size"] / nr_chunksize
+    host.set_xbound(lower=-0.5, upper=upper + 0.5)
 
-    # # Plot the entropy graph
-    host.set_xbound(lower=-0.5, upper=len(shannon_samples) + 0.5)
-    host.set_ybound(lower=0, upper=1.05)
+    host.set_title("{title_gap}".format(title_gap=title_gap))
 
-    # # Add legends + title (adjust for different options given)
-    legends = []
-    if ibytes:
-        legends.append(host.legend(loc="upper left", bbox_to_anchor=(1.1, 1), frameon=False))
-        legends.append(axBytePc.legend(loc="upper left", bbox_to_anchor=(1.1, 0.85), frameon=False))
-    else:
-        legends.append(host.legend(loc="upper left", bbox_to_anchor=(1.01, 1), frameon=False))
+    # # Return the figure, kwargs for the fig.savefig function, and additional information for json data
+    return template.fig, {"bbox_inches": "tight", "bbox_extra_artists": tuple(template.legends)}, json_info(fname, profile)
 
-    host.set_title("{title_gap}".format(title_gap=title_gap))
 
-    # # Return the plt, kwargs for the plt.savefig function, and additional information for json data
-    json_data = {
-        "title": fname,
-        "info": {"Mean": statistics.mean(shannon_samples), "Standard deviation": statistics.stdev(shannon_samples)},
-    }
+# # Draw the graph without matplotlib (--renderer raster): the entropy and ibyte lines, and the PE markers
+def raster(abs_fpath, fname, blob, ibytes=__ibytes_dict__, entcolour=__entcolour__, profile=None, figsize=(12, 4), dpi=100, **kwargs):
 
-    return plt, {"bbox_inches": "tight", "bbox_extra_artists": tuple(legends)}, json_data
+    from binGraph.raster import new_canvas, to_rgba
 
+    # # Use the given (e.g. cached) numbers if we have them
+    if profile is None:
+        profile = analyse(abs_fpath, fname, blob, ibytes=ibytes, **kwargs)
 
-# ### Helper functions
+    shannon_samples = profile["entropy"]
+    nr_chunksize = profile["nr_chunksize"]
 
-# # Abstracts the bin properties away from specific library calls enabling lief and pefile usage
-class bin_proxy(object):
-    """Abstract for different binary parsers types in use"""
+    start = profile.get("start", 0)
 
-    def __init__(self, abs_fpath, lib=None):
-        super(bin_proxy, self).__init__()
-        self.abs_fpath = abs_fpath
+    canvas = new_canvas(figsize, dpi)
+    canvas.xlim = (-0.5, (profile["size"] / nr_chunksize if profile.get("window") else len(shannon_samples)) + 0.5)
+    x0 = window_centre(profile)
 
-        if lib:
-            self.lib = lib
-        else:
+    # # Markers first, the lines are drawn over them. Markers outside of the canvas are not drawn
+    if profile["format"] == "PE":
 
-            if "pefile" in sys.modules:
-                self.lib = "pefile"
-            elif "lief" in sys.modules:
-                self.lib = "lief"
-            else:
-                # # We dont have a parser
-                return None, None
+        if profile["entrypoint"]:
+            canvas.vline((profile["entrypoint"] - start) / nr_chunksize, to_rgba("#0000ff"), dash=(1, 2))
 
-        self.bin, self.type = None, None
-        self.__parse_bin()
+        end_of_last_section = 0
+        for section in profile["sections"]:
+            canvas.vline((section["offset"] - start) / nr_chunksize, to_rgba("C0"), dash=(4, 2))
+            end_of_last_section = max(end_of_last_section, (section["offset"] + section["size"] - start) / nr_chunksize)
 
-    class __ParseError(Exception):
+        canvas.vline(end_of_last_section, to_rgba("C0"), dash=(4, 2))
 
-        pass
+    # # Plot individual byte percentages, in the same order as the matplotlib graph
+    if ibytes:
+        for index in reversed(range(len(ibytes))):
+            canvas.plot(profile["ibytes"][:, index], (-0.3, 101), to_rgba(ibytes[index]["colour"], alpha=0.75), x0=x0)
 
-    def __parse_bin(self):
+    canvas.plot(shannon_samples, (0, 1.05), to_rgba(entcolour), x0=x0)
 
-        if self.lib == "lief":
-            try:
-                self.bin = lief.parse(filepath=self.abs_fpath)
-                if type(self.bin) == lief.PE.Binary:
-                    self.type = "PE"
-                    log.debug("Parsed with lief as: {}".format(self.type))
-                else:
-                    log.debug("File is a currently unsupported format: {}".format(self.type))
+    return canvas.png(), json_info(fname, profile)
 
-            except lief.bad_file as e:
-                log.warning("Failed to parse with lief: {}".format(e))
 
-        elif self.lib == "pefile":
-            try:
-                self.bin = pefile.PE(self.abs_fpath)
-                self.type = "PE"
+# # Entropy of chunks chunks between the start and end offsets, from a histogram pyramid: bin_context.pyramid(), or
+# # profile_pyramid() of a profile saved with --pyramid --data-only. Returns the entropy and offset of each chunk
+def pyramid_entropy(pyramid, chunks, start=0, end=None):
 
-                log.debug("Parsed with pefile as: {}".format(self.type))
+    hists, sizes, offsets = pyramid.histograms(chunks, start, end)
+    return shannon_ent_chunks(hists, sizes), offsets
 
-            except pefile.PEFormatError as e:
-                log.warning("Failed to parse with pefile: {}".format(e))
 
-    def get_virtual_ep(self):
+# # The histogram pyramid of a profile analysed with --pyramid
+def profile_pyramid(profile):
 
-        if self.lib == "lief":
-            return self.bin.optional_header.addressof_entrypoint
-        elif self.lib == "pefile":
-            return self.bin.OPTIONAL_HEADER.AddressOfEntryPoint
+    return hist_pyramid(np.asarray(profile["pyramid"], dtype=np.int64), np.asarray(profile["pyramid_sizes"], dtype=np.int64))
 
-    def get_physical_from_rva(self, rva):
 
-        if self.lib == "lief":
-            return self.bin.rva_to_offset(rva)
-        elif self.lib == "pefile":
-            return self.bin.get_physical_by_rva(rva)
+# ### Helper functions
 
-    def sections(self):
+# # The --zoom range clamped to the file. A range starting at or past the end of the file has nothing to draw, the
+# # whole file is drawn instead
+def zoom_range(zoom, size, fname=None):
 
-        index = 0
-        sections = []
+    if not zoom:
+        return 0, size
 
-        for lib_section in self.bin.sections:
+    start, end = zoom
+    if start >= size:
+        log.warning('--zoom 0x{:X} 0x{:X} is past the end of "{}" (0x{:X} bytes), using the whole file'.format(start, end, fname, size))
+        return 0, size
 
-            section = section_proxy(self.lib, lib_section)
+    return start, min(end, size)
 
-            yield index, section
-            index += 1
 
+# # Sliding window values are drawn at the centre of their window, in strides from the window's start
+def window_centre(profile):
 
-# # Part of bin_proxy - abstracts section calls
-class section_proxy(object):
-    """Abstract for different binary parsers types in use"""
+    return profile["window"] / profile["nr_chunksize"] / 2 if profile.get("window") else 0
 
-    def __init__(self, lib, lib_section):
-        super(section_proxy, self).__init__()
-        self.lib = lib
-        self.lib_section = lib_section
 
-        if self.lib == "lief":
-            self.name = lib_section.name
-            self.offset = lib_section.offset
-        elif self.lib == "pefile":
-            self.name = str(lib_section.Name.rstrip(b"\x00").decode("utf-8"))
-            self.offset = self.lib_section.PointerToRawData
-            self.size = self.lib_section.SizeOfRawData
+# # Additional information for json data
+def json_info(fname, profile):
 
+    # # Files no larger than one window (or one stride on), or zoomed ranges within one block, give fewer than two
+    # # samples: their statistics are left out
+    shannon_samples = profile["entropy"].tolist()
+    info = {}
+    if len(shannon_samples) > 0:
+        info["Mean"] = statistics.mean(shannon_samples)
+    if len(shannon_samples) > 1:
+        info["Standard deviation"] = statistics.stdev(shannon_samples)
 
-# # Read files as chunks
-def get_chunk(fh, chunksize=8192):
-    while True:
-        chunk = fh.read(chunksize)
+    if profile.get("section_stats"):
+        info["Sections"] = profile["section_stats"]
 
-        # # Convert to bytearray if not python 3
-        if sys.version_info[0] <= 3:
-            chunk = bytearray(chunk)
+    return {"title": fname, "info": info}
 
-        if chunk:
-            yield list(chunk)
-        else:
-            break
+
+# # Entropy, sizes and ibyte percentages of each section's raw data, and of the overlay after the last section. The
+# # byte counts of each are summed from the chunk histograms already counted, only the bytes at the edges are read
+def section_stats(bin_ctx, sections, ibytes=None, ibytes_matrix=None):
+
+    fs = bin_ctx.size
+    ranges = [(section["name"], section["offset"], section["size"], section["virtual_size"]) for section in sections]
+
+    end_of_last_section = max([offset + size for _, offset, size, _ in ranges] or [0])
+    if end_of_last_section < fs:
+        ranges.append(("Overlay", end_of_last_section, fs - end_of_last_section, None))
+
+    stats = []
+    for name, offset, size, virtual_size in ranges:
+        hist = bin_ctx.range_histogram(offset, offset + size)
+        counted = int(hist.sum())
+
+        stat = {
+            "name": name,
+            "offset": int(offset),
+            "size": int(size),
+            "virtual_size": None if virtual_size is None else int(virtual_size),
+            "raw_virtual_ratio": (size / virtual_size) if virtual_size else None,
+            "entropy": float(shannon_ent_chunks(hist[None, :], np.array([counted]))[0]) if counted else 0.0,
+            "ibytes": {},
+        }
+        if ibytes:
+            percentages = (hist @ ibytes_matrix) / counted * 100 if counted else np.zeros(len(ibytes))
+            stat["ibytes"] = {ib["name"]: float(percentage) for ib, percentage in zip(ibytes, percentages)}
+
+        stats.append(stat)
+
+    return stats
 
 
 # # Some samples may have a corrupt section name (e.g. 206c0533ce9bf83ecdf904bec2f3532d)
@@ -481,21 +617,103 @@ def safe_section_name(s_name, index):
 def hash_colour(text):
 
     name_colour = int("F" + hashlib.md5(text.encode("utf-8")).hexdigest()[:4], base=16)
-    np.random.seed(int(name_colour))
-    return matplotlib.colors.to_rgba(
-        np.random.rand(
-            3,
+    # # Own random state (rather than seeding numpy's global one) so it is safe to use from threads
+    return tuple(float(c) for c in np.random.RandomState(int(name_colour)).rand(3)) + (1.0,)
+
+
+# # Compile ibytes into a (256 x ibytes) matrix. Each column holds how many times each byte value is counted for that
+# # ibyte group (usually 0 or 1)
+def compile_ibytes(ibytes):
+
+    matrix = np.zeros((256, len(ibytes)), dtype=np.float64)
+    for index, ib in enumerate(ibytes):
+        np.add.at(matrix[:, index], ib["bytes"], 1)
+
+    return matrix
+
+
+# # Calculate the entropy of every row of a (chunks x 256) byte count matrix at once
+def shannon_ent_chunks(hists, sizes, base=256):
+    norm_counts = hists / sizes[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_counts = np.where(norm_counts > 0, np.log(norm_counts), 0.0)
+    # # Rows of a single byte value sum to -0.0, which would show in the json info
+    return np.maximum(-(norm_counts * log_counts / np.log(base)).sum(axis=1), 0.0)
+
+
+# # Entropy of a window of window bytes moved along data stride bytes at a time, and the percentage of each ibyte
+# # group (columns of ibytes_matrix) in each window. As the window moves the bytes leaving and entering it are counted,
+# # the window's counts kept up to date from them, and so the sum of count * log(count) the entropy is worked out from
+def sliding_ent(data, window, stride, ibytes_matrix=None, base=256):
+
+    size = data.size
+    window = min(window, size)
+    positions = (size - window) // stride + 1 if window else 0
+    groups = ibytes_matrix.shape[1] if ibytes_matrix is not None else 0
+
+    entropy = np.zeros(positions)
+    percentages = np.zeros((positions, groups))
+    if not positions:
+        return entropy, percentages
+
+    if window <= __xlogx_table__:
+        table = xlogx_table(window)
+        xlogx = lambda c: table[c]
+    else:
+        xlogx = xlogx_calc
+
+    counts = byte_counts(data[:window])
+    for first in range(0, positions, __window_batch__):
+        last = min(first + __window_batch__, positions)
+
+        # # Counts of the windows at positions first + 1 .. last - 1, by adding what enters and removing what leaves
+        entering = chunk_histograms(data[window + first * stride : window + (last - 1) * stride], stride)[0]
+        leaving = chunk_histograms(data[first * stride : (last - 1) * stride], stride)[0]
+        moved = entering - leaving
+        batch = np.empty((last - first, 256), dtype=np.int64)
+        batch[0] = counts
+        np.cumsum(moved, axis=0, out=batch[1:])
+        batch[1:] += counts
+
+        # # The sum is brought up to date by adding c_new * log(c_new) - c_old * log(c_old) of only the counts that
+        # # changed at each step, starting from the sum of the batch's first window so rounding errors do not build up
+        # # over a long file
+        xlogx_sum = xlogx(counts).sum()
+        steps, changed = np.nonzero(moved)
+        changes = np.bincount(
+            steps, weights=xlogx(batch[steps + 1, changed]) - xlogx(batch[steps, changed]), minlength=last - first - 1
         )
-    )
+        sums = np.concatenate(([xlogx_sum], xlogx_sum + np.cumsum(changes)))
+
+        # # H = log(n) - sum(c * log(c)) / n, in the given base
+        entropy[first:last] = (np.log(window) - sums / window) / np.log(base)
+        if groups:
+            percentages[first:last] = (batch @ ibytes_matrix) / window * 100
+
+        counts = batch[-1]
+        if last < positions:
+            counts = counts + byte_counts(data[window + (last - 1) * stride : window + last * stride])
+            counts -= byte_counts(data[(last - 1) * stride : last * stride])
+
+    return np.maximum(entropy, 0), percentages
+
+
+# # c * log(c) for every count from 0 to n, looked up by sliding_ent rather than computed
+@functools.lru_cache(maxsize=4)
+def xlogx_table(n):
+
+    c = np.arange(n + 1, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        table = np.where(c > 0, c * np.log(c), 0.0)
+
+    return table
+
 
+def xlogx_calc(c):
 
-# # Calculate entropy given a list
-def shannon_ent(labels, base=256):
-    value, counts = np.unique(labels, return_counts=True)
-    norm_counts = counts / counts.sum()
-    e = 0
-    base = e if base is None else base
-    return -(norm_counts * np.log(norm_counts) / np.log(base)).sum()
+    c = c.astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(c > 0, c * np.log(c), 0.0)
 
 
 if __name__ == "__main__":
@@ -556,16 +774,15 @@ if __name__ == "__main__":
     args_dict["fname"] = os.path.basename(args.file)
     args_dict["abs_save_fpath"] = "{}.{}".format(os.path.basename(args_dict["abs_fpath"]), args.format)
 
-    plt, save_kwargs, json_data = generate(**args_dict)
+    from binGraph.render import finish_figure, show_figure
 
-    fig = plt.gcf()
-    fig.set_size_inches(*args.figsize, forward=True)
+    fig, save_kwargs, json_data = generate(**args_dict)
 
-    plt.tight_layout()
+    finish_figure(fig, args.figsize)
 
     if args.showplt:
         log.debug("Opening graph interactively")
-        plt.show()
+        show_figure(fig)
     else:
-        plt.savefig(args_dict["abs_save_fpath"], format=args.format, dpi=args.dpi, **save_kwargs)
+        fig.savefig(args_dict["abs_save_fpath"], format=args.format, dpi=args.dpi, **save_kwargs)
         log.info('Graph saved to: "{}"'.format(args_dict["abs_save_fpath"]))
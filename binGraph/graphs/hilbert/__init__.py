@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+"""
+Hilbert curve byte map - graph arguments
+-------------------------------------------
+Declares the graph's defaults and arguments without importing its dependencies (matplotlib, numpy etc.), so the
+command line can be set up quickly. The graph itself is in graph.py, imported when it is first used.
+"""
+
+from __future__ import absolute_import
+
+
+# # Graph defaults
+__order__ = 8  # The curve fills a 2**order x 2**order square
+__threshold__ = 0.9  # Entropy (0-1) from which bytes are coloured as high entropy
+__colours__ = ["#000000", "#1f77b4", "#d62728", "#2ca02c"]  # Zero, printable, high entropy and other bytes
+
+# Set args in args parse
+def args_setup(arg_parser):
+
+    arg_parser.add_argument(
+        "--order",
+        type=int,
+        default=__order__,
+        metavar=__order__,
+        help="Order of the Hilbert curve, it fills a 2**order pixel square (8: 256x256). Files with fewer bytes than pixels get a smaller curve with a pixel per byte",
+    )
+    arg_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=__threshold__,
+        metavar=__threshold__,
+        help="Entropy (0-1) of the surrounding bytes from which a pixel is coloured as high entropy",
+    )
+    arg_parser.add_argument(
+        "--classcolours",
+        type=str,
+        nargs=4,
+        default=__colours__,
+        metavar="#000000",
+        help="Colours of pixels that are mostly zero, printable ASCII, high entropy, or other bytes",
+    )
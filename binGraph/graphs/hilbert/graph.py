@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+
+"""
+Hilbert curve byte map over all file
+-------------------------------------------
+abs_fpath str:          Absolute file path - File to load and analyse
+fname str:              Filename
+
+order int:              The curve fills a 2**order x 2**order square. Files with fewer bytes than pixels get the smallest
+                        curve with a pixel per byte
+threshold float:        Entropy (0-1) of the surrounding bytes from which a pixel is coloured as high entropy
+classcolours list:      Colours of pixels that are mostly zero, printable ASCII, high entropy, or other bytes
+
+The file is laid along a Hilbert curve, so bytes that are close in the file stay close in the picture. Each pixel
+is coloured by the class of most of its bytes, or as high entropy if the entropy of the (at least
+__entropy_block__ byte) block around it reaches the threshold.
+"""
+from __future__ import division
+
+# # matplotlib is only imported to draw with it, not for --renderer raster
+from __future__ import absolute_import
+import os
+import sys
+import functools
+import numpy as np
+
+from binGraph.context import bin_context, chunk_histograms, __pass_bytes__
+from binGraph.timing import stage
+from binGraph.graphs.ent.graph import shannon_ent_chunks
+
+import logging
+
+log = logging.getLogger("graph.hilbert")
+
+# # Graph defaults and arguments are declared by the graph package, so they can be set up without importing this module
+from binGraph.graphs.hilbert import __order__, __threshold__, __colours__, args_setup
+
+__max_order__ = 12  # Largest curve, 4096x4096 pixels
+__entropy_block__ = 1024  # Least number of bytes the entropy of a pixel is worked out over
+__classes__ = ["Zero", "Printable", "High entropy", "Other"]  # Pixel classes, in the order of their colours
+__empty__ = len(__classes__)  # Pixels past the end of the file
+
+# # Printable ASCII bytes, and the class of a pixel from its most common kind of byte: zero, printable or other
+__printable__ = np.zeros(256, dtype=bool)
+__printable__[0x20:0x7F] = True
+__printable__[[0x09, 0x0A, 0x0D]] = True
+__dominant__ = np.array([0, 1, 3], dtype=np.uint8)
+
+
+# Validate graph specific arguments
+class ArgValidationEx(Exception):
+    pass
+
+
+def args_validation(args):
+
+    # # Thumbnails are drawn without matplotlib, so colours are checked without it too
+    if getattr(args, "renderer", None) == "raster":
+        from binGraph.raster import to_rgba_floats as to_rgba
+    else:
+        import matplotlib
+
+        matplotlib.use("Agg")
+        from matplotlib.colors import to_rgba
+
+        # # Test to see what matplotlib backend is setup
+        backend = matplotlib.get_backend()
+        if not backend == "TkAgg":
+            log.warning(
+                '{} matplotlib backend in use. This graph generation was tested with "TkAgg", bugs may lie ahead...'.format(backend)
+            )
+
+    # # Test to see if we should use defaults
+    if args.graphtype == "all":
+        args.order = __order__
+        args.threshold = __threshold__
+        args.classcolours = list(__colours__)
+
+    if not 0 < args.order <= __max_order__:
+        raise ArgValidationEx("--order must be from 1 to {}: {}".format(__max_order__, args.order))
+
+    if not 0 <= args.threshold <= 1:
+        raise ArgValidationEx("--threshold must be from 0 to 1: {}".format(args.threshold))
+
+    try:
+        args.classcolours = [to_rgba(colour) for colour in args.classcolours]
+    except ValueError as e:
+        raise ArgValidationEx("Error parsing --classcolours: {}".format(e))
+
+
+# # The arguments that change the numbers analyse() produces - cached profiles are keyed on these
+def profile_args(order=__order__, threshold=__threshold__, **kwargs):
+
+    return {"order": order, "threshold": threshold}
+
+
+# # Work out the numbers behind the graph: the class of every pixel along the curve
+def analyse(abs_fpath, fname, order=__order__, threshold=__threshold__, bin_ctx=None, **kwargs):
+
+    # # Use the shared analysis of the file if we have been given one
+    if bin_ctx is None:
+        bin_ctx = bin_context(abs_fpath, fname)
+
+    data = bin_ctx.data
+    fs = data.size
+
+    order = curve_order(fs, order)
+    per_pixel = max(-(-fs // 4**order), 1)
+    log.debug("Filesize: {}, Curve: {}x{}, Bytes per pixel: {}".format(fs, 1 << order, 1 << order, per_pixel))
+
+    with stage("classify"):
+        classes = classify(data, per_pixel, threshold)
+
+    return {"classes": classes, "order": order, "bytes_per_pixel": per_pixel, "size": fs}
+
+
+# # The smallest curve order (up to order) with at least as many pixels as bytes
+def curve_order(size, order):
+
+    curve = 1
+    while curve < order and 4**curve < size:
+        curve += 1
+
+    return curve
+
+
+# # The class (index into __classes__) of each per_pixel bytes of data. Worked out in bounded passes over the data,
+# # each pass a whole number of entropy blocks
+def classify(data, per_pixel, threshold):
+
+    fs = data.size
+    block_pixels = -(-__entropy_block__ // per_pixel)
+    block = block_pixels * per_pixel
+    step = block * max(__pass_bytes__ // block, 1)
+
+    classes = np.empty(-(-fs // per_pixel), dtype=np.uint8)
+    for start in range(0, fs, step):
+        part = data[start : start + step]
+        edges = np.arange(0, part.size, per_pixel)
+
+        # # Count the zero, printable and other bytes of each pixel
+        counts = np.empty((3, len(edges)), dtype=np.int64)
+        counts[0] = np.add.reduceat(part == 0, edges, dtype=np.int64)
+        counts[1] = np.add.reduceat(__printable__[part], edges, dtype=np.int64)
+        counts[2] = np.diff(np.append(edges, part.size)) - counts[0] - counts[1]
+        pixels = __dominant__[np.argmax(counts, axis=0)]
+
+        # # High entropy blocks override the kind of byte
+        hists, sizes = chunk_histograms(part, block)
+        high = np.repeat(shannon_ent_chunks(hists, sizes) >= threshold, block_pixels)[: len(edges)]
+        pixels[high] = 2
+
+        classes[start // per_pixel : start // per_pixel + len(edges)] = pixels
+
+    return classes
+
+
+# # The flat image index (y * side + x) of each step along the Hilbert curve of the given order. The same for every
+# # file, so worked out once per order
+@functools.lru_cache(maxsize=4)
+def hilbert_curve(order):
+
+    side = 1 << order
+    t = np.arange(side * side, dtype=np.int64)
+    x = np.zeros_like(t)
+    y = np.zeros_like(t)
+
+    # # The classic d2xy, for every step at once: each pair of bits places the point in a quadrant of the next size up
+    s = 1
+    while s < side:
+        rx = 1 & (t // 2)
+        ry = 1 & (t ^ rx)
+
+        # # Rotate the quadrant
+        flip = ry == 0
+        mirror = flip & (rx == 1)
+        x = np.where(mirror, s - 1 - x, x)
+        y = np.where(mirror, s - 1 - y, y)
+        x, y = np.where(flip, y, x), np.where(flip, x, y)
+
+        x += s * rx
+        y += s * ry
+        t //= 4
+        s *= 2
+
+    index = (y * side + x).astype(np.intp)
+    index.flags.writeable = False
+
+    return index
+
+
+# # The (side x side x 4) image of a profile, each pixel's colour taken from palette (one row per class, then empty)
+def curve_image(profile, palette):
+
+    order = int(profile["order"])
+    side = 1 << order
+    classes = profile["classes"]
+
+    flat = np.full(side * side, __empty__, dtype=np.uint8)
+    flat[hilbert_curve(order)[: len(classes)]] = classes
+
+    return np.asarray(palette)[flat].reshape(side, side, -1)
+
+
+# # The share of the pixels in each class
+def json_info(profile):
+
+    classes = profile["classes"]
+    counts = np.bincount(classes, minlength=len(__classes__))[: len(__classes__)]
+
+    return {
+        "order": int(profile["order"]),
+        "bytes_per_pixel": int(profile["bytes_per_pixel"]),
+        "classes": {name: (float(count / len(classes)) if len(classes) else 0.0) for name, count in zip(__classes__, counts)},
+    }
+
+
+# # Build the parts of the figure that are the same for every file: image, labels and legend
+def build_template(order, classcolours, interactive=False):
+
+    from matplotlib.patches import Patch
+    from binGraph.render import new_figure, figure_template
+
+    side = 1 << order
+
+    fig, ax = new_figure(interactive=interactive)
+    template = figure_template(fig)
+    template.ax = ax
+
+    template.image = ax.imshow(np.ones((side, side, 4)), interpolation="nearest")
+    ax.set_xticks([])
+    ax.set_yticks([])
+
+    handles = [Patch(color=colour, label=name) for name, colour in zip(__classes__, classcolours)]
+    ax.legend(handles=handles, loc="center left", bbox_to_anchor=(1.02, 0.5), framealpha=1)
+
+    return template
+
+
+def generate(abs_fpath, fname, classcolours=__colours__, profile=None, **kwargs):
+
+    # # Use the given (e.g. cached) numbers if we have them
+    if profile is None:
+        profile = analyse(abs_fpath, fname, **kwargs)
+
+    from matplotlib.colors import to_rgba
+    from binGraph.render import get_template
+
+    order = int(profile["order"])
+    classcolours = [to_rgba(colour) for colour in classcolours]
+
+    # # Get the figure, reusing the one built for an earlier file if the options match
+    build = lambda interactive=False: build_template(order, classcolours, interactive)
+    if kwargs.get("showplt", False):
+        template = build(interactive=True)
+    else:
+        template = get_template(("hilbert", order, tuple(classcolours)), build)
+
+    template.image.set_data(curve_image(profile, classcolours + [(1.0, 1.0, 1.0, 1.0)]))
+
+    template.ax.set_xlabel("{0}x{0} Hilbert curve, {1} bytes per pixel".format(1 << order, int(profile["bytes_per_pixel"])))
+    template.ax.set_title("Hilbert curve: {}\n".format(fname))
+
+    return template.fig, {}, json_info(profile)
+
+
+# # Draw the graph without matplotlib (--renderer raster): the curve image only
+def raster(abs_fpath, fname, classcolours=__colours__, profile=None, figsize=(12, 4), dpi=100, **kwargs):
+
+    from binGraph.raster import new_canvas, to_rgba
+
+    # # Use the given (e.g. cached) numbers if we have them
+    if profile is None:
+        profile = analyse(abs_fpath, fname, **kwargs)
+
+    palette = np.array([to_rgba(colour) for colour in classcolours] + [to_rgba("w")], dtype=np.uint8)
+
+    canvas = new_canvas(figsize, dpi)
+    canvas.image(curve_image(profile, palette))
+
+    return canvas.png(), json_info(profile)
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    logging.basicConfig(stream=sys.stderr, format="%(levelname)s | %(message)s", level=logging.DEBUG)
+    logging.getLogger("matplotlib").setLevel(logging.CRITICAL)
+    log = logging.getLogger("hilbert")
+
+    # ## Global graphing default values
+    __figformat__ = "png"  # Output format of saved figure
+    __figsize__ = (12, 4)  # Size of figure in inches
+    __figdpi__ = 100  # DPI of figure
+    __showplt__ = False  # Show the plot interactively
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-f",
+        "--file",
+        type=str,
+        required=True,
+        metavar="malware.exe",
+        help="Give me a graph of this file. See - if this is the only argument specified.",
+    )
+    parser.add_argument(
+        "--showplt", action="store_true", default=__showplt__, help="Show plot interactively (disables saving to file)"
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        default=__figformat__,
+        choices=["png", "pdf", "ps", "eps", "svg"],
+        required=False,
+        metavar="png",
+        help="Graph output format",
+    )
+    parser.add_argument("--figsize", type=int, nargs=2, default=__figsize__, metavar="#", help="Figure width and height in inches")
+    parser.add_argument("--dpi", type=int, default=__figdpi__, metavar=__figdpi__, help="Figure dpi")
+
+    args_setup(parser)
+
+    args = parser.parse_args()
+
+    args.graphtype = __name__
+
+    args_validation(args)
+
+    args_dict = args.__dict__
+    args_dict["abs_fpath"] = args.file
+    args_dict["fname"] = os.path.basename(args.file)
+    args_dict["abs_save_fpath"] = "{}.{}".format(os.path.basename(args_dict["abs_fpath"]), args.format)
+
+    from binGraph.render import finish_figure, show_figure
+
+    fig, save_kwargs, json_data = generate(**args_dict)
+
+    finish_figure(fig, args.figsize)
+
+    if args.showplt:
+        log.debug("Opening graph interactively")
+        show_figure(fig)
+    else:
+        fig.savefig(args_dict["abs_save_fpath"], format=args.format, dpi=args.dpi, **save_kwargs)
+        log.info('Graph saved to: "{}"'.format(args_dict["abs_save_fpath"]))
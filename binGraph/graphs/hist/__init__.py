@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+"""
+Byte histogram over all file - graph arguments
+-------------------------------------------
+Declares the graph's defaults and arguments without importing its dependencies (matplotlib, numpy etc.), so the
+command line can be set up quickly. The graph itself is in graph.py, imported when it is first used.
+"""
+
+from __future__ import absolute_import
+
+
+# # Graph defaults
+__no_zero__ = False
+__width__ = 1
+__g_log__ = True
+__no_order__ = False
+__colours__ = ["#ff01d5", "#01ff2b"]
+
+# Set args in args parse
+def args_setup(arg_parser):
+
+    arg_parser.add_argument(
+        "--no_zero",
+        action="store_true",
+        default=__no_zero__,
+        help="Remove 0x00 from the graph, sometimes this blows other results due to there being numerous amounts - also see --no_log",
+    )
+    arg_parser.add_argument("--width", type=int, default=__width__, metavar=__width__, help="Sample width")
+    arg_parser.add_argument(
+        "--no_log", action="store_false", default=__g_log__, help="Do _not_ apply a log scale to occurance axis"
+    )
+    arg_parser.add_argument(
+        "--no_order",
+        action="store_true",
+        default=__no_order__,
+        help="Remove the ordered histogram - It shows overall distribution when on",
+    )
+    arg_parser.add_argument(
+        "--colours",
+        type=str,
+        nargs=2,
+        default=__colours__,
+        metavar="#ff01d5",
+        help="Colours for the graph. First value is the ordered graph",
+    )
@@ -18,53 +18,16 @@ from __future__ import absolute_import
 import os
 import sys
 import numpy as np
-import matplotlib
 
-matplotlib.use("Agg")
-import matplotlib.ticker as ticker
-import matplotlib.pyplot as plt
-from matplotlib.ticker import MaxNLocator
-from collections import Counter
+# # matplotlib is only imported to draw with it, not for --renderer raster
+from binGraph.context import bin_context
 
 import logging
 
 log = logging.getLogger("graph.hist")
 
-# # Graph defaults
-__no_zero__ = False
-__width__ = 1
-__g_log__ = True
-__no_order__ = False
-__colours__ = ["#ff01d5", "#01ff2b"]
-
-# Set args in args parse
-def args_setup(arg_parser):
-
-    arg_parser.add_argument(
-        "--no_zero",
-        action="store_true",
-        default=__no_zero__,
-        help="Remove 0x00 from the graph, sometimes this blows other results due to there being numerous amounts - also see --no_log",
-    )
-    arg_parser.add_argument("--width", type=int, default=__width__, metavar=__width__, help="Sample width")
-    arg_parser.add_argument(
-        "--no_log", action="store_false", default=__g_log__, help="Do _not_ apply a log scale to occurance axis"
-    )
-    arg_parser.add_argument(
-        "--no_order",
-        action="store_true",
-        default=__no_order__,
-        help="Remove the ordered histogram - It shows overall distribution when on",
-    )
-    arg_parser.add_argument(
-        "--colours",
-        type=str,
-        nargs=2,
-        default=__colours__,
-        metavar="#ff01d5",
-        help="Colours for the graph. First value is the ordered graph",
-    )
-
+# # Graph defaults and arguments are declared by the graph package, so they can be set up without importing this module
+from binGraph.graphs.hist import __no_zero__, __width__, __g_log__, __no_order__, __colours__, args_setup
 
 # Validate graph specific arguments
 class ArgValidationEx(Exception):
@@ -73,12 +36,21 @@ class ArgValidationEx(Exception):
 
 def args_validation(args):
 
-    # # Test to see what matplotlib backend is setup
-    backend = matplotlib.get_backend()
-    if not backend == "TkAgg":
-        log.warning(
-            '{} matplotlib backend in use. This graph generation was tested with "TkAgg", bugs may lie ahead...'.format(backend)
-        )
+    # # Thumbnails are drawn without matplotlib, so colours are checked without it too
+    if getattr(args, "renderer", None) == "raster":
+        from binGraph.raster import to_rgba_floats as to_rgba
+    else:
+        import matplotlib
+
+        matplotlib.use("Agg")
+        from matplotlib.colors import to_rgba
+
+        # # Test to see what matplotlib backend is setup
+        backend = matplotlib.get_backend()
+        if not backend == "TkAgg":
+            log.warning(
+                '{} matplotlib backend in use. This graph generation was tested with "TkAgg", bugs may lie ahead...'.format(backend)
+            )
 
     # # Test to see if we should use defaults
     if args.graphtype == "all":
@@ -89,37 +61,48 @@ def args_validation(args):
         args.colours = __colours__
 
     try:
-        args.colours[0] = matplotlib.colors.to_rgba(args.colours[0])
-        args.colours[1] = matplotlib.colors.to_rgba(args.colours[1])
+        args.colours[0] = to_rgba(args.colours[0])
+        args.colours[1] = to_rgba(args.colours[1])
     except ValueError as e:
         raise ArgValidationEx("Error parsing --colours: {}".format(e))
 
 
-def generate(
-    abs_fpath, fname, no_zero=__no_zero__, width=__width__, g_log=__g_log__, no_order=__no_order__, colours=__colours__, **kwargs
-):
+# # The arguments that change the numbers analyse() produces - cached profiles are keyed on these. The byte
+# # counts are the same whatever the options, they only change how the graph is drawn
+def profile_args(**kwargs):
 
-    file_array = []
-    with open(abs_fpath, "rb") as fh:
-        for x in bytearray(fh.read()):
-            file_array.append(x)
+    return {}
 
-    log.debug('Read: "{}", length: {}'.format(fname, len(file_array)))
 
-    log.debug("Ignore 0's: {}".format(no_zero))
-    no_zero = -int(no_zero)
+# # Work out the numbers behind the graph: the byte counts over all the file
+def analyse(abs_fpath, fname, bin_ctx=None, **kwargs):
 
-    fig, ax = plt.subplots()
+    # # Use the shared analysis of the file if we have been given one
+    if bin_ctx is None:
+        bin_ctx = bin_context(abs_fpath, fname)
 
-    # # Add a byte hist ordered 1 > 255
-    ordered_row = []
-    c = Counter(file_array)
-    for x in range(no_zero, 256):
-        ordered_row.append(c[x])
-
-    ax.bar(
-        np.array(list(range(no_zero, 256))),
-        np.array(ordered_row),
+    log.debug('Read: "{}", length: {}'.format(fname, bin_ctx.size))
+
+    return {"histogram": bin_ctx.histogram()}
+
+
+# # Build the parts of the figure that are the same for every file: bars, formatters, labels and legend
+def build_template(no_zero, width, g_log, no_order, colours, interactive=False):
+
+    import matplotlib.ticker as ticker
+    from matplotlib.ticker import MaxNLocator
+    from binGraph.render import new_figure, figure_template
+
+    bytes_range = np.arange(no_zero, 256)
+    heights = np.ones(len(bytes_range))
+
+    fig, ax = new_figure(interactive=interactive)
+    template = figure_template(fig)
+    template.ax = ax
+
+    template.bars = ax.bar(
+        bytes_range,
+        heights,
         align="edge",
         width=width,
         label="Bytes",
@@ -128,21 +111,11 @@ def generate(
         zorder=0,
         linewidth=0,
     )
-    log.debug("Graphed binary array")
 
-    # # Add a byte hist ordered by occurrence - shows general distribution
     if not no_order:
-        sorted_row = []
-        c = Counter(file_array)
-        for x in range(no_zero, 256):
-            sorted_row.append(c[x])
-
-        sorted_row.sort()
-        sorted_row.reverse()
-
-        ax.bar(
-            np.array(list(range(no_zero, 256))),
-            np.array(sorted_row),
+        template.ordered_bars = ax.bar(
+            bytes_range,
+            heights,
             width=width,
             label="Ordered",
             color=colours[1],
@@ -151,7 +124,6 @@ def generate(
             alpha=0.5,
             linewidth=0,
         )
-        log.debug("Graphed ordered binary array")
 
     # # Formatting and watermarking
     ax.xaxis.set_major_formatter(ticker.FuncFormatter(lambda x, pos: ("0x{:02X}".format(int(x)))))
@@ -173,11 +145,110 @@ def generate(
         ax.set_xbound(lower=0, upper=255)
         log.debug("Setting xlim/xbounds to (0,255)")
 
-    plt.legend(loc="upper center", ncol=3, bbox_to_anchor=(0.5, 1.07), framealpha=1)
+    ax.legend(loc="upper center", ncol=3, bbox_to_anchor=(0.5, 1.07), framealpha=1)
 
-    plt.title("Byte histogram: {}\n".format(fname))
+    return template
+
+
+def generate(
+    abs_fpath,
+    fname,
+    no_zero=__no_zero__,
+    width=__width__,
+    g_log=__g_log__,
+    no_order=__no_order__,
+    colours=__colours__,
+    profile=None,
+    **kwargs
+):
+
+    # # Use the given (e.g. cached) numbers if we have them
+    if profile is None:
+        profile = analyse(abs_fpath, fname, **kwargs)
+
+    log.debug("Ignore 0's: {}".format(no_zero))
+    no_zero = -int(no_zero)
+
+    # # Byte counts over all the file. With no_zero the bars start at -1, which has no count
+    counts = np.concatenate((np.zeros(-no_zero, dtype=np.int64), profile["histogram"]))
+
+    from binGraph.render import get_template
+
+    # # Get the figure, reusing the one built for an earlier file if the options match
+    build = lambda interactive=False: build_template(no_zero, width, g_log, no_order, colours, interactive)
+    if kwargs.get("showplt", False):
+        template = build(interactive=True)
+    else:
+        template = get_template(("hist", no_zero, width, g_log, no_order, tuple(colours)), build)
+
+    ax = template.ax
+
+    # # Add a byte hist ordered 1 > 255
+    for rect, height in zip(template.bars, counts):
+        rect.set_height(height)
+    log.debug("Graphed binary array")
+
+    # # Add a byte hist ordered by occurrence - shows general distribution
+    if not no_order:
+        sorted_row = np.sort(counts)[::-1]
+
+        for rect, height in zip(template.ordered_bars, sorted_row):
+            rect.set_height(height)
+        log.debug("Graphed ordered binary array")
+
+    # # Scale the y axis to this file's counts
+    ax.relim()
+    ax.autoscale_view(scalex=False)
+
+    ax.set_title("Byte histogram: {}\n".format(fname))
+
+    return template.fig, {}, {}
+
+
+# # Draw the graph without matplotlib (--renderer raster): the bars only
+def raster(
+    abs_fpath,
+    fname,
+    no_zero=__no_zero__,
+    width=__width__,
+    g_log=__g_log__,
+    no_order=__no_order__,
+    colours=__colours__,
+    profile=None,
+    figsize=(12, 4),
+    dpi=100,
+    **kwargs
+):
+
+    from binGraph.raster import new_canvas, to_rgba
+
+    # # Use the given (e.g. cached) numbers if we have them
+    if profile is None:
+        profile = analyse(abs_fpath, fname, **kwargs)
+
+    counts = profile["histogram"].astype(np.float64)
+    bytes_range = np.arange(256)
+
+    # # Log scale: bars are drawn to log10 of the count, empty bytes have no bar
+    if g_log:
+        counts = np.log10(np.maximum(counts, 1))
+
+    canvas = new_canvas(figsize, dpi)
+    canvas.xlim = (1, 255) if no_zero else (0, 255)
+
+    shown = counts[int(bool(no_zero)) :]
+    ylim = (0, (shown.max() if len(shown) and shown.max() > 0 else 1) * 1.05)
+
+    # # Add a byte hist ordered 1 > 255
+    canvas.bars(bytes_range, bytes_range + width, counts, ylim, to_rgba(colours[0]))
+
+    # # Add a byte hist ordered by occurrence - shows general distribution
+    if not no_order:
+        sorted_row = np.sort(shown)[::-1]
+        left = bytes_range[: len(sorted_row)] + int(bool(no_zero)) - width / 2
+        canvas.bars(left, left + width, sorted_row, ylim, to_rgba(colours[1], alpha=0.5))
 
-    return plt, {}, {}
+    return canvas.png(), {}
 
 
 if __name__ == "__main__":
@@ -238,16 +309,15 @@ if __name__ == "__main__":
     args_dict["fname"] = os.path.basename(args.file)
     args_dict["abs_save_fpath"] = "{}.{}".format(os.path.basename(args_dict["abs_fpath"]), args.format)
 
-    plt, save_kwargs, json_data = generate(**args_dict)
+    from binGraph.render import finish_figure, show_figure
 
-    fig = plt.gcf()
-    fig.set_size_inches(*args.figsize, forward=True)
+    fig, save_kwargs, json_data = generate(**args_dict)
 
-    plt.tight_layout()
+    finish_figure(fig, args.figsize)
 
     if args.showplt:
         log.debug("Opening graph interactively")
-        plt.show()
+        show_figure(fig)
     else:
-        plt.savefig(args_dict["abs_save_fpath"], format=args.format, dpi=args.dpi, **save_kwargs)
+        fig.savefig(args_dict["abs_save_fpath"], format=args.format, dpi=args.dpi, **save_kwargs)
         log.info('Graph saved to: "{}"'.format(args_dict["abs_save_fpath"]))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+"""
+Skip graphs that are up to date (--incremental)
+-------------------------------------------
+Each graph saved is stamped with a small JSON file next to it, "ent-malware.png.fingerprint":
+
+{"fingerprint": "...", "key": "...", "sha256": "...", "graphtype": "ent", "params": {...}, "version": 3.4,
+ "fingerprint_version": 2}
+
+The fingerprint is a hash of the file's content (its SHA-256), the graph type, the options that change the output,
+the binGraph version and __fingerprint_version__, which is bumped whenever the outputs change within a version. A graph is only drawn again, make style, if its output or stamp is missing or the
+fingerprint has changed.
+
+Hashing every file of a large corpus takes time, so the stamp also keeps the key of the file's path, size and
+modification time (as the --manifest does). While those are unchanged the file is not read at all; when only they
+have changed (e.g. the file was copied or touched) the content is hashed, and an unchanged fingerprint refreshes
+the stamp rather than the graph. The versions are kept in the stamp too, so outputs stamped by an older binGraph
+or output format are drawn again without reading the file.
+"""
+
+from __future__ import absolute_import
+import os
+import json
+import hashlib
+
+import logging
+
+log = logging.getLogger("binGraph.incremental")
+
+__suffix__ = ".fingerprint"  # Added to the name of an output for its stamp
+__fingerprint_version__ = 2  # Bump when the code or format of any output changes, so graphs stamped before are drawn again
+
+
+# # The fingerprint of a graph: the content of the file, the graph type, its options, the binGraph version and the
+# # version of the outputs
+def fingerprint(sha256, graphtype, params, version):
+
+    content = json.dumps([sha256, graphtype, params, version, __fingerprint_version__], sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def stamp_path(output):
+
+    return output + __suffix__
+
+
+# # The stamp of an output, or None if the output or its stamp is missing (or the stamp can not be read)
+def read_stamp(output):
+
+    if not os.path.exists(output):
+        return None
+
+    try:
+        with open(stamp_path(output), "r") as infile:
+            return json.load(infile)
+    except (OSError, ValueError):
+        return None
+
+
+# # Stamp an output once it has been saved. Written to a temporary file and renamed, so a stamp is never partial
+def write_stamp(output, **fields):
+
+    abs_stamp_fpath = stamp_path(output)
+    abs_tmp_fpath = "{}.{}.tmp".format(abs_stamp_fpath, os.getpid())
+
+    with open(abs_tmp_fpath, "w") as outfile:
+        json.dump(fields, outfile, default=str)
+    os.replace(abs_tmp_fpath, abs_stamp_fpath)
+
+
+# # Remove the stamp of an output about to be drawn again, so an output left half written is not taken as up to date
+def clear_stamp(output):
+
+    try:
+        os.remove(stamp_path(output))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+"""
+Job manifest for resumable batch runs (--manifest, --resume)
+-------------------------------------------
+Every graph generated (or failed) in a batch is a line appended to a JSON Lines journal:
+
+{"key": "...", "file": "/data/malware.exe", "sha256": "...", "graphtype": "ent", "params": {...},
+ "output": "/data/graphs/ent.png", "status": "done", "attempts": 1, "error": null, "time": "..."}
+
+A job is a file and a graph type with the options that change its output. Its key is worked out from the file's
+path, size and modification time (not its content, so deciding what to skip does not read every file), the graph
+type and the options. The journal is read once at startup into an index of the last record of each job, and then
+only appended to, one write per record, so workers can add to it at the same time and a run that dies leaves at
+most a partial last line (which is ignored, and ended before anything more is added).
+"""
+
+from __future__ import absolute_import
+import os
+import json
+import hashlib
+import datetime
+
+import logging
+
+log = logging.getLogger("binGraph.manifest")
+
+__member_separator__ = "!/"  # Joins an archive's path and a member's path, as binGraph.archive names members
+
+
+class job_manifest(object):
+    """Append-only journal of a batch's jobs, with an index of the last record of each"""
+
+    def __init__(self, path):
+        super(job_manifest, self).__init__()
+        self.path = path
+        self.index = {}
+
+        if os.path.exists(path):
+            self.load()
+            self.terminate()
+
+    def load(self):
+
+        skipped = 0
+        with open(self.path, "r") as infile:
+            for line in infile:
+                try:
+                    record = json.loads(line)
+                    self.index[record["key"]] = record
+                except (ValueError, KeyError, TypeError):
+                    skipped += 1
+
+        if skipped:
+            log.warning('Skipped {} unreadable lines of the manifest "{}"'.format(skipped, self.path))
+        log.debug('Loaded {} jobs from the manifest "{}"'.format(len(self.index), self.path))
+
+    # # End a partial last line (from a run that died writing it), so the next record starts on a line of its own
+    def terminate(self):
+
+        with open(self.path, "rb+") as fh:
+            fh.seek(0, os.SEEK_END)
+            if not fh.tell():
+                return
+
+            fh.seek(-1, os.SEEK_END)
+            if not fh.read(1) == b"\n":
+                fh.write(b"\n")
+
+    # # Has the job been done, and is its output still there?
+    def done(self, key):
+
+        record = self.index.get(key)
+        return bool(record) and record["status"] == "done" and (record.get("output") is None or os.path.exists(record["output"]))
+
+    # # The number of times a job has been tried and failed, over every run since it was last done
+    def attempts(self, key):
+
+        record = self.index.get(key)
+        return record.get("attempts", 0) if record and record["status"] == "failed" else 0
+
+
+# # Add a job's record to a journal. A single appending write, so lines from parallel workers do not interleave
+def record_job(path, key, status, **fields):
+
+    record = dict(fields, key=key, status=status, time=datetime.datetime.now().isoformat())
+
+    with open(path, "a") as outfile:
+        outfile.write(json.dumps(record, default=str) + "\n")
+
+    return record
+
+
+# # The path, size and modification time of a file (of the archive on disk, for an archive member)
+def file_identity(abs_fpath):
+
+    on_disk = abs_fpath.split(__member_separator__)[0]
+    stat = os.stat(on_disk)
+
+    return [abs_fpath, stat.st_size, stat.st_mtime_ns]
+
+
+# # The key of a job: a file, a graph type and the options that change its output
+def job_key(abs_fpath, graphtype, params):
+
+    identity = json.dumps([file_identity(abs_fpath), graphtype, params], sort_keys=True, default=str)
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+"""
+Raster renderer for the graph modules (--renderer raster)
+-------------------------------------------
+Draws straight into a NumPy RGBA array and encodes it as a PNG with zlib, without importing matplotlib. Made for
+thumbnails: there are no axes, labels or legends, only the data lines, bars and markers.
+"""
+
+from __future__ import division
+from __future__ import absolute_import
+import struct
+import zlib
+import numpy as np
+
+import logging
+
+log = logging.getLogger("binGraph.raster")
+
+__background__ = (255, 255, 255, 255)  # Canvas colour
+__compression__ = 6  # zlib level of the encoded PNG
+
+# # The matplotlib single letter colours, and the default colour cycle used for e.g. the section markers
+__colours__ = {
+    "b": "#0000ff",
+    "g": "#008000",
+    "r": "#ff0000",
+    "c": "#00bfbf",
+    "m": "#bf00bf",
+    "y": "#bfbf00",
+    "k": "#000000",
+    "w": "#ffffff",
+    "C0": "#1f77b4",
+}
+
+
+# # A colour as used by the graph modules (hex string, single letter or RGB(A) floats) as 0-255 RGBA
+def to_rgba(colour, alpha=None):
+
+    if isinstance(colour, str):
+        colour = __colours__.get(colour, colour)
+
+        if colour.startswith("#") and len(colour) in (4, 5):
+            colour = "#" + "".join(c * 2 for c in colour[1:])
+
+        if colour.startswith("#") and len(colour) in (7, 9):
+            rgba = [int(colour[i : i + 2], 16) for i in range(1, len(colour), 2)]
+        else:
+            # # Named colours etc. are rare enough to pay for the matplotlib import
+            from matplotlib.colors import to_rgba as mpl_to_rgba
+
+            rgba = [int(round(v * 255)) for v in mpl_to_rgba(colour)]
+
+    else:
+        rgba = [int(round(float(v) * 255)) for v in colour]
+
+    if len(rgba) == 3:
+        rgba.append(255)
+
+    if alpha is not None:
+        rgba[3] = int(round(rgba[3] * alpha))
+
+    return tuple(rgba)
+
+
+# # A colour as 0-1 RGBA floats, as matplotlib.colors.to_rgba gives, for validating colours without matplotlib
+def to_rgba_floats(colour):
+
+    return tuple(v / 255 for v in to_rgba(colour))
+
+
+class raster_canvas(object):
+    """An RGBA image to draw the graph data on, with a data to pixel mapping per axis"""
+
+    def __init__(self, width, height, background=__background__):
+        super(raster_canvas, self).__init__()
+
+        self.width = max(int(width), 2)
+        self.height = max(int(height), 2)
+        self.pixels = np.empty((self.height, self.width, 4), dtype=np.uint8)
+        self.pixels[...] = background
+
+        self.xlim = (0, 1)
+
+    # # Data x values to pixel columns (floats)
+    def x_to_px(self, x):
+
+        lower, upper = self.xlim
+        return (np.asarray(x, dtype=np.float64) - lower) / (upper - lower) * (self.width - 1)
+
+    # # Data y values to pixel rows (floats), row 0 is the top of the image
+    def y_to_px(self, y, ylim):
+
+        lower, upper = ylim
+        return (1 - (np.asarray(y, dtype=np.float64) - lower) / (upper - lower)) * (self.height - 1)
+
+    # # Alpha blend colour onto the pixels at rows, cols
+    def blend(self, rows, cols, colour):
+
+        keep = (rows >= 0) & (rows < self.height) & (cols >= 0) & (cols < self.width)
+        rows, cols = rows[keep], cols[keep]
+
+        r, g, b, a = colour
+        if a == 255:
+            self.pixels[rows, cols] = colour
+            return
+
+        alpha = a / 255
+        under = self.pixels[rows, cols, :3].astype(np.float64)
+        self.pixels[rows, cols, :3] = np.round(under * (1 - alpha) + np.array((r, g, b)) * alpha).astype(np.uint8)
+        self.pixels[rows, cols, 3] = 255
+
+    # # A line through the points (x0, y[0]), (x0 + 1, y[1]), ... The segments are sampled at one point per pixel step
+    def plot(self, y, ylim, colour, width=1, x0=0):
+
+        y = np.asarray(y, dtype=np.float64)
+        if not len(y):
+            return
+
+        px = self.x_to_px(x0 + np.arange(len(y)))
+        py = self.y_to_px(y, ylim)
+
+        if len(y) == 1:
+            cols, rows = np.round(px).astype(np.intp), np.round(py).astype(np.intp)
+        else:
+            # # Number of points per segment, then the position of each point along its segment
+            steps = np.maximum(np.abs(np.diff(px)), np.abs(np.diff(py))).astype(np.intp) + 1
+            segment = np.repeat(np.arange(len(steps)), steps)
+            starts = np.cumsum(steps) - steps
+            t = (np.arange(len(segment)) - np.repeat(starts, steps)) / np.repeat(steps, steps)
+
+            cols = np.round(px[segment] + (px[segment + 1] - px[segment]) * t).astype(np.intp)
+            rows = np.round(py[segment] + (py[segment + 1] - py[segment]) * t).astype(np.intp)
+            cols = np.append(cols, int(round(px[-1])))
+            rows = np.append(rows, int(round(py[-1])))
+
+        # # Thicken the line downwards
+        for offset in range(int(width)):
+            self.blend(rows + offset, cols, colour)
+
+    # # A full height vertical line at data x, dashed/dotted lines draw dash pixels then leave gap pixels
+    def vline(self, x, colour, dash=None):
+
+        col = int(round(float(self.x_to_px(x))))
+        rows = np.arange(self.height)
+        if dash:
+            on, off = dash
+            rows = rows[rows % (on + off) < on]
+
+        self.blend(rows, np.full(len(rows), col, dtype=np.intp), colour)
+
+    # # Vertical bars from the bottom of the image. left and right are the data x extents of each bar
+    def bars(self, left, right, height, ylim, colour):
+
+        # # The bar under each pixel column (or -1), then the highest row each column is filled to
+        centres = self.xlim[0] + (np.arange(self.width) + 0.5) / self.width * (self.xlim[1] - self.xlim[0])
+        bar = np.searchsorted(np.asarray(left), centres, side="right") - 1
+        inside = (bar >= 0) & (centres < np.asarray(right)[np.clip(bar, 0, None)])
+
+        tops = np.full(self.width, self.height, dtype=np.float64)
+        tops[inside] = np.clip(self.y_to_px(np.asarray(height)[bar[inside]], ylim), 0, self.height)
+
+        rows, cols = np.nonzero(np.arange(self.height)[:, None] >= np.round(tops)[None, :])
+        self.blend(rows, cols, colour)
+
+    # # An (h x w x 4) uint8 image, scaled up or down (nearest pixel, keeping its aspect) to fit and centred
+    def image(self, rgba):
+
+        height, width = rgba.shape[:2]
+        scale = min(self.width / width, self.height / height)
+        out_width, out_height = max(int(width * scale), 1), max(int(height * scale), 1)
+
+        rows = np.minimum((np.arange(out_height) / scale).astype(np.intp), height - 1)
+        cols = np.minimum((np.arange(out_width) / scale).astype(np.intp), width - 1)
+
+        top, left = (self.height - out_height) // 2, (self.width - out_width) // 2
+        self.pixels[top : top + out_height, left : left + out_width] = rgba[rows[:, None], cols[None, :]]
+
+    # # The image as PNG bytes: 8-bit RGBA, no filtering
+    def png(self, level=__compression__):
+
+        # # Each scanline starts with its filter type (0, None)
+        raw = np.zeros((self.height, self.width * 4 + 1), dtype=np.uint8)
+        raw[:, 1:] = self.pixels.reshape(self.height, -1)
+
+        def chunk(tag, data):
+            return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+        return b"".join(
+            (
+                b"\x89PNG\r\n\x1a\n",
+                chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, 6, 0, 0, 0)),
+                chunk(b"IDAT", zlib.compress(raw.tobytes(), level)),
+                chunk(b"IEND", b""),
+            )
+        )
+
+
+# # A canvas the size the matplotlib figure would be
+def new_canvas(figsize, dpi):
+
+    return raster_canvas(figsize[0] * dpi, figsize[1] * dpi)
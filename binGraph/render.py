@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+"""
+Figure creation and output for the graph modules
+-------------------------------------------
+Graphs are drawn on Figure objects with their own Agg canvas, owned by the call that made them, rather than through
+the pyplot state machine. Nothing is registered globally, so there is nothing to clear up between graphs, and
+graphs can be drawn from several threads at once. Only interactive figures (--showplt) go through pyplot.
+
+The static parts of a figure can be kept as a figure_template and reused for the next file (see get_template).
+"""
+
+from __future__ import absolute_import
+import threading
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import logging
+
+log = logging.getLogger("binGraph.render")
+
+
+# # A new figure with a single set of axes
+def new_figure(interactive=False):
+
+    if interactive:
+        import matplotlib.pyplot as plt
+
+        fig = plt.figure()
+    else:
+        fig = Figure()
+        FigureCanvasAgg(fig)
+
+    return fig, fig.add_subplot()
+
+
+# # Size and lay out a figure ready to be saved or shown
+def finish_figure(fig, figsize):
+
+    fig.set_size_inches(*figsize, forward=True)
+
+    # # Start the layout from the defaults, the figure may have been laid out for an earlier file
+    fig.subplots_adjust(
+        **{name: matplotlib.rcParams["figure.subplot." + name] for name in ("left", "right", "bottom", "top", "wspace", "hspace")}
+    )
+    fig.tight_layout()
+
+
+# # Show a figure made with new_figure(interactive=True)
+def show_figure(fig):
+
+    import matplotlib.pyplot as plt
+
+    plt.show()
+    plt.close(fig)
+
+
+# # Figure templates. Building the axes, formatters, legends etc. of a graph costs about as much as drawing it, so
+# # graph modules build the static parts once per set of options and only update the data artists for each file.
+# # Templates are kept per thread, a template's figure is only ever used by one graph at a time
+__templates__ = threading.local()
+
+
+class figure_template(object):
+    """A reusable figure: the static scaffolding, plus the per file artists (markers) to remove before reuse"""
+
+    def __init__(self, fig):
+        super(figure_template, self).__init__()
+        self.fig = fig
+        self.markers = []
+
+    # # Keep track of an artist only drawn for the current file
+    def add_marker(self, artist):
+
+        self.markers.append(artist)
+        return artist
+
+    def clear_markers(self):
+
+        for artist in self.markers:
+            artist.remove()
+        self.markers = []
+
+
+# # Get this thread's template for key, building it with build() the first time
+def get_template(key, build):
+
+    if not hasattr(__templates__, "templates"):
+        __templates__.templates = {}
+
+    if not key in __templates__.templates:
+        log.debug("Building figure template: {}".format(key))
+        __templates__.templates[key] = build()
+
+    template = __templates__.templates[key]
+    template.clear_markers()
+
+    return template
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+
+"""
+Long running binGraph server (binGraph serve)
+-------------------------------------------
+Keeps the graph modules, matplotlib and the figure templates loaded in a pool of worker processes, so graphing a
+sample does not pay for interpreter startup and imports every time. Listens on localhost HTTP or a Unix socket.
+
+GET  /graphs    JSON list of the graph types
+POST /graph     JSON request: {"file": "/abs/path/malware.exe", "args": ["--dpi", "50", "ent", "--chunks", "1000"]}
+                "file" may be an archive member: "/abs/path/samples.zip!/malware.exe"
+                "args" are the usual command line options, less --file (and the options that only make sense for a
+                batch: --out, --jobs, --showplt etc. are ignored). The response is:
+                - the image, for a single graph type
+                - JSON {graphtype: {"info", "graph" (base64), ...}} for "all" or --json
+                - JSON {graphtype: numbers} for --data-only (e.g. "args": ["--data-only", "all"])
+
+$ binGraph serve --port 8642 &
+$ curl -s localhost:8642/graph -d '{"file": "/tmp/malware.exe", "args": ["ent"]}' > malware-ent.png
+"""
+
+from __future__ import absolute_import
+import sys
+import os
+import json
+import logging
+import argparse
+import signal
+import socketserver
+import concurrent.futures
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from binGraph import binGraph as bg
+
+log = logging.getLogger("binGraph.server")
+
+__host__ = "127.0.0.1"  # Only listen locally, requests name files on this machine
+__port__ = 8642  # Port of the HTTP server
+__max_request__ = 1024 * 1024  # Largest accepted request body in bytes
+
+__content_types__ = {
+    "png": "image/png",
+    "pdf": "application/pdf",
+    "ps": "application/postscript",
+    "eps": "application/postscript",
+    "svg": "image/svg+xml",
+}
+
+
+class RequestError(Exception):
+    pass
+
+
+class request_parser(argparse.ArgumentParser):
+    """The binGraph command line parser, raising bad options to the client rather than exiting the worker"""
+
+    def error(self, message):
+        raise RequestError(message)
+
+    def exit(self, status=0, message=None):
+        raise RequestError(message or "Invalid request")
+
+
+# # Worker process state: the parser, built once
+__parser__ = None
+
+
+# # Get each worker ready: non-interactive matplotlib, and every graph module imported
+def init_worker(verbose=False):
+
+    global __parser__
+
+    bg.init_worker(verbose)
+    __parser__ = bg.build_parser(parser_class=request_parser)
+
+    for name, module in bg.graphs.items():
+        log.debug("Loading graph: {}".format(name))
+        module.module
+
+
+# # Generate the graphs of a request, in a worker. Returns (status, content type, body)
+def serve_graph(request):
+
+    if not isinstance(request, dict) or not isinstance(request.get("file"), str):
+        raise RequestError('Requests need a "file" path')
+
+    argv = ["--file", request["file"], "-"] + [str(arg) for arg in request.get("args", [])]
+    args = __parser__.parse_args(argv)
+
+    # # Nothing is written to disk, or shown
+    args.showplt = False
+    args.save_dir = os.getcwd()
+    try:
+        bg.validate_args(args)
+    except Exception as e:
+        raise RequestError(str(e))
+
+    if len(args.files) != 1:
+        raise RequestError("Only single files can be graphed: {}".format(request["file"]))
+
+    from binGraph.cache import profile_cache, to_json
+
+    args_dict = args.__dict__
+    abs_fpath = args.files[0]
+    graphtypes = list(bg.graphs.keys()) if args.graphtype == "all" else [args.graphtype]
+
+    bin_ctx = bg.open_context(abs_fpath, args_dict)
+
+    cache = None
+    if args_dict.get("cache_dir"):
+        cache = profile_cache(args_dict["cache_dir"], max_size=args_dict["cache_size"] * 1024 * 1024)
+
+    results = {}
+    for module_name in graphtypes:
+        module = bg.graphs[module_name]
+
+        _, fname, cleaned_fname = bg.gen_names(args.format, abs_fpath, args.save_dir, graphtype=module_name)
+        args_dict["abs_fpath"] = abs_fpath
+        args_dict["fname"] = fname
+        args_dict["cleaned_fname"] = cleaned_fname
+
+        profile = bg.get_profile(module_name, module, bin_ctx, args_dict, cache=cache)
+
+        if args_dict.get("data_only"):
+            results[module_name] = profile
+            continue
+
+        image, json_data = bg.render_graph(module, profile, args_dict)
+
+        # # A single image is sent as is
+        if len(graphtypes) == 1 and not args_dict["json"]:
+            return 200, __content_types__.get(args.format, "application/octet-stream"), image
+
+        results[module_name] = bg.json_output(image, json_data, args_dict)
+
+    return 200, "application/json", json.dumps(results, default=to_json).encode()
+
+
+class request_handler(BaseHTTPRequestHandler):
+    """Hands requests to the worker pool of the server, and sends back what they made"""
+
+    protocol_version = "HTTP/1.1"
+
+    def send(self, status, content_type, body):
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+
+        self.send(status, "application/json", json.dumps({"error": message}).encode())
+
+    def do_GET(self):
+
+        if self.path.rstrip("/") == "/graphs":
+            self.send(200, "application/json", json.dumps(sorted(bg.graphs.keys())).encode())
+        else:
+            self.send_error_json(404, "Unknown path: {}".format(self.path))
+
+    def do_POST(self):
+
+        if self.path.rstrip("/") != "/graph":
+            return self.send_error_json(404, "Unknown path: {}".format(self.path))
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > __max_request__:
+            self.close_connection = True
+            return self.send_error_json(413, "Request too large")
+
+        try:
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+        except ValueError as e:
+            return self.send_error_json(400, "Invalid JSON: {}".format(e))
+
+        try:
+            status, content_type, body = self.server.executor.submit(serve_graph, request).result()
+        except RequestError as e:
+            return self.send_error_json(400, str(e))
+        except Exception as e:
+            log.error("Failed to serve {}: {}".format(request, e))
+            return self.send_error_json(500, str(e))
+
+        self.send(status, content_type, body)
+
+    # # Unix socket clients have no address
+    def address_string(self):
+
+        return self.client_address[0] if self.client_address else self.server.server_address
+
+    def log_message(self, format, *args):
+
+        log.debug("{} - {}".format(self.address_string(), format % args))
+
+
+class http_server(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class unix_http_server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    # # HTTPServer.server_bind expects a (host, port) address
+    def server_bind(self):
+
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def serve_main(argv):
+
+    parser = argparse.ArgumentParser(prog="binGraph serve", description="Serve binGraph graphs over HTTP")
+    parser.add_argument("--host", type=str, default=__host__, metavar=__host__, help="Address to listen on")
+    parser.add_argument("--port", type=int, default=__port__, metavar=__port__, help="Port to listen on")
+    parser.add_argument(
+        "--socket", type=str, default=None, metavar="/run/binGraph.sock", help="Listen on this Unix socket instead of --host/--port"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=0, metavar=0, help="Number of worker processes, 0 uses one per CPU"
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print debug information to stderr")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(stream=sys.stderr, format="%(name)s | %(levelname)s | %(message)s")
+    if args.verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+        logging.getLogger("matplotlib").setLevel(logging.WARNING)
+
+    if args.jobs < 0:
+        parser.error("--jobs must be 0 or more: {}".format(args.jobs))
+
+    jobs = args.jobs or os.cpu_count() or 1
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        server = unix_http_server(args.socket, request_handler)
+        address = args.socket
+    else:
+        server = http_server((args.host, args.port), request_handler)
+        address = "http://{}:{}".format(*server.server_address[:2])
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(args.verbose,)) as executor:
+        server.executor = executor
+
+        # # Start the workers now, rather than on the first request
+        for future in [executor.submit(os.getpid) for _ in range(jobs)]:
+            future.result()
+
+        # # Stop cleanly (removing the socket) when terminated
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+        log.info("Serving graphs on {} with {} workers".format(address, jobs))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if args.socket and os.path.exists(args.socket):
+                os.unlink(args.socket)
+
+    return 0
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+"""
+Stage timing (--timing, --profile)
+-------------------------------------------
+Code marks out its stages with `with stage("name"):`. Nothing is recorded unless a stage_timer is running in the
+process (see timed). Stages nest: a stage inside "analyse" is recorded as "analyse/count". Labels given to a stage
+(file, graphtype) are inherited by the stages inside it.
+
+Every finished stage is a record of its wall time, CPU time and the peak memory allocated above what was in use
+when it started (traced with tracemalloc, which numpy reports its arrays to). Records are kept by the timer and
+passed to each of its hooks as they are made.
+"""
+
+from __future__ import absolute_import
+import time
+import json
+import contextlib
+import tracemalloc
+
+import logging
+
+log = logging.getLogger("binGraph.timing")
+
+# # The timer of this process, if timing
+__timer__ = None
+
+
+class stage_timer(object):
+    """Records the stages run while it is the process timer, and passes each record on to its hooks"""
+
+    def __init__(self, hooks=None, memory=True, **labels):
+        super(stage_timer, self).__init__()
+        self.hooks = list(hooks or [])
+        self.memory = memory
+        self.labels = labels  # # Labels of every record, e.g. the file being timed
+        self.records = []
+        self.__stack = []
+
+    def add_hook(self, hook):
+
+        self.hooks.append(hook)
+
+    @contextlib.contextmanager
+    def stage(self, name, **labels):
+
+        parent = self.__stack[-1] if self.__stack else None
+        current = {
+            "name": "{}/{}".format(parent["name"], name) if parent else name,
+            "labels": dict(parent["labels"] if parent else self.labels, **labels),
+            "peak": 0,
+            "memory": 0,
+        }
+
+        # # tracemalloc has a single peak, so the peak of the parent so far is kept before it is reset
+        if self.memory:
+            current["memory"], peak = tracemalloc.get_traced_memory()
+            if parent:
+                parent["peak"] = max(parent["peak"], peak)
+            tracemalloc.reset_peak()
+
+        self.__stack.append(current)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            self.__stack.pop()
+
+            peak_memory = None
+            if self.memory:
+                peak = max(current["peak"], tracemalloc.get_traced_memory()[1])
+                if parent:
+                    parent["peak"] = max(parent["peak"], peak)
+                peak_memory = max(peak - current["memory"], 0)
+
+            record = dict(current["labels"], stage=current["name"], wall=wall, cpu=cpu, peak_memory=peak_memory)
+            self.records.append(record)
+            for hook in self.hooks:
+                hook(record)
+
+
+# # Time a stage with the process timer, if there is one
+def stage(name, **labels):
+
+    if __timer__ is None:
+        return contextlib.nullcontext()
+
+    return __timer__.stage(name, **labels)
+
+
+# # Make timer the process timer while in the with block
+@contextlib.contextmanager
+def timed(timer):
+
+    global __timer__
+
+    previous, __timer__ = __timer__, timer
+
+    started = timer.memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+
+    try:
+        yield timer
+    finally:
+        __timer__ = previous
+        if started:
+            tracemalloc.stop()
+
+
+# ### Hooks and exporters
+
+# # Log every record as it is made
+def log_record(record):
+
+    log.debug(
+        "{stage} {graphtype} {file}: wall {wall:.4f}s, cpu {cpu:.4f}s, peak memory {peak_memory}".format(
+            **dict({"file": "", "graphtype": ""}, **record)
+        )
+    )
+
+
+# # Totals per graph type and stage ("file" for the stages shared by all graph types): wall and CPU time summed,
+# # peak memory the largest seen
+def summarise(records):
+
+    summary = {}
+    for record in records:
+        stages = summary.setdefault(record.get("graphtype", "file"), {})
+        total = stages.setdefault(record["stage"], {"count": 0, "wall": 0.0, "cpu": 0.0, "peak_memory": None})
+        total["count"] += 1
+        total["wall"] += record["wall"]
+        total["cpu"] += record["cpu"]
+        if record["peak_memory"] is not None:
+            total["peak_memory"] = max(total["peak_memory"] or 0, record["peak_memory"])
+
+    return summary
+
+
+# # Save records as a json timing report
+def write_report(abs_fpath, records, **info):
+
+    report = dict(info, summary=summarise(records), records=records)
+
+    with open(abs_fpath, "w") as outfile:
+        json.dump(report, outfile, indent=1)
+
+    log.info('Timing report saved to: "{}"'.format(abs_fpath))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+"""
+Tests of reading archive members in a single pass
+"""
+
+from __future__ import absolute_import
+import io
+import os
+import sys
+import tarfile
+import zipfile
+import subprocess
+
+from binGraph import binGraph as bg
+from binGraph.archive import find_members, read_member, read_members
+
+__root__ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def add_tar_member(tf, name, data):
+
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tf.addfile(info, io.BytesIO(data))
+
+
+def test_read_members_matches_read_member(tmp_path):
+
+    contents = {name: os.urandom(1000 + index) for index, name in enumerate(["a.bin", "b.bin", "c.bin", "d.bin"])}
+
+    inner = io.BytesIO()
+    with zipfile.ZipFile(inner, "w") as zf:
+        zf.writestr("c.bin", contents["c.bin"])
+        zf.writestr("d.bin", contents["d.bin"])
+
+    abs_fpath = str(tmp_path / "outer.tar.gz")
+    with tarfile.open(abs_fpath, "w:gz") as tf:
+        add_tar_member(tf, "a.bin", contents["a.bin"])
+        add_tar_member(tf, "inner.zip", inner.getvalue())
+        add_tar_member(tf, "b.bin", contents["b.bin"])
+
+    members = find_members(abs_fpath)
+    assert len(members) == 4
+
+    found = list(read_members(abs_fpath, members))
+    assert [member_path for member_path, _ in found] == members
+    for member_path, data in found:
+        assert data == read_member(member_path)
+        assert data == contents[member_path.rsplit("!/", 1)[1]]
+
+    # # Only the members asked for are read
+    assert [member_path for member_path, _ in read_members(abs_fpath, members[1:2])] == members[1:2]
+
+
+def test_is_member(tmp_path):
+
+    abs_fpath = tmp_path / "samples.zip"
+    abs_fpath.write_bytes(b"PK")
+    (tmp_path / "dir!").mkdir()
+    (tmp_path / "dir!" / "file.bin").write_bytes(b"")
+
+    assert bg.is_member(str(abs_fpath) + "!/malware.exe")
+    assert bg.is_member(str(abs_fpath) + "!/inner.zip!/malware.exe")
+    assert not bg.is_member(str(abs_fpath))
+    assert not bg.is_member(str(tmp_path / "missing.zip") + "!/malware.exe")
+    # # A file on disk with "!/" in its path is a file
+    assert not bg.is_member(str(tmp_path / "dir!" / "file.bin"))
+
+
+# # The archive modules are only imported to read archives, not to start the command line
+def test_startup_without_archive_modules():
+
+    script = (
+        "import sys\n"
+        "from binGraph import binGraph as bg\n"
+        "bg.build_parser()\n"
+        "print(sorted(m for m in ('binGraph.archive', 'tarfile', 'zipfile', 'gzip') if m in sys.modules))\n"
+    )
+    output = subprocess.check_output([sys.executable, "-c", script], cwd=__root__)
+
+    assert output.decode().strip().splitlines()[-1] == "[]"
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+
+"""
+Tests of the command line options
+"""
+
+from __future__ import absolute_import
+
+from binGraph.binGraph import build_parser
+
+
+def test_data_only_does_not_take_the_graph_type():
+
+    args = build_parser().parse_args(["-f", "malware.exe", "--data-only", "all"])
+    assert args.data_only is True
+    assert args.data_format == "npz"
+    assert args.graphtype == "all"
+
+    args = build_parser().parse_args(["-f", "malware.exe", "--data-only", "--data-format", "jsonl", "ent"])
+    assert args.data_format == "jsonl"
+    assert args.graphtype == "ent"
+
+
+def test_archives_takes_a_depth():
+
+    args = build_parser().parse_args(["-f", "malware.exe", "--archives", "2", "all"])
+    assert args.archive_depth == 2
+    assert args.graphtype == "all"
+
+    args = build_parser().parse_args(["-f", "malware.exe", "-", "hist"])
+    assert args.archive_depth == 0
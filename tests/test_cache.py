@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+"""
+Tests of the on-disk cache of analysed profiles (--cache-dir)
+"""
+
+from __future__ import absolute_import
+import os
+import numpy as np
+
+from binGraph.cache import profile_cache
+
+
+def sample_profile(size=1000):
+
+    return {"ent": np.random.default_rng(size).random(size), "blocksize": 256, "sections": [["text", 0, 10]]}
+
+
+def test_hit(tmp_path):
+
+    cache = profile_cache(str(tmp_path))
+    key = cache.key("ab" * 32, "ent", {"chunks": 750, "blob": False})
+
+    assert cache.get(key) is None
+
+    profile = sample_profile()
+    cache.put(key, profile)
+    hit = profile_cache(str(tmp_path)).get(key)
+
+    assert np.array_equal(hit["ent"], profile["ent"])
+    assert hit["blocksize"] == 256
+    assert hit["sections"] == [["text", 0, 10]]
+
+
+def test_profile_args_miss(tmp_path):
+
+    cache = profile_cache(str(tmp_path))
+    sha256 = "ab" * 32
+    cache.put(cache.key(sha256, "ent", {"chunks": 750, "blob": False}), sample_profile())
+
+    assert cache.get(cache.key(sha256, "ent", {"chunks": 750, "blob": False})) is not None
+    assert cache.get(cache.key(sha256, "ent", {"chunks": 500, "blob": False})) is None
+    assert cache.get(cache.key(sha256, "hist", {"chunks": 750, "blob": False})) is None
+    assert cache.get(cache.key("cd" * 32, "ent", {"chunks": 750, "blob": False})) is None
+
+
+def test_lru_eviction(tmp_path):
+
+    cache = profile_cache(str(tmp_path))
+    keys = [cache.key("ab" * 32, "ent", {"chunks": chunks}) for chunks in range(3)]
+
+    # # Entries are aged by their modification time, so set it rather than rely on its resolution
+    for age, key in enumerate(keys[:2]):
+        cache.put(key, sample_profile())
+        os.utime(cache.path(key), (1000 + age, 1000 + age))
+    entry_size = os.path.getsize(cache.path(keys[0]))
+
+    # # Using the oldest entry makes the other the least recently used
+    assert cache.get(keys[0]) is not None
+
+    cache.max_size = entry_size * 2.5
+    cache.put(keys[2], sample_profile())
+
+    assert os.path.exists(cache.path(keys[0]))
+    assert not os.path.exists(cache.path(keys[1]))
+    assert os.path.exists(cache.path(keys[2]))
+    assert cache.get(keys[1]) is None
+
+    # # Shrinking the limit removes entries, oldest first, until the cache fits
+    cache.max_size = entry_size * 1.5
+    cache.evict()
+    assert len(os.listdir(str(tmp_path))) == 1
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+"""
+Tests of the shared byte counting, against counting each chunk on its own
+"""
+
+from __future__ import division
+from __future__ import absolute_import
+import io
+import os
+from collections import Counter
+
+import numpy as np
+
+from binGraph.context import bin_context, chunk_histograms, stream_chunk_histograms, hist_pyramid, byte_counts
+
+
+def sample_data(size, seed=0):
+
+    rng = np.random.RandomState(seed)
+    data = rng.randint(0, 256, size=size).astype(np.uint8)
+    data[size // 3 : size // 2] = 0x41
+
+    return data
+
+
+# # The byte counts of each chunksize chunk of data, one chunk at a time
+def counted_chunks(data, chunksize):
+
+    rows = []
+    for start in range(0, data.size, chunksize):
+        counter = Counter(data[start : start + chunksize].tolist())
+        rows.append([counter[b] for b in range(256)])
+
+    return np.array(rows, dtype=np.int64).reshape(-1, 256)
+
+
+def test_chunk_histograms_matches_per_chunk(monkeypatch):
+
+    import binGraph.context as context
+
+    data = sample_data(10007)
+    for chunksize in (1, 13, 256, 10007, 20000):
+        hists, sizes = chunk_histograms(data, chunksize)
+        assert np.array_equal(hists, counted_chunks(data, chunksize))
+        assert np.array_equal(sizes, hists.sum(axis=1))
+
+    # # Chunks larger than a bincount pass
+    monkeypatch.setattr(context, "__pass_bytes__", 100)
+    hists, sizes = chunk_histograms(data, 1000)
+    assert np.array_equal(hists, counted_chunks(data, 1000))
+
+
+def test_stream_chunk_histograms_matches_per_chunk():
+
+    data = sample_data(10007, seed=1)
+
+    # # Size known up front
+    hists, sizes, chunksize, _ = stream_chunk_histograms(io.BytesIO(data.tobytes()), 100, size=data.size, blocksize=997)
+    assert np.array_equal(hists, chunk_histograms(data, chunksize)[0])
+    assert int(sizes.sum()) == data.size
+
+    # # Size not known (e.g. a pipe): chunks are merged as the file is read
+    hists, sizes, chunksize, _ = stream_chunk_histograms(io.BytesIO(data.tobytes()), 100, blocksize=997)
+    assert 50 <= len(hists) <= 100
+    assert np.array_equal(hists, counted_chunks(data, chunksize))
+    assert int(sizes.sum()) == data.size
+
+
+def test_hist_pyramid_matches_byte_counts():
+
+    data = sample_data(10007, seed=2)
+    pyramid = hist_pyramid(*chunk_histograms(data, 10))
+
+    for chunks, start, end in ((100, 0, None), (7, 0, None), (50, 1234, 5678), (3, 20, 25), (10, 9000, 20000)):
+        hists, sizes, offsets = pyramid.histograms(chunks, start, end)
+        ends = np.append(offsets[1:], offsets[-1] + sizes[-1])
+
+        assert len(hists) <= chunks
+        for hist, size, offset, stop in zip(hists, sizes, offsets, ends):
+            assert np.array_equal(hist, byte_counts(data[offset:stop]))
+            assert size == stop - offset
+
+
+def test_range_histogram_matches_byte_counts(tmp_path):
+
+    data = sample_data(10007, seed=3)
+    abs_fpath = tmp_path / "sample.bin"
+    abs_fpath.write_bytes(data.tobytes())
+
+    bin_ctx = bin_context(str(abs_fpath), chunks=100)
+    bin_ctx.chunk_histograms(100)
+
+    for start, end in ((0, 10007), (5, 17), (150, 9999), (3000, 20000)):
+        assert np.array_equal(bin_ctx.range_histogram(start, end), byte_counts(data[start:end]))
+
+
+def write_pe_sample(abs_fpath, size=64 * 1024):
+
+    from binGraph.bench import write_pe
+
+    with open(abs_fpath, "wb") as outfile:
+        write_pe(outfile, size, [(".text", "code", 1), (".data", "zeros", 1), (".rsrc", "random", 2)], np.random.RandomState(0))
+
+    with open(abs_fpath, "rb") as infile:
+        return infile.read()
+
+
+# # Streaming a regular file parses the PE headers from the first block, and never maps the file
+def test_stream_does_not_map(tmp_path):
+
+    import hashlib
+    from binGraph.graphs.ent.graph import analyse
+
+    abs_fpath = str(tmp_path / "sample.exe")
+    data = write_pe_sample(abs_fpath)
+
+    bin_ctx = bin_context(abs_fpath, chunks=100, stream=True)
+    streamed = analyse(abs_fpath, "sample.exe", False, chunks=100, stream=True, bin_ctx=bin_ctx)
+    mapped = analyse(abs_fpath, "sample.exe", False, chunks=100)
+
+    assert bin_ctx._bin_context__data is None
+    assert bin_ctx.sha256() == hashlib.sha256(data).hexdigest()
+    assert streamed["format"] == "PE"
+    assert streamed["sections"] == mapped["sections"]
+    assert streamed["section_stats"] == mapped["section_stats"]
+    assert np.allclose(streamed["entropy"], mapped["entropy"])
+
+
+# # Pipes are read once: counted and hashed together, and graphed as a blob
+def test_stream_pipe(tmp_path):
+
+    import hashlib
+    import threading
+    from binGraph.graphs.ent.graph import analyse
+
+    data = write_pe_sample(str(tmp_path / "sample.exe"))
+    abs_fpath = str(tmp_path / "pipe")
+    os.mkfifo(abs_fpath)
+
+    def writer():
+        with open(abs_fpath, "wb") as outfile:
+            outfile.write(data)
+
+    results = {}
+
+    def reader():
+        bin_ctx = bin_context(abs_fpath, chunks=100, stream=True)
+        results["profile"] = analyse(abs_fpath, "pipe", False, chunks=100, stream=True, bin_ctx=bin_ctx)
+        results["sha256"] = bin_ctx.sha256()
+
+    threads = [threading.Thread(target=writer, daemon=True), threading.Thread(target=reader, daemon=True)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    assert "sha256" in results, "Reading the pipe did not finish"
+    assert results["sha256"] == hashlib.sha256(data).hexdigest()
+    assert results["profile"]["size"] == len(data)
+    assert results["profile"]["format"] is None
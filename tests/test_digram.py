@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+"""
+Tests of counting byte pairs, in slices over processes and in place
+"""
+
+from __future__ import absolute_import
+import concurrent.futures
+from collections import Counter
+
+import numpy as np
+
+import binGraph.graphs.digram.graph as digram
+
+
+def sample_file(tmp_path, size=50000):
+
+    data = np.random.RandomState(0).randint(0, 8, size=size).astype(np.uint8)
+    abs_fpath = tmp_path / "sample.bin"
+    abs_fpath.write_bytes(data.tobytes())
+
+    return str(abs_fpath), data
+
+
+def test_digram_counts_matches_counter(tmp_path):
+
+    _, data = sample_file(tmp_path, size=5000)
+    pairs = Counter(zip(data[:-1].tolist(), data[1:].tolist()))
+
+    counts = digram.digram_counts(data)
+    assert int(counts.sum()) == data.size - 1
+    assert all(counts[first, second] == count for (first, second), count in pairs.items())
+
+
+def test_parallel_digram_counts(tmp_path, monkeypatch):
+
+    abs_fpath, data = sample_file(tmp_path)
+    monkeypatch.setattr(digram, "__parallel_slice__", 1000)
+
+    assert np.array_equal(digram.parallel_digram_counts(abs_fpath, data.size, 4), digram.digram_counts(data))
+
+
+# # In a worker process of a batch, no pool of its own is started
+def count_in_worker(abs_fpath, size):
+
+    digram.__parallel_slice__ = 1000
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError("Started a process pool inside a worker")
+
+    concurrent.futures.ProcessPoolExecutor = no_pool
+    return digram.parallel_digram_counts(abs_fpath, size, 4)
+
+
+def test_parallel_digram_counts_in_worker(tmp_path):
+
+    abs_fpath, data = sample_file(tmp_path)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1) as executor:
+        counts = executor.submit(count_in_worker, abs_fpath, data.size).result()
+
+    assert np.array_equal(counts, digram.digram_counts(data))
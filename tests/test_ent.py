@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+"""
+Tests of the ent graph's numeric kernels, against the straightforward per chunk (or per window) calculation
+"""
+
+from __future__ import division
+from __future__ import absolute_import
+from collections import Counter
+
+import numpy as np
+
+from binGraph.context import bin_context
+from binGraph.graphs.ent.graph import sliding_ent, shannon_ent_chunks, compile_ibytes, analyse, json_info
+
+
+# # The entropy (0-1) of a list of bytes, the reference the vectorised kernels are checked against
+def shannon_ent(labels, base=256):
+
+    value, counts = np.unique(labels, return_counts=True)
+    norm_counts = counts / counts.sum()
+    return -(norm_counts * np.log(norm_counts) / np.log(base)).sum()
+
+
+# # Bytes with a mix of low and high entropy regions
+def sample_data(size, seed=0):
+
+    rng = np.random.RandomState(seed)
+    data = rng.randint(0, 256, size=size).astype(np.uint8)
+    data[size // 4 : size // 2] = 0
+    data[size // 2 : size // 2 + size // 8] = rng.randint(0, 4, size=size // 8)
+
+    return data
+
+
+def test_analyse_matches_per_chunk(tmp_path):
+
+    data = sample_data(10007)
+    abs_fpath = tmp_path / "sample.bin"
+    abs_fpath.write_bytes(data.tobytes())
+
+    ibytes = [{"name": "0s", "bytes": [0]}, {"name": "low", "bytes": [1, 2, 3]}]
+
+    for stream in (False, True):
+        profile = analyse(str(abs_fpath), "sample.bin", True, chunks=750, ibytes=ibytes, stream=stream)
+
+        chunksize = profile["chunksize"]
+        starts = range(0, data.size, chunksize)
+        assert len(profile["entropy"]) == len(starts)
+
+        # # Each chunk worked out on its own, as the graph did before chunks were counted in batches
+        for index, start in enumerate(starts):
+            chunk = data[start : start + chunksize].tolist()
+            counter = Counter(chunk)
+
+            assert np.isclose(profile["entropy"][index], shannon_ent(chunk))
+            for column, ib in enumerate(ibytes):
+                occurrence = sum(counter[b] for b in ib["bytes"])
+                assert np.isclose(profile["ibytes"][index, column], occurrence / len(chunk) * 100)
+
+
+def test_shannon_ent_chunks_empty_and_uniform():
+
+    hists = np.zeros((2, 256), dtype=np.int64)
+    hists[0, 7] = 10
+    hists[1] = 4
+
+    assert np.allclose(shannon_ent_chunks(hists, hists.sum(axis=1)), [0.0, 1.0])
+
+
+def test_sliding_ent_matches_per_window():
+
+    data = sample_data(5000)
+    ibytes = [{"name": "0s", "bytes": [0]}, {"name": "low", "bytes": [1, 2, 3]}]
+    matrix = compile_ibytes(ibytes)
+
+    for window, stride in ((256, 64), (1000, 7), (333, 333), (64, 100)):
+        entropy, percentages = sliding_ent(data, window, stride, matrix)
+
+        starts = range(0, data.size - window + 1, stride)
+        assert len(entropy) == len(starts)
+        for index, start in enumerate(starts):
+            chunk = data[start : start + window]
+            assert np.isclose(entropy[index], shannon_ent(chunk))
+            assert np.isclose(percentages[index, 0], np.count_nonzero(chunk == 0) / window * 100)
+            assert np.isclose(percentages[index, 1], np.count_nonzero(np.isin(chunk, [1, 2, 3])) / window * 100)
+
+
+def test_sliding_ent_across_batches(monkeypatch):
+
+    import binGraph.graphs.ent.graph as ent
+
+    # # Small batches, so the counts are carried from one batch to the next
+    monkeypatch.setattr(ent, "__window_batch__", 5)
+
+    data = sample_data(3000, seed=1)
+    entropy, _ = sliding_ent(data, 200, 30)
+
+    expected = [shannon_ent(data[start : start + 200]) for start in range(0, data.size - 200 + 1, 30)]
+    assert np.allclose(entropy, expected)
+
+
+def test_sliding_ent_window_larger_than_file():
+
+    data = sample_data(200)
+    entropy, percentages = sliding_ent(data, 4096, 1024)
+
+    assert len(entropy) == 1
+    assert np.isclose(entropy[0], shannon_ent(data))
+    assert percentages.shape == (1, 0)
+
+
+# # A file smaller than the window gives a single sample
+def test_window_larger_than_file_json_info(tmp_path):
+
+    abs_fpath = tmp_path / "small.bin"
+    abs_fpath.write_bytes(sample_data(200).tobytes())
+
+    profile = analyse(str(abs_fpath), "small.bin", True, window=4096, stride=1024)
+    info = json_info("small.bin", profile)["info"]
+
+    assert len(profile["entropy"]) == 1
+    assert profile["window"] == 200
+    assert np.isclose(info["Mean"], profile["entropy"][0])
+    assert "Standard deviation" not in info
+
+
+# # Zoomed ranges past the end of the file, or within a single pyramid block
+def test_zoom_outside_file(tmp_path):
+
+    abs_fpath = tmp_path / "small.bin"
+    abs_fpath.write_bytes(sample_data(200).tobytes())
+
+    profile = analyse(str(abs_fpath), "small.bin", True, chunks=750, pyramid=8192, zoom=(0x400, 0x2000))
+    info = json_info("small.bin", profile)["info"]
+
+    assert profile["start"] == 0 and profile["end"] == 200
+    assert "Standard deviation" in info
+
+    profile = analyse(str(abs_fpath), "small.bin", True, chunks=750, pyramid=4, zoom=(0x10, 0x20))
+    info = json_info("small.bin", profile)["info"]
+
+    assert len(profile["entropy"]) == 1
+    assert "Mean" in info and "Standard deviation" not in info
+
+
+# # Sections of a small PE, one of them all zeros, and an overlay after the last section
+def test_section_stats(tmp_path):
+
+    import json
+    import pefile
+    from binGraph.bench import write_pe
+
+    abs_fpath = tmp_path / "sample.exe"
+    with open(str(abs_fpath), "wb") as outfile:
+        write_pe(outfile, 16 * 1024, [(".text", "code", 1), (".data", "zeros", 1), (".rsrc", "random", 2)], np.random.RandomState(0))
+        outfile.write(bytes(range(256)) * 4)
+    data = np.frombuffer(abs_fpath.read_bytes(), dtype=np.uint8)
+
+    ibytes = [{"name": "0s", "bytes": [0]}]
+    profile = analyse(str(abs_fpath), "sample.exe", False, chunks=100, ibytes=ibytes)
+    info = json_info("sample.exe", profile)["info"]
+
+    pe = pefile.PE(str(abs_fpath), fast_load=True)
+    expected = [
+        (s.Name.rstrip(b"\x00").decode(), s.PointerToRawData, s.SizeOfRawData, s.Misc_VirtualSize) for s in pe.sections
+    ]
+    end = max(offset + size for _, offset, size, _ in expected)
+    expected.append(("Overlay", end, data.size - end, None))
+
+    assert [stat["name"] for stat in info["Sections"]] == [".text", ".data", ".rsrc", "Overlay"]
+    for stat, (name, offset, size, virtual_size) in zip(info["Sections"], expected):
+        section = data[offset : offset + size]
+
+        assert stat["offset"] == offset
+        assert stat["size"] == size
+        assert stat["virtual_size"] == virtual_size
+        assert np.isclose(stat["entropy"], shannon_ent(section))
+        assert np.isclose(stat["ibytes"]["0s"], np.count_nonzero(section == 0) / size * 100)
+
+    # # The zero filled section has no entropy, and no negative zero in the json
+    zeros = info["Sections"][1]
+    assert zeros["entropy"] == 0.0 and not str(zeros["entropy"]).startswith("-")
+    assert '"entropy": -0.0' not in json.dumps(info)
+    assert np.isclose(info["Mean"], np.mean(profile["entropy"]))
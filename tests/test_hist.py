@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+
+"""
+Tests of the hist graph's bars, against counting the file's bytes with a Counter
+"""
+
+from __future__ import absolute_import
+from collections import Counter
+
+import numpy as np
+
+from binGraph.graphs.hist.graph import generate
+from binGraph.graphs.hist import __colours__
+
+
+def test_bars_match_counter(tmp_path):
+
+    rng = np.random.RandomState(0)
+    data = rng.randint(0, 16, size=5000).astype(np.uint8).tobytes() + bytes(300)
+    abs_fpath = tmp_path / "sample.bin"
+    abs_fpath.write_bytes(data)
+
+    counter = Counter(bytearray(data))
+
+    for no_zero in (False, True):
+        fig, _, _ = generate(str(abs_fpath), "sample.bin", no_zero=no_zero, colours=list(__colours__))
+        ax = fig.axes[0]
+
+        # # Bars start at -1 without 0x00, which has no count
+        expected = [counter[x] for x in range(-int(no_zero), 256)]
+        bars, ordered = ax.containers
+
+        assert [rect.get_height() for rect in bars] == expected
+        assert [rect.get_height() for rect in ordered] == sorted(expected, reverse=True)
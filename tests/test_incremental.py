@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""
+Tests of skipping graphs that are up to date (--incremental)
+"""
+
+from __future__ import absolute_import
+import os
+
+from binGraph import binGraph as bg
+from binGraph import incremental
+
+
+# # Run binGraph over argv, returning the graph types drawn
+def run(argv, monkeypatch):
+
+    drawn = []
+    generate_graph = bg.generate_graph
+
+    def counting_graph(module_name, *args, **kwargs):
+        drawn.append(module_name)
+        return generate_graph(module_name, *args, **kwargs)
+
+    monkeypatch.setattr(bg, "generate_graph", counting_graph)
+    bg.generate_graphs(bg.validate_args(bg.build_parser().parse_args(argv)).__dict__)
+    monkeypatch.setattr(bg, "generate_graph", generate_graph)
+
+    return drawn
+
+
+def setup_sample(tmp_path):
+
+    abs_fpath = tmp_path / "sample.bin"
+    abs_fpath.write_bytes(os.urandom(4000))
+    out = tmp_path / "out"
+    out.mkdir()
+
+    return abs_fpath, out, ["-f", str(abs_fpath), "--out", str(out), "--incremental", "--renderer", "raster", "--blob", "hist"]
+
+
+def test_unchanged_is_skipped(tmp_path, monkeypatch):
+
+    abs_fpath, out, argv = setup_sample(tmp_path)
+
+    assert run(argv, monkeypatch) == ["hist"]
+    assert run(argv, monkeypatch) == []
+
+    # # Touching the file makes it hash the content, which has not changed
+    os.utime(abs_fpath, (1, 1))
+    assert run(argv, monkeypatch) == []
+
+
+def test_changed_input_is_redrawn(tmp_path, monkeypatch):
+
+    abs_fpath, out, argv = setup_sample(tmp_path)
+    run(argv, monkeypatch)
+
+    # # Same size and modification time, different content
+    stat = os.stat(abs_fpath)
+    abs_fpath.write_bytes(bytes(4000))
+    os.utime(abs_fpath, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    assert run(argv, monkeypatch) == ["hist"]
+
+
+def test_changed_option_is_redrawn(tmp_path, monkeypatch):
+
+    abs_fpath, out, argv = setup_sample(tmp_path)
+    run(argv, monkeypatch)
+
+    assert run(["--dpi", "50"] + argv, monkeypatch) == ["hist"]
+    assert run(["--dpi", "50"] + argv, monkeypatch) == []
+
+
+def test_changed_format_version_is_redrawn(tmp_path, monkeypatch):
+
+    abs_fpath, out, argv = setup_sample(tmp_path)
+    run(argv, monkeypatch)
+
+    monkeypatch.setattr(incremental, "__fingerprint_version__", incremental.__fingerprint_version__ + 1)
+    assert run(argv, monkeypatch) == ["hist"]
+    assert run(argv, monkeypatch) == []
+
+
+def test_missing_output_is_redrawn(tmp_path, monkeypatch):
+
+    abs_fpath, out, argv = setup_sample(tmp_path)
+    run(argv, monkeypatch)
+
+    outputs = [name for name in os.listdir(out) if not name.endswith(incremental.__suffix__)]
+    assert len(outputs) == 1
+    assert os.path.exists(incremental.stamp_path(str(out / outputs[0])))
+
+    # # The stamp left behind does not make the graph up to date
+    os.remove(out / outputs[0])
+    assert run(argv, monkeypatch) == ["hist"]
+    assert os.path.exists(out / outputs[0])
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+"""
+Tests of resuming batches from a --manifest
+"""
+
+from __future__ import absolute_import
+import os
+
+from binGraph import binGraph as bg
+from binGraph.manifest import job_manifest
+
+
+def test_resume_keeps_the_retry_count(tmp_path, monkeypatch):
+
+    abs_fpath = tmp_path / "sample.bin"
+    abs_fpath.write_bytes(os.urandom(1000))
+    manifest = str(tmp_path / "manifest.jsonl")
+
+    calls = []
+
+    def failing_graph(module_name, *args, **kwargs):
+        calls.append(module_name)
+        raise RuntimeError("failed")
+
+    monkeypatch.setattr(bg, "generate_graph", failing_graph)
+    monkeypatch.setattr(bg, "__retry_backoff__", 0)
+
+    argv = ["-f", str(abs_fpath), "--out", str(tmp_path), "--manifest", manifest, "--retries", "1", "--resume", "--blob", "hist"]
+
+    # # The first run tries twice
+    bg.generate_graphs(bg.validate_args(bg.build_parser().parse_args(argv)).__dict__)
+    assert len(calls) == 2
+
+    key = bg.job_key(str(abs_fpath), "hist", bg.validate_args(bg.build_parser().parse_args(argv)).__dict__)
+    assert job_manifest(manifest).attempts(key) == 2
+
+    # # Resuming does not give the graph a fresh set of retries
+    bg.generate_graphs(bg.validate_args(bg.build_parser().parse_args(argv)).__dict__)
+    assert len(calls) == 2
+
+    # # Raising --retries lets it carry on from the attempts already made
+    argv[argv.index("--retries") + 1] = "3"
+    bg.generate_graphs(bg.validate_args(bg.build_parser().parse_args(argv)).__dict__)
+    assert len(calls) == 4
+    assert job_manifest(manifest).attempts(key) == 4
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+"""
+Tests of the --renderer raster path, which draws thumbnails without importing matplotlib
+"""
+
+from __future__ import absolute_import
+import os
+import sys
+import subprocess
+
+import pytest
+
+__root__ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# # Draw raster graphs in a fresh interpreter, and list the matplotlib modules it imported
+def raster_imports(tmp_path, graphtype):
+
+    abs_fpath = tmp_path / "sample.bin"
+    abs_fpath.write_bytes(os.urandom(4096))
+
+    script = (
+        "import sys\n"
+        "from binGraph import binGraph as bg\n"
+        "args = bg.validate_args(bg.build_parser().parse_args(sys.argv[1:]))\n"
+        "assert not bg.generate_graphs(args.__dict__)\n"
+        "print(sorted(m for m in sys.modules if m.split('.')[0] in ('matplotlib', 'mpl_toolkits')))\n"
+    )
+    argv = ["-f", str(abs_fpath), "--out", str(tmp_path), "--renderer", "raster", graphtype]
+    output = subprocess.check_output([sys.executable, "-c", script] + argv, cwd=__root__)
+
+    return output.decode().strip().splitlines()[-1]
+
+
+@pytest.mark.parametrize("graphtype", ["ent", "hist", "hilbert", "digram", "all"])
+def test_raster_without_matplotlib(tmp_path, graphtype):
+
+    assert raster_imports(tmp_path, graphtype) == "[]"
+    for name in ["ent", "hist", "hilbert", "digram"] if graphtype == "all" else [graphtype]:
+        assert os.path.exists(str(tmp_path / "{}.png".format(name)))